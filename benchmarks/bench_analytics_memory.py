@@ -0,0 +1,60 @@
+# benchmarks/bench_analytics_memory.py
+"""
+Relatório de memória da base de análise com e sem os tipos de src/analytics_schema.py.
+
+A base é gerada pela padronização real sobre dados sintéticos (benchmarks/synthetic.py)
+e convertida para o formato em que 'get_analytics_data' a recebe do banco: textos
+como strings, inteiros com nulos como float e latitude/longitude (NUMERIC) como Decimal.
+
+Uso:
+    python -m benchmarks.bench_analytics_memory
+    python -m benchmarks.bench_analytics_memory --respondentes 500000
+"""
+import argparse
+import logging
+import time
+from decimal import Decimal
+
+import pandas as pd
+
+from benchmarks.synthetic import make_long_consolidated, make_raw_exports
+
+RESPONDENTES_POR_PESQUISA = 500
+
+
+def as_loaded_from_db(analytics: pd.DataFrame) -> pd.DataFrame:
+    """Reconstrói o DataFrame como 'pd.read_sql_query' o montaria a partir das tuplas do psycopg2."""
+    registros = analytics.astype(object).where(analytics.notna(), None)
+    for coluna in ("latitude", "longitude"):
+        if coluna in registros:
+            registros[coluna] = [Decimal(f"{v:.7f}") if v is not None else None for v in registros[coluna]]
+    return pd.DataFrame.from_records(registros.to_numpy().tolist(), columns=analytics.columns)
+
+
+def run(n_respondents: int = 100_000, seed: int = 0) -> tuple[pd.DataFrame, float]:
+    from src.analytics_schema import apply_analytics_schema, memory_report
+    from src.data_processing import process_and_standardize_data
+
+    surveys, exportacoes = make_raw_exports(n_respondents, max(1, n_respondents // RESPONDENTES_POR_PESQUISA), seed)
+    analytics = process_and_standardize_data(make_long_consolidated(exportacoes), surveys)
+    carregada = as_loaded_from_db(analytics)
+
+    inicio = time.perf_counter()
+    tipada = apply_analytics_schema(carregada)
+    segundos = time.perf_counter() - inicio
+    return memory_report(carregada, tipada), segundos
+
+
+if __name__ == "__main__":
+    import streamlit.logger
+    streamlit.logger.set_log_level(logging.ERROR)
+
+    parser = argparse.ArgumentParser(description="Memória da base de análise antes/depois da tipagem.")
+    parser.add_argument("--respondentes", type=int, default=100_000)
+    parser.add_argument("--semente", type=int, default=0)
+    args = parser.parse_args()
+
+    from src.analytics_schema import format_memory_report
+    relatorio, segundos = run(args.respondentes, args.semente)
+    print(format_memory_report(relatorio))
+    print(f"\nConversão: {segundos:.2f}s para {args.respondentes} respondentes")
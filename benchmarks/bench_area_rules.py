@@ -0,0 +1,103 @@
+# benchmarks/bench_area_rules.py
+"""
+Conferência e benchmark das regras de 'categorizar_area_comum'.
+
+A conferência compara a função com 'data/area_rules_golden.json': pares
+(texto, categoria) gerados com a implementação anterior, de 'in' sequenciais,
+sobre os textos do mapa exato, os termos das regras, os protótipos semânticos e
+combinações sintéticas desses termos. Qualquer divergência indica mudança de
+comportamento, e aí AREA_RULES_REVISION precisa ser incrementado.
+
+O benchmark categoriza as 5 colunas APAC9P85 de uma base sintética célula a célula
+e pelos valores distintos (apply_over_uniques).
+
+Sai com código 1 se houver qualquer divergência (use --so-conferencia para rodar
+apenas a conferência, por exemplo antes de um commit que mexa nas regras).
+
+Uso:
+    python -m benchmarks.bench_area_rules --so-conferencia
+    python -m benchmarks.bench_area_rules
+    python -m benchmarks.bench_area_rules --linhas 500000
+"""
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from src.data_processing import apply_over_uniques, categorizar_area_comum
+
+GOLDEN_PATH = Path(__file__).parent / "data" / "area_rules_golden.json"
+AREA_COLUMNS = [f"APAC9P85_{i}" for i in range(1, 6)]
+
+
+def check_golden() -> list[tuple[str, str, str]]:
+    """Retorna as divergências (texto, esperado, obtido)."""
+    casos = json.loads(GOLDEN_PATH.read_text(encoding="utf-8"))
+    divergencias = []
+    for texto, esperado in casos:
+        obtido = categorizar_area_comum(texto)
+        if obtido != esperado:
+            divergencias.append((texto, esperado, obtido))
+    return divergencias
+
+
+def make_area_answers(n_rows: int, seed: int = 0) -> pd.DataFrame:
+    casos = json.loads(GOLDEN_PATH.read_text(encoding="utf-8"))
+    textos = np.array([texto for texto, _ in casos] + [None], dtype=object)
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({col: textos[rng.integers(0, len(textos), n_rows)] for col in AREA_COLUMNS})
+
+
+def run(n_rows: int = 200_000) -> dict:
+    divergencias = check_golden()
+    df = make_area_answers(n_rows)
+
+    inicio = time.perf_counter()
+    por_celula = {col: df[col].apply(categorizar_area_comum) for col in AREA_COLUMNS}
+    celula_s = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    por_distinto = {col: apply_over_uniques(df[col], categorizar_area_comum) for col in AREA_COLUMNS}
+    distinto_s = time.perf_counter() - inicio
+
+    iguais = all(por_celula[col].equals(por_distinto[col]) for col in AREA_COLUMNS)
+    return {
+        "casos_golden": len(json.loads(GOLDEN_PATH.read_text(encoding="utf-8"))),
+        "divergencias_golden": divergencias[:10],
+        "linhas": n_rows,
+        "por_celula_s": round(celula_s, 2),
+        "por_valor_distinto_s": round(distinto_s, 2),
+        "resultados_iguais": iguais,
+    }
+
+
+def report_divergences(divergencias: list[tuple[str, str, str]]) -> str:
+    linhas = [f"{len(divergencias)} divergência(s) em relação a {GOLDEN_PATH.name}:"]
+    linhas += [f"  {texto!r}: esperado {esperado!r}, obtido {obtido!r}"
+               for texto, esperado, obtido in divergencias]
+    return "\n".join(linhas)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--linhas", type=int, default=200_000)
+    parser.add_argument("--so-conferencia", action="store_true",
+                        help="só compara com o golden, sem o benchmark")
+    args = parser.parse_args()
+
+    # Qualquer divergência do golden (ou entre os dois caminhos) sai com código 1
+    divergencias = check_golden()
+    if args.so_conferencia:
+        falhou = bool(divergencias)
+        print(report_divergences(divergencias) if falhou else "Golden conferido: nenhuma divergência.")
+    else:
+        resultado = run(args.linhas)
+        print(resultado)
+        falhou = bool(divergencias) or not resultado["resultados_iguais"]
+        if divergencias:
+            print(report_divergences(divergencias))
+    sys.exit(1 if falhou else 0)
@@ -0,0 +1,98 @@
+# benchmarks/bench_date_parsing.py
+"""
+Conferência e benchmark de 'parse_dates' (src/date_parsing.py).
+
+A conferência roda casos de borda com o resultado esperado: colunas vazias ou só
+com nulos (exportação sem 'Data', bloco da base histórica com 'Fim' em branco),
+sentinelas de "sem data", datas já convertidas e formatos misturados.
+
+O benchmark converte uma coluna sintética de datas em texto com 'parse_dates' e
+com 'pd.to_datetime(format="mixed")' linha a linha.
+
+Sai com código 1 se algum caso divergir.
+
+Uso:
+    python -m benchmarks.bench_date_parsing --so-conferencia
+    python -m benchmarks.bench_date_parsing --linhas 1000000
+"""
+import argparse
+import datetime
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from src.date_parsing import (DAYFIRST_FORMATS, ETAPA_VAZIO, HISTORICAL_FORMATS,
+                              parse_dates)
+
+NAT = pd.NaT
+CASOS = [
+    # (nome, valores, formatos, esperado, linhas vazias)
+    ("só None", [None, None], DAYFIRST_FORMATS, [NAT, NAT], 2),
+    ("só NaN", [np.nan, np.nan, np.nan], HISTORICAL_FORMATS, [NAT, NAT, NAT], 3),
+    ("vazia", [], DAYFIRST_FORMATS, [], 0),
+    ("sentinelas", ["-", "", None], DAYFIRST_FORMATS, [NAT, NAT, NAT], 3),
+    ("formatos misturados", ["05/03/2024", "13/01/2024 10:22:01", None], DAYFIRST_FORMATS,
+     [pd.Timestamp(2024, 3, 5), pd.Timestamp(2024, 1, 13, 10, 22, 1), NAT], 1),
+    ("já é data", [datetime.date(2023, 7, 1), "02/08/2023"], DAYFIRST_FORMATS,
+     [pd.Timestamp(2023, 7, 1), pd.Timestamp(2023, 8, 2)], 0),
+    ("histórica MM/DD", ["12/31/2022", "01/02/2022"], HISTORICAL_FORMATS,
+     [pd.Timestamp(2022, 12, 31), pd.Timestamp(2022, 2, 1)], 0),
+]
+
+
+def check_cases() -> list[tuple[str, str]]:
+    """Retorna as divergências (caso, descrição)."""
+    divergencias = []
+    for nome, valores, formatos, esperado, vazias in CASOS:
+        try:
+            obtido, relatorio = parse_dates(pd.Series(valores, dtype=object), formatos, dayfirst=True)
+        except Exception as e:
+            divergencias.append((nome, f"{type(e).__name__}: {e}"))
+            continue
+        esperado = pd.Series(esperado, dtype="datetime64[ns]")
+        if str(obtido.dtype) != "datetime64[ns]" or not obtido.reset_index(drop=True).equals(esperado):
+            divergencias.append((nome, f"esperado {esperado.tolist()}, obtido {obtido.tolist()}"))
+        elif relatorio.get(ETAPA_VAZIO) != vazias:
+            divergencias.append((nome, f"'{ETAPA_VAZIO}' esperado {vazias}, obtido {relatorio.get(ETAPA_VAZIO)}"))
+    return divergencias
+
+
+def make_date_texts(n_rows: int, seed: int = 0) -> pd.Series:
+    rng = np.random.default_rng(seed)
+    datas = pd.Timestamp("2024-01-01") + pd.to_timedelta(rng.integers(0, 365 * 24 * 60, n_rows), unit="min")
+    textos = np.where(rng.random(n_rows) < 0.5, datas.strftime("%d/%m/%Y"), datas.strftime("%d/%m/%Y %H:%M:%S"))
+    return pd.Series(textos, dtype=object).where(rng.random(n_rows) > 0.02)
+
+
+def run(n_rows: int = 200_000) -> dict:
+    textos = make_date_texts(n_rows)
+
+    inicio = time.perf_counter()
+    parse_dates(textos, DAYFIRST_FORMATS, dayfirst=True)
+    vetorizado_s = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    pd.to_datetime(textos, format="mixed", dayfirst=True, errors="coerce")
+    inferido_s = time.perf_counter() - inicio
+    return {"linhas": n_rows, "parse_dates_s": round(vetorizado_s, 2),
+            "to_datetime_mixed_s": round(inferido_s, 2)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--linhas", type=int, default=200_000)
+    parser.add_argument("--so-conferencia", action="store_true", help="só roda os casos de borda")
+    args = parser.parse_args()
+
+    divergencias = check_cases()
+    if not args.so_conferencia:
+        print(run(args.linhas))
+    if divergencias:
+        print(f"{len(divergencias)} caso(s) divergente(s):")
+        for nome, descricao in divergencias:
+            print(f"  {nome}: {descricao}")
+    else:
+        print(f"{len(CASOS)} casos conferidos: nenhuma divergência.")
+    sys.exit(1 if divergencias else 0)
@@ -0,0 +1,144 @@
+# benchmarks/bench_fetch.py
+"""
+Benchmark do caminho de busca das exportações contra o servidor local
+(benchmarks/fake_export_server.py), sem depender da plataforma real.
+
+Casos:
+    sequencial / concorrente   fetch_dataframe_from_api em N pesquisas com latência,
+                               uma a uma e com um pool de threads
+    completo / streaming       corpo inteiro em memória (response.text) x leitura
+                               direto do socket (stream=True), com e sem chunked
+    condicional                segunda busca com If-None-Match (304, sem corpo)
+    falhas                     falhas intermitentes (503): quantas buscas voltam None
+
+Uso:
+    python -m benchmarks.bench_fetch
+    python -m benchmarks.bench_fetch --pesquisas 40 --atraso 0.3 --threads 8 --linhas 20000
+"""
+import argparse
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import requests
+
+from benchmarks.fake_export_server import serve_exports
+
+_rodada = 0
+
+
+def _nova_rodada() -> int:
+    # Parâmetro extra na URL: o st.cache_data de fetch_dataframe_from_api é por URL
+    global _rodada
+    _rodada += 1
+    return _rodada
+
+
+def _linha(caso: str, segundos: float, **extras) -> dict:
+    return {"caso": caso, "segundos": round(segundos, 3), **extras}
+
+
+def bench_concurrency(servidor, n_surveys: int, n_rows: int, atraso: float, threads: int) -> list[dict]:
+    from src.data_ingestion import fetch_dataframe_from_api
+
+    resultados = []
+    for caso, workers in (("sequencial", 1), ("concorrente", threads)):
+        rodada = _nova_rodada()
+        urls = [servidor.url_for(sid, linhas=n_rows, atraso=atraso, rodada=rodada)
+                for sid in range(1, n_surveys + 1)]
+        servidor.stats.reset()
+        inicio = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            dfs = list(pool.map(fetch_dataframe_from_api, urls))
+        segundos = time.perf_counter() - inicio
+        resultados.append(_linha(caso, segundos, pesquisas=n_surveys, threads=workers,
+                                 linhas=sum(len(df) for df in dfs if df is not None),
+                                 max_simultaneas=servidor.stats.snapshot()["max_simultaneas"]))
+    return resultados
+
+
+def bench_streaming(servidor, n_rows: int) -> list[dict]:
+    from src.data_ingestion import parse_api_export
+
+    resultados = []
+    for chunked in (False, True):
+        url = servidor.url_for(1, linhas=n_rows, chunked=int(chunked))
+        servidor.catalog.get(1, n_rows, 0)  # Geração fora da medição
+
+        inicio = time.perf_counter()
+        response = requests.get(url)
+        response.raise_for_status()
+        df = parse_api_export(response.text)
+        resultados.append(_linha("completo" + (" (chunked)" if chunked else ""),
+                                 time.perf_counter() - inicio, linhas=len(df)))
+
+        inicio = time.perf_counter()
+        with requests.get(url, stream=True) as response:
+            response.raise_for_status()
+            response.raw.decode_content = True
+            df = pd.read_csv(response.raw, sep="\t", encoding="utf-8")
+        resultados.append(_linha("streaming" + (" (chunked)" if chunked else ""),
+                                 time.perf_counter() - inicio, linhas=len(df)))
+    return resultados
+
+
+def bench_conditional(servidor, n_rows: int) -> list[dict]:
+    url = servidor.url_for(2, linhas=n_rows)
+    servidor.catalog.get(2, n_rows, 0)
+    servidor.catalog.get(2, n_rows, 1)
+    resultados = []
+
+    inicio = time.perf_counter()
+    primeira = requests.get(url)
+    resultados.append(_linha("condicional: primeira busca", time.perf_counter() - inicio,
+                             status=primeira.status_code, bytes=len(primeira.content)))
+
+    inicio = time.perf_counter()
+    segunda = requests.get(url, headers={"If-None-Match": primeira.headers["ETag"]})
+    resultados.append(_linha("condicional: sem mudança", time.perf_counter() - inicio,
+                             status=segunda.status_code, bytes=len(segunda.content)))
+
+    inicio = time.perf_counter()
+    nova = requests.get(servidor.url_for(2, linhas=n_rows, versao=1),
+                        headers={"If-None-Match": primeira.headers["ETag"]})
+    resultados.append(_linha("condicional: nova coleta", time.perf_counter() - inicio,
+                             status=nova.status_code, bytes=len(nova.content)))
+    return resultados
+
+
+def bench_failures(servidor, n_surveys: int, prob_falha: float) -> list[dict]:
+    from src.data_ingestion import fetch_dataframe_from_api
+
+    rodada = _nova_rodada()
+    urls = [servidor.url_for(sid, linhas=100, prob_falha=prob_falha, rodada=rodada)
+            for sid in range(1, n_surveys + 1)]
+    inicio = time.perf_counter()
+    dfs = [fetch_dataframe_from_api(url) for url in urls]
+    return [_linha("falhas", time.perf_counter() - inicio, pesquisas=n_surveys,
+                   prob_falha=prob_falha, sem_dados=sum(df is None for df in dfs))]
+
+
+def run(n_surveys: int = 20, n_rows: int = 5_000, atraso: float = 0.2, threads: int = 8,
+        prob_falha: float = 0.3) -> list[dict]:
+    with serve_exports() as servidor:
+        return (bench_concurrency(servidor, n_surveys, n_rows, atraso, threads)
+                + bench_streaming(servidor, n_rows * 4)
+                + bench_conditional(servidor, n_rows * 4)
+                + bench_failures(servidor, n_surveys, prob_falha))
+
+
+if __name__ == "__main__":
+    import streamlit.logger
+    streamlit.logger.set_log_level(logging.ERROR)
+
+    parser = argparse.ArgumentParser(description="Benchmark da busca de exportações contra o servidor local.")
+    parser.add_argument("--pesquisas", type=int, default=20)
+    parser.add_argument("--linhas", type=int, default=5_000)
+    parser.add_argument("--atraso", type=float, default=0.2, help="latência por requisição, em segundos")
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--prob-falha", type=float, default=0.3)
+    args = parser.parse_args()
+    linhas = run(args.pesquisas, args.linhas, args.atraso, args.threads, args.prob_falha)
+    for linha in linhas:
+        print(linha)
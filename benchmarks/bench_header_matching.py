@@ -0,0 +1,100 @@
+# benchmarks/bench_header_matching.py
+"""
+Benchmark da correspondência aproximada de cabeçalhos (src/header_matching.py)
+sobre os textos alvo reais de 'perguntas_alvo_codigos'.
+
+Monta uma exportação sintética de 400 colunas: variações de redação dos textos
+alvo (sem acento, caixa trocada, instrução de aplicação reescrita, erro de
+digitação) mais perguntas que não pertencem ao dicionário. Mede o tempo de
+montagem do índice, o tempo para mapear as 400 colunas, os acertos e os falsos positivos.
+
+Uso:
+    python -m benchmarks.bench_header_matching
+"""
+import time
+import unicodedata
+
+import numpy as np
+
+from src.data_processing import ALIAS_INDEX, perguntas_alvo_codigos
+from src.header_matching import MIN_TEXT_LENGTH, HeaderMatcher, normalize_header_text
+
+PERGUNTAS_FORA_DO_DICIONARIO = [
+    "Qual a sua marca de carro preferida?",
+    "Com que frequência o(a) Sr(a) viaja a lazer por ano? (RU e Estimulada)",
+    "Quantos animais de estimação vivem na sua casa?",
+    "Qual aplicativo de banco o(a) Sr(a) mais utiliza?",
+    "O(a) Sr(a) pratica algum esporte regularmente? Qual?",
+    "Qual o principal meio de transporte que utiliza para ir ao trabalho?",
+    "Em uma escala de 0 a 10, quanto recomendaria a construtora a um amigo?",
+    "Qual canal de TV o(a) Sr(a) mais assiste?",
+]
+
+
+def _sem_acento(texto: str) -> str:
+    return ''.join(c for c in unicodedata.normalize('NFD', texto)
+                   if unicodedata.category(c) != 'Mn')
+
+
+def _variantes(texto: str, rng: np.random.Generator) -> list[str]:
+    variantes = [
+        _sem_acento(texto).upper(),
+        texto.replace("(RU e Espontânea)", "RU e ESPONTÂNEA")
+             .replace("(RU e Estimulada)", "RU e ESTIMULADA") + " ",
+    ]
+    if len(texto) > 20:
+        pos = int(rng.integers(5, len(texto) - 5))
+        variantes.append(texto[:pos] + texto[pos + 1:])  # erro de digitação
+    return variantes
+
+
+def make_headers(n_colunas: int = 400, seed: int = 0) -> tuple[list[str], dict[str, str | None]]:
+    rng = np.random.default_rng(seed)
+    esperado: dict[str, str | None] = {}
+    for code, textos in perguntas_alvo_codigos.items():
+        for texto in textos:
+            if len(normalize_header_text(texto)) < MIN_TEXT_LENGTH:
+                continue
+            for variante in _variantes(texto, rng):
+                if variante.strip().lower() not in ALIAS_INDEX:
+                    esperado.setdefault(variante, code)
+    for i, pergunta in enumerate(PERGUNTAS_FORA_DO_DICIONARIO * 15):
+        esperado[f"{pergunta} [{i}]"] = None
+
+    headers = list(esperado)
+    rng.shuffle(headers)
+    headers = headers[:n_colunas]
+    return headers, {h: esperado[h] for h in headers}
+
+
+def run(n_colunas: int = 400, repeats: int = 5) -> dict:
+    headers, esperado = make_headers(n_colunas)
+
+    inicio = time.perf_counter()
+    matcher = HeaderMatcher(ALIAS_INDEX)
+    montagem_ms = 1000 * (time.perf_counter() - inicio)
+
+    tempos = []
+    for _ in range(repeats):
+        inicio = time.perf_counter()
+        resultado = matcher.match(headers)
+        tempos.append(time.perf_counter() - inicio)
+
+    alvo = [h for h, code in esperado.items() if code is not None]
+    fora = [h for h, code in esperado.items() if code is None]
+    corretos = sum(resultado[h][0] == esperado[h] for h in alvo)
+    errados = sum(resultado[h][0] not in (None, esperado[h]) for h in alvo)
+    falsos_positivos = sum(resultado[h][0] is not None for h in fora)
+    return {
+        'colunas': len(headers),
+        'textos_indexados': len(matcher.alias_texts),
+        'montagem_indice_ms': round(montagem_ms, 1),
+        'mapeamento_mediana_ms': round(1000 * float(np.median(tempos)), 1),
+        'variantes_mapeadas_corretamente': f"{corretos}/{len(alvo)}",
+        'variantes_mapeadas_errado': errados,
+        'falsos_positivos': f"{falsos_positivos}/{len(fora)}",
+    }
+
+
+if __name__ == "__main__":
+    print(run())
@@ -0,0 +1,63 @@
+# benchmarks/bench_quota_solver.py
+"""
+Benchmark do solver de cotas (raking/IPF) de src/sampling.py para grades
+com 1 a 5 dimensões (região, renda macro, localidade, gênero, faixa etária).
+
+Uso:
+    python -m benchmarks.bench_quota_solver
+"""
+import time
+
+import numpy as np
+
+from src.sampling import feasible_total, solve_quotas
+
+DIMENSOES = {
+    'regiao': {'Sudeste': 30, 'Nordeste': 30, 'Sul': 25, 'Centro-Oeste': 10, 'Norte': 5},
+    'renda_macro_faixa': {'1': 0, '2': 30, '3': 30, '4': 20, '5': 20},
+    'localidade': {'Capital': 60, 'Interior': 40},
+    'genero': {'Feminino': 50, 'Masculino': 50},
+    'faixa_etaria': {str(i): p for i, p in enumerate([10, 20, 20, 20, 15, 10, 5])},
+}
+
+
+def run(sample_size: int = 1200, base_size: int = 200_000, repeats: int = 20,
+        seed: int = 0) -> list[dict]:
+    rng = np.random.default_rng(seed)
+    resultados = []
+    nomes = list(DIMENSOES)
+    for n_dims in range(1, len(nomes) + 1):
+        dims = {nome: DIMENSOES[nome] for nome in nomes[:n_dims]}
+        shape = tuple(len(w) for w in dims.values())
+        available = rng.multinomial(base_size, np.full(int(np.prod(shape)),
+                                                       1 / np.prod(shape))).reshape(shape)
+        if n_dims > 1:
+            # ~10% de células vazias, como em bases reais
+            available[rng.random(shape) < 0.10] = 0
+
+        n_alvo = feasible_total(available, dims, sample_size)
+        tempos = []
+        for _ in range(repeats):
+            inicio = time.perf_counter()
+            quotas = solve_quotas(available, dims, n_alvo)
+            tempos.append(time.perf_counter() - inicio)
+
+        erro_marginal = max(
+            float(np.abs(quotas.sum(axis=tuple(i for i in range(n_dims) if i != eixo))
+                         - np.asarray(list(w.values())) / 100 * n_alvo).max())
+            for eixo, w in enumerate(dims.values()))
+        resultados.append({
+            'dimensoes': n_dims,
+            'celulas': int(np.prod(shape)),
+            'n_alvo': n_alvo,
+            'n_alocado': int(quotas.sum()),
+            'erro_marginal_max': round(erro_marginal, 2),
+            'mediana_ms': round(1000 * float(np.median(tempos)), 3),
+            'max_ms': round(1000 * float(np.max(tempos)), 3),
+        })
+    return resultados
+
+
+if __name__ == "__main__":
+    for linha in run():
+        print(linha)
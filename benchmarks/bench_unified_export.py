@@ -0,0 +1,101 @@
+# benchmarks/bench_unified_export.py
+"""
+Benchmark da exportação da base unificada (src/export.py) numa base sintética
+de 50 mil entrevistas x 300 colunas, no formato produzido por build_unified_dataframe.
+
+Uso:
+    python -m benchmarks.bench_unified_export
+    python -m benchmarks.bench_unified_export --baseline   # inclui pd.ExcelWriter/openpyxl (lento)
+    python -m benchmarks.bench_unified_export --memoria    # mede também o pico de memória
+"""
+import argparse
+import io
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from src.export import available_export_formats, export_unified_base
+from src.unified_base import build_exportable_df_with_question_row, build_question_row
+
+RESPOSTAS = [
+    "Sim", "Não", "Talvez", "Piscina", "Academia", "Churrasqueira", "Salão de festas",
+    "Até R$ 2.000", "De R$ 2.001 a R$ 5.000", "Acima de R$ 10.000", "Capital", "Interior",
+    "Feminino", "Masculino", "1", "2", "3", "4", "5", "Não sei",
+]
+
+
+def make_unified_base(n_rows: int = 50_000, n_cols: int = 300, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        "respondent_id": [f"R{i:07d}" for i in range(n_rows)],
+        "survey_id": rng.integers(1, 400, n_rows),
+        "research_name": rng.choice([f"Pesquisa {i}" for i in range(400)], n_rows),
+        "data_pesquisa": pd.Timestamp("2021-01-01")
+        + pd.to_timedelta(rng.integers(0, 1800, n_rows), unit="D"),
+    })
+    respostas = np.array(RESPOSTAS + [None], dtype=object)
+    perguntas = {}
+    for i in range(n_cols - df.shape[1]):
+        codes = rng.integers(0, len(respostas), n_rows)
+        perguntas[f"Q{i + 1}"] = respostas[codes]
+    return pd.concat([df, pd.DataFrame(perguntas)], axis=1)
+
+
+def _measure(func, memoria: bool) -> tuple[float, float | None, int]:
+    inicio = time.perf_counter()
+    resultado = func()
+    segundos = time.perf_counter() - inicio
+    pico_mb = None
+    if memoria:
+        # Passada separada: o tracemalloc distorce bastante o tempo medido
+        tracemalloc.start()
+        func()
+        _, pico = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        pico_mb = round(pico / 1024 ** 2, 1)
+    return segundos, pico_mb, len(resultado)
+
+
+def _openpyxl_baseline(df: pd.DataFrame) -> bytes:
+    output = io.BytesIO()
+    with pd.ExcelWriter(output, engine="openpyxl") as writer:
+        build_exportable_df_with_question_row(df).to_excel(
+            writer, index=False, sheet_name="Base_Unificada"
+        )
+    return output.getvalue()
+
+
+def run(n_rows: int = 50_000, n_cols: int = 300, baseline: bool = False,
+        memoria: bool = False) -> list[dict]:
+    df = make_unified_base(n_rows, n_cols)
+    labels = build_question_row(df.columns)
+    casos = {fmt: (lambda fmt=fmt: export_unified_base(df, fmt, labels))
+             for fmt in available_export_formats()}
+    if baseline:
+        casos["xlsx (openpyxl)"] = lambda: _openpyxl_baseline(df)
+
+    resultados = []
+    for nome, func in casos.items():
+        segundos, pico_mb, tamanho = _measure(func, memoria)
+        resultados.append({
+            "formato": nome,
+            "linhas": n_rows,
+            "colunas": n_cols,
+            "segundos": round(segundos, 2),
+            "pico_memoria_mb": pico_mb,
+            "arquivo_mb": round(tamanho / 1024 ** 2, 1),
+        })
+    return resultados
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--linhas", type=int, default=50_000)
+    parser.add_argument("--colunas", type=int, default=300)
+    parser.add_argument("--baseline", action="store_true")
+    parser.add_argument("--memoria", action="store_true")
+    args = parser.parse_args()
+    for linha in run(args.linhas, args.colunas, args.baseline, args.memoria):
+        print(linha)
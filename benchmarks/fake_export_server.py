@@ -0,0 +1,226 @@
+# benchmarks/fake_export_server.py
+"""
+Servidor HTTP local que imita os links de exportação das pesquisas ('surveys.api_link'),
+para exercitar o caminho de busca (fetch_dataframe_from_api, atualização em lote)
+sem a plataforma real.
+
+Cada URL '/export/<survey_id>' devolve a exportação TSV sintética da pesquisa
+(benchmarks/synthetic.py), gerada uma vez por combinação de parâmetros e mantida
+em memória. O comportamento é controlado pela query string:
+
+    linhas=N        respondentes na exportação (padrão 500)
+    versao=N        outra 'coleta' da mesma pesquisa (muda o conteúdo e o ETag)
+    atraso=S        segundos de espera antes de responder (latência)
+    taxa=B          limita o envio do corpo a B bytes/s (resposta lenta)
+    chunked=1       corpo em Transfer-Encoding: chunked, sem Content-Length
+    falha=CODIGO    responde sempre com esse status HTTP (ex.: 500, 503)
+    prob_falha=P    responde 503 com probabilidade P (falha intermitente)
+    vazio=1         corpo vazio (exportação sem dados)
+
+Todas as respostas 200 trazem ETag; 'If-None-Match' com o mesmo valor recebe 304.
+Qualquer outro parâmetro é ignorado, o que permite URLs distintas para o mesmo
+conteúdo (ex.: fugir do st.cache_data de 'fetch_dataframe_from_api').
+
+Uso nos benchmarks:
+    with serve_exports() as servidor:
+        url = servidor.url_for(3, linhas=1000, atraso=0.2)
+
+Uso avulso:
+    python -m benchmarks.fake_export_server --porta 8765
+"""
+import argparse
+import contextlib
+import hashlib
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlparse
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic import make_raw_export, to_api_tsv
+
+LINHAS_PADRAO = 500
+TAMANHO_BLOCO = 64 * 1024
+_ROTA_EXPORTACAO = re.compile(r"^/export/(\d+)$")
+
+
+class ExportCatalog:
+    """Corpos TSV gerados sob demanda, com ETag, compartilhados entre as threads do servidor."""
+
+    def __init__(self, seed: int = 0):
+        self.seed = seed
+        self._corpos: dict[tuple, tuple[bytes, str]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, survey_id: int, n_rows: int, version: int) -> tuple[bytes, str]:
+        chave = (survey_id, n_rows, version)
+        with self._lock:
+            if chave not in self._corpos:
+                rng = np.random.default_rng([self.seed, survey_id, version])
+                raw_df = make_raw_export(survey_id, n_rows, pd.Timestamp("2024-01-01"), rng)
+                corpo = to_api_tsv(raw_df).encode("utf-8")
+                etag = '"' + hashlib.sha1(corpo).hexdigest() + '"'
+                self._corpos[chave] = (corpo, etag)
+            return self._corpos[chave]
+
+
+class ServerStats:
+    """Contadores das respostas enviadas (por status) e dos bytes de corpo transferidos."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.requests = 0
+            self.by_status: dict[int, int] = {}
+            self.body_bytes = 0
+            self.max_in_flight = 0
+            self._in_flight = 0
+
+    def started(self):
+        with self._lock:
+            self.requests += 1
+            self._in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self._in_flight)
+
+    def finished(self, status: int, body_bytes: int):
+        with self._lock:
+            self._in_flight -= 1
+            self.by_status[status] = self.by_status.get(status, 0) + 1
+            self.body_bytes += body_bytes
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {"requisicoes": self.requests, "por_status": dict(self.by_status),
+                    "bytes_corpo": self.body_bytes, "max_simultaneas": self.max_in_flight}
+
+
+class ExportRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Necessário para chunked e keep-alive
+    server: "ExportServer"
+
+    def log_message(self, format, *args):
+        pass  # Sem log por requisição: atrapalharia a medição
+
+    def do_GET(self):
+        self.server.stats.started()
+        status, enviados = 500, 0
+        try:
+            status, enviados = self._handle()
+        finally:
+            self.server.stats.finished(status, enviados)
+
+    def _handle(self) -> tuple[int, int]:
+        url = urlparse(self.path)
+        rota = _ROTA_EXPORTACAO.match(url.path)
+        if not rota:
+            return self._send_status(404)
+        opcoes = {k: v[-1] for k, v in parse_qs(url.query).items()}
+
+        atraso = float(opcoes.get("atraso", 0))
+        if atraso > 0:
+            time.sleep(atraso)
+        if "falha" in opcoes:
+            return self._send_status(int(opcoes["falha"]))
+        if random.random() < float(opcoes.get("prob_falha", 0)):
+            return self._send_status(503)
+
+        if opcoes.get("vazio") == "1":
+            corpo, etag = b"", '"vazio"'
+        else:
+            corpo, etag = self.server.catalog.get(int(rota.group(1)),
+                                                  int(opcoes.get("linhas", LINHAS_PADRAO)),
+                                                  int(opcoes.get("versao", 0)))
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return 304, 0
+
+        chunked = opcoes.get("chunked") == "1"
+        self.send_response(200)
+        self.send_header("Content-Type", "text/tab-separated-values; charset=utf-8")
+        self.send_header("ETag", etag)
+        if chunked:
+            self.send_header("Transfer-Encoding", "chunked")
+        else:
+            self.send_header("Content-Length", str(len(corpo)))
+        self.end_headers()
+
+        taxa = float(opcoes.get("taxa", 0))
+        for inicio in range(0, len(corpo), TAMANHO_BLOCO):
+            bloco = corpo[inicio:inicio + TAMANHO_BLOCO]
+            if chunked:
+                self.wfile.write(f"{len(bloco):X}\r\n".encode() + bloco + b"\r\n")
+            else:
+                self.wfile.write(bloco)
+            if taxa > 0:
+                time.sleep(len(bloco) / taxa)
+        if chunked:
+            self.wfile.write(b"0\r\n\r\n")
+        return 200, len(corpo)
+
+    def _send_status(self, status: int) -> tuple[int, int]:
+        corpo = f"status {status}".encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "text/plain")
+        self.send_header("Content-Length", str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+        return status, len(corpo)
+
+
+class ExportServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: tuple[str, int], seed: int = 0):
+        super().__init__(address, ExportRequestHandler)
+        self.catalog = ExportCatalog(seed)
+        self.stats = ServerStats()
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def url_for(self, survey_id: int, **opcoes) -> str:
+        """URL de exportação da pesquisa; 'opcoes' vira a query string (ver docstring do módulo)."""
+        query = urlencode({k: v for k, v in opcoes.items() if v is not None})
+        return f"{self.base_url}/export/{survey_id}" + (f"?{query}" if query else "")
+
+
+@contextlib.contextmanager
+def serve_exports(host: str = "127.0.0.1", port: int = 0, seed: int = 0):
+    """Sobe o servidor numa thread (porta livre por padrão) e o encerra ao sair."""
+    servidor = ExportServer((host, port), seed)
+    thread = threading.Thread(target=servidor.serve_forever, name="fake-export-server", daemon=True)
+    thread.start()
+    try:
+        yield servidor
+    finally:
+        servidor.shutdown()
+        servidor.server_close()
+        thread.join()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Servidor local de exportações sintéticas.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--porta", type=int, default=8765)
+    parser.add_argument("--semente", type=int, default=0)
+    args = parser.parse_args()
+    servidor = ExportServer((args.host, args.porta), args.semente)
+    print(f"Servindo exportações em {servidor.url_for(1, linhas=1000)} (Ctrl+C para sair)")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
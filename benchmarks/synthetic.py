@@ -0,0 +1,238 @@
+# benchmarks/synthetic.py
+"""
+Gerador de dados sintéticos de pesquisas para os benchmarks.
+
+Produz, de forma reprodutível (semente fixa):
+- a tabela 'surveys' (metadados das pesquisas);
+- as exportações brutas da API de cada pesquisa, com os cabeçalhos sorteados entre
+  os textos alvo de 'perguntas_alvo_codigos' (cada pesquisa usa a sua redação),
+  colunas fora do dicionário e respostas com a cara das reais: faixas de renda em
+  texto (FE2P10), cidades de capital e interior (com e sem ' - UF'), UFs, intenção
+  e prazo de compra, áreas comuns (APAC9P85_*), datas DD/MM/AAAA e coordenadas;
+- o corpo TSV que a API devolveria;
+- a tabela longa equivalente à 'consolidated_data'.
+
+Uso (amostra rápida):
+    python -m benchmarks.synthetic --respondentes 1000 --pesquisas 5
+"""
+import argparse
+import io
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from src.data_processing import (MAPA_ESTADO_REGIAO, MAPA_INTENCAO_COMPRA, MAPA_TEMPO_INTENCAO,
+                                 map_api_dataframe_columns, perguntas_alvo_codigos)
+
+AREA_GOLDEN_PATH = Path(__file__).parent / "data" / "area_rules_golden.json"
+
+# Colunas que toda exportação tem (as usadas na padronização); as demais são sorteadas
+CODIGOS_SEMPRE_PRESENTES = [
+    "Código", "Data", "FE2P3", "FE2P5", "FE2P7", "FE2P10", "Estado", "IC4P30", "IC4P32",
+    "APAC9P85_1", "APAC9P85_2", "APAC9P85_3", "APAC9P85_4", "APAC9P85_5", "Latitude", "Longitude",
+]
+PROPORCAO_CODIGOS_OPCIONAIS = 0.5
+COLUNAS_FORA_DO_DICIONARIO = 5
+PROPORCAO_AUSENTES = 0.05
+
+GENEROS = ["Feminino", "Masculino", "Feminino", "Masculino", "Outro"]
+
+CIDADES_CAPITAIS = [
+    "São Paulo", "Rio de Janeiro", "Belo Horizonte", "Salvador", "Fortaleza", "Curitiba",
+    "Recife", "Porto Alegre", "Goiânia", "Belém", "Manaus", "Brasília", "Florianópolis",
+    "Vitória", "Natal", "João Pessoa", "Maceió", "Teresina", "São Luís", "Cuiabá",
+]
+CIDADES_INTERIOR = [
+    "Campinas", "Ribeirão Preto", "Sorocaba", "Santos", "São José dos Campos", "Londrina",
+    "Maringá", "Joinville", "Blumenau", "Uberlândia", "Juiz de Fora", "Feira de Santana",
+    "Caxias do Sul", "Niterói", "Petrolina", "Campina Grande", "Anápolis", "Caruaru",
+    "Foz do Iguaçu", "Piracicaba",
+]
+
+FAIXAS_RENDA = [
+    "1. Até R$ 1.500,00",
+    "2. De R$ 1.501,00 a R$ 2.500,00",
+    "3. De R$ 2.501,00 a R$ 4.500,00",
+    "4. De R$ 4.501,00 a R$ 5.500,00",
+    "5. De R$ 5.501,00 a R$ 8.000,00",
+    "6. De R$ 8.001,00 a R$ 11.000,00",
+    "7. De R$ 11.001,00 a R$ 13.000,00",
+    "8. De R$ 13.001,00 a R$ 16.000,00",
+    "9. De R$ 16.001,00 a R$ 18.500,00",
+    "10. De R$ 18.501,00 a R$ 21.000,00",
+    "11. De R$ 21.001,00 a R$ 24.500,00",
+    "12. De R$ 24.501,00 a R$ 28.000,00",
+    "13. Acima de R$ 28.000,00",
+    "De R$ 3 mil a R$ 5 mil",
+    "Entre 2.000 e 3.000",
+    "R$ 10 mil",
+    "Não sei / Prefiro não responder",
+]
+# Faixas mais baixas são mais frequentes, como nas bases reais
+PESOS_RENDA = np.array([8, 12, 14, 10, 12, 9, 6, 5, 4, 3, 3, 2, 3, 3, 2, 2, 2], dtype=float)
+
+# Peso aproximado de cada UF na amostra (as demais pesam 1)
+PESOS_UF = {"SP": 22, "MG": 10, "RJ": 8, "BA": 7, "PR": 6, "RS": 6, "PE": 5, "CE": 5,
+            "PA": 4, "SC": 4, "GO": 3, "DF": 3}
+
+RESPOSTAS_GENERICAS = [
+    "Sim", "Não", "Talvez", "Não sei", "1", "2", "3", "4", "5",
+    "Apartamento", "Casa", "Casa em condomínio", "Próprio", "Alugado", "Financiado",
+]
+
+
+def _with_missing(values: np.ndarray, rng: np.random.Generator,
+                  share: float = PROPORCAO_AUSENTES) -> np.ndarray:
+    values = values.astype(object)
+    values[rng.random(len(values)) < share] = None
+    return values
+
+
+def _area_answers() -> np.ndarray:
+    casos = json.loads(AREA_GOLDEN_PATH.read_text(encoding="utf-8"))
+    return np.array([texto for texto, _ in casos], dtype=object)
+
+
+def make_surveys(n_surveys: int, seed: int = 0) -> pd.DataFrame:
+    """Metadados das pesquisas, no formato de 'get_all_surveys'."""
+    rng = np.random.default_rng(seed)
+    creation = pd.Timestamp("2021-01-04") + pd.to_timedelta(
+        np.sort(rng.integers(0, 1700, n_surveys)), unit="D")
+    return pd.DataFrame({
+        "survey_id": np.arange(1, n_surveys + 1),
+        "research_name": [f"Pesquisa Sintética {i:03d}" for i in range(1, n_surveys + 1)],
+        "creation_date": creation.date,
+        "api_link": [f"https://bench.invalid/export/{i}" for i in range(1, n_surveys + 1)],
+        "expected_total": rng.integers(200, 2000, n_surveys),
+        "collected_count": 0,
+        "collected_percentage": 0.0,
+        "last_fetched": pd.NaT,
+    })
+
+
+def split_respondents(n_respondents: int, n_surveys: int, rng: np.random.Generator) -> np.ndarray:
+    """Respondentes por pesquisa: tamanhos desiguais, pelo menos 1 em cada."""
+    pesos = rng.dirichlet(np.full(n_surveys, 2.0))
+    tamanhos = np.maximum(rng.multinomial(n_respondents - n_surveys, pesos), 0) + 1
+    return tamanhos
+
+
+def _survey_headers(rng: np.random.Generator) -> dict:
+    """Código -> cabeçalho usado por uma pesquisa (um texto alvo sorteado por código)."""
+    opcionais = [c for c in perguntas_alvo_codigos if c not in CODIGOS_SEMPRE_PRESENTES]
+    escolhidos = [c for c in opcionais if rng.random() < PROPORCAO_CODIGOS_OPCIONAIS]
+    cabecalhos = {}
+    for codigo in CODIGOS_SEMPRE_PRESENTES + escolhidos:
+        aliases = perguntas_alvo_codigos[codigo]
+        cabecalhos[codigo] = aliases[rng.integers(0, len(aliases))] if aliases else codigo
+    return cabecalhos
+
+
+def make_raw_export(survey_id: int, n_rows: int, creation_date, rng: np.random.Generator,
+                    area_answers: np.ndarray | None = None) -> pd.DataFrame:
+    """Exportação bruta de uma pesquisa, como 'fetch_dataframe_from_api' a devolveria."""
+    area_answers = area_answers if area_answers is not None else _area_answers()
+    cabecalhos = _survey_headers(rng)
+
+    inicio = pd.Timestamp(creation_date)
+    datas = inicio + pd.to_timedelta(rng.integers(0, 60 * 24 * 3600, n_rows), unit="s")
+    com_hora = rng.random() < 0.5
+    datas_texto = datas.strftime("%d/%m/%Y %H:%M:%S" if com_hora else "%d/%m/%Y")
+
+    capital = rng.random(n_rows) < 0.45
+    cidades = np.where(capital,
+                       np.array(CIDADES_CAPITAIS, dtype=object)[rng.integers(0, len(CIDADES_CAPITAIS), n_rows)],
+                       np.array(CIDADES_INTERIOR, dtype=object)[rng.integers(0, len(CIDADES_INTERIOR), n_rows)])
+    ufs = np.array(sorted(MAPA_ESTADO_REGIAO), dtype=object)
+    pesos_uf = np.array([PESOS_UF.get(uf, 1) for uf in ufs], dtype=float)
+    estados = ufs[rng.choice(len(ufs), n_rows, p=pesos_uf / pesos_uf.sum())]
+    # Parte das cidades vem com ' - UF', como em algumas exportações
+    com_uf = rng.random(n_rows) < 0.3
+    cidades = np.where(com_uf, cidades + " - " + estados, cidades)
+
+    valores = {
+        "Código": np.array([f"S{survey_id}-{i:07d}" for i in range(n_rows)], dtype=object),
+        "Data": datas_texto.to_numpy(dtype=object),
+        "FE2P3": np.array(GENEROS, dtype=object)[rng.integers(0, len(GENEROS), n_rows)],
+        "FE2P5": rng.integers(18, 81, n_rows).astype(str).astype(object),
+        "FE2P7": cidades,
+        "FE2P10": np.array(FAIXAS_RENDA, dtype=object)[
+            rng.choice(len(FAIXAS_RENDA), n_rows, p=PESOS_RENDA / PESOS_RENDA.sum())],
+        "Estado": estados,
+        "IC4P30": np.array(list(MAPA_INTENCAO_COMPRA), dtype=object)[
+            rng.integers(0, len(MAPA_INTENCAO_COMPRA), n_rows)],
+        "IC4P32": np.array(list(MAPA_TEMPO_INTENCAO), dtype=object)[
+            rng.integers(0, len(MAPA_TEMPO_INTENCAO), n_rows)],
+        "Latitude": np.round(rng.uniform(-33.0, 2.0, n_rows), 6).astype(str).astype(object),
+        "Longitude": np.round(rng.uniform(-70.0, -35.0, n_rows), 6).astype(str).astype(object),
+    }
+    for i in range(1, 6):
+        valores[f"APAC9P85_{i}"] = area_answers[rng.integers(0, len(area_answers), n_rows)]
+
+    genericas = np.array(RESPOSTAS_GENERICAS, dtype=object)
+    colunas = {}
+    for codigo, cabecalho in cabecalhos.items():
+        serie = valores.get(codigo)
+        if serie is None:
+            serie = genericas[rng.integers(0, len(genericas), n_rows)]
+        colunas[cabecalho] = serie if codigo == "Código" else _with_missing(serie, rng)
+    for i in range(COLUNAS_FORA_DO_DICIONARIO):
+        colunas[f"Pergunta exclusiva {survey_id}.{i + 1}"] = _with_missing(
+            genericas[rng.integers(0, len(genericas), n_rows)], rng)
+    return pd.DataFrame(colunas)
+
+
+def make_raw_exports(n_respondents: int, n_surveys: int, seed: int = 0,
+                     surveys: pd.DataFrame | None = None) -> tuple[pd.DataFrame, dict]:
+    """
+    Returns:
+        (surveys, exportacoes): metadados e {survey_id: DataFrame bruto da API}.
+    """
+    surveys = surveys if surveys is not None else make_surveys(n_surveys, seed)
+    rng = np.random.default_rng(seed + 1)
+    area_answers = _area_answers()
+    tamanhos = split_respondents(n_respondents, len(surveys), rng)
+    exportacoes = {
+        int(row.survey_id): make_raw_export(int(row.survey_id), int(n), row.creation_date, rng, area_answers)
+        for row, n in zip(surveys.itertuples(), tamanhos)
+    }
+    return surveys, exportacoes
+
+
+def to_api_tsv(raw_df: pd.DataFrame) -> str:
+    """Corpo TSV que a API devolveria para a exportação."""
+    buffer = io.StringIO()
+    raw_df.to_csv(buffer, sep="\t", index=False)
+    return buffer.getvalue()
+
+
+def make_long_consolidated(exportacoes: dict) -> pd.DataFrame:
+    """Tabela longa equivalente à 'consolidated_data' (só códigos do dicionário, texto)."""
+    partes = []
+    for survey_id, raw_df in exportacoes.items():
+        mapped_df, _ = map_api_dataframe_columns(raw_df)
+        codigos = [c for c in mapped_df.columns if c in perguntas_alvo_codigos]
+        longo = mapped_df[codigos].melt(id_vars="Código", var_name="question_code",
+                                        value_name="answer_value")
+        longo = longo.rename(columns={"Código": "respondent_id"})
+        longo.insert(1, "survey_id", survey_id)
+        partes.append(longo)
+    long_df = pd.concat(partes, ignore_index=True)
+    texto = long_df["answer_value"].astype(object)
+    long_df["answer_value"] = texto.where(texto.isna(), texto.astype(str))
+    return long_df
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Amostra do gerador sintético.")
+    parser.add_argument("--respondentes", type=int, default=1000)
+    parser.add_argument("--pesquisas", type=int, default=5)
+    parser.add_argument("--semente", type=int, default=0)
+    args = parser.parse_args()
+    surveys, exportacoes = make_raw_exports(args.respondentes, args.pesquisas, args.semente)
+    print(surveys[["survey_id", "research_name", "creation_date"]])
+    primeira = next(iter(exportacoes.values()))
+    print(f"{len(exportacoes)} exportações; primeira: {primeira.shape[0]} linhas x {primeira.shape[1]} colunas")
+    print(primeira.head(3).T.head(20))
@@ -5,13 +5,18 @@ import datetime
 import pandas as pd
 from src.database import (add_survey_metadata, get_all_surveys,
                           get_survey_summary_stats, update_survey_metadata,
-                          delete_survey, store_respondent_data,
-                          get_respondent_count, consolidate_survey_data,
-                          update_survey_stats, get_updatable_surveys,
-                          get_consolidated_data_for_surveys,
-                          save_analytics_data, check_api_link_exists)
-from src.data_ingestion import fetch_data_from_api
-from src.data_processing import map_api_columns_to_target_codes, process_and_standardize_data
+                          delete_survey, get_updatable_surveys,
+                          check_api_link_exists)
+from src.instrumentation import pipeline_run
+from src.pipeline import (STATUS_ATUALIZADA, STATUS_FALHA, STATUS_SEM_NOVOS,
+                          refresh_survey)
+
+# Status de 'refresh_survey' -> texto do resumo da atualização
+STATUS_LABELS = {
+    STATUS_ATUALIZADA: "✅ Atualizada",
+    STATUS_SEM_NOVOS: "ℹ️ Sem Novos Dados",
+    STATUS_FALHA: "❌ Falha",
+}
 
 # --- Configuração da Página ---
 st.set_page_config(layout="wide", page_title="Gerenciar Pesquisas")
@@ -215,94 +220,46 @@ if st.button(
             progress_bar.progress((i + 1) / total_surveys_to_process,
                                   text=f"Processando: {research_name}...")
 
-            survey_summary_data = {
-                "Pesquisa": research_name,
-                "Status": "Verificando...",
-                "Novas Coletas": 0
-            }
-
-            with st.status(f"Verificando API para: '{research_name}'...",
-                           expanded=False) as status:
-                try:
-                    pre_update_count = get_respondent_count(survey_id)
-                    raw_data_list = fetch_data_from_api(api_link)
+            # Tempos por etapa/SQL desta pesquisa, visíveis na página de administração
+            with pipeline_run(f"atualizacao:{survey_id}", persist=True):
+                with st.status(f"Verificando API para: '{research_name}'...",
+                               expanded=False) as status:
 
-                    if raw_data_list is None:
-                        raise Exception("Falha ao buscar dados da API.")
-
-                    if len(raw_data_list) > pre_update_count:
-                        num_novos = len(raw_data_list) - pre_update_count
+                    def mostrar_etapa(texto):
                         status.update(
-                            label=
-                            f"Processando {num_novos} novos registros para '{research_name}'...",
+                            label=f"Processando novos registros para '{research_name}'...",
                             state="running",
                             expanded=True)
+                        status.write(texto)
 
-                        # --- PIPELINE INTEGRADA ---
-                        status.write(
-                            "1. Mapeando e salvando novos dados brutos...")
-                        mapped_data, _ = map_api_columns_to_target_codes(
-                            raw_data_list)
-                        store_success, num_added, warn_msg = store_respondent_data(
-                            survey_id, mapped_data)
-                        if not store_success:
-                            raise Exception(
-                                f"Falha ao salvar dados brutos: {warn_msg}")
-
-                        survey_summary_data["Novas Coletas"] = num_added
-                        new_respondents_added_total += num_added
-
-                        status.write(
-                            "2. Consolidando dados para formato de análise...")
-                        consol_success, consol_msg = consolidate_survey_data(
-                            survey_id)
-                        if not consol_success:
-                            raise Exception(
-                                f"Falha na consolidação: {consol_msg}")
-
-                        status.write(
-                            "3. Padronizando, validando e carregando para tabela final..."
-                        )
-                        consolidated_df = get_consolidated_data_for_surveys(
-                            [survey_id])
-                        surveys_info_df = get_all_surveys()
-                        analytics_df = process_and_standardize_data(
-                            consolidated_df, surveys_info_df)
-
-                        save_success, save_msg = save_analytics_data(
-                            analytics_df)
-                        if not save_success:
-                            raise Exception(
-                                f"Falha ao salvar na tabela de análise: {save_msg}"
-                            )
-                        # --- FIM DA PIPELINE ---
+                    # Mesma sequência da linha de comando e do worker (src/pipeline.py)
+                    resultado = refresh_survey(survey_id, research_name, api_link,
+                                               expected_total, on_step=mostrar_etapa)
 
+                    if resultado["status"] == STATUS_ATUALIZADA:
                         status.update(
-                            label=
-                            f"'{research_name}' atualizada com sucesso! ✅",
+                            label=f"'{research_name}' atualizada com sucesso! ✅",
                             state="complete",
                             expanded=False)
-                        survey_summary_data["Status"] = f"✅ Atualizada"
-
-                    else:
+                    elif resultado["status"] == STATUS_SEM_NOVOS:
                         status.update(
                             label=f"Nenhum dado novo para '{research_name}'.",
                             state="complete",
                             expanded=False)
-                        survey_summary_data["Status"] = "ℹ️ Sem Novos Dados"
-
-                except Exception as e:
-                    status.update(
-                        label=f"Falha ao processar '{research_name}'!",
-                        state="error",
-                        expanded=True)
-                    st.error(f"Erro detalhado para '{research_name}': {e}")
-                    survey_summary_data["Status"] = "❌ Falha"
-                    overall_process_success = False
+                    else:
+                        status.update(
+                            label=f"Falha ao processar '{research_name}'!",
+                            state="error",
+                            expanded=True)
+                        st.error(f"Erro detalhado para '{research_name}': {resultado['mensagem']}")
+                        overall_process_success = False
 
-            post_update_count = get_respondent_count(survey_id)
-            update_survey_stats(survey_id, post_update_count, expected_total)
-            processed_surveys_summary.append(survey_summary_data)
+            new_respondents_added_total += resultado["novas_coletas"]
+            processed_surveys_summary.append({
+                "Pesquisa": research_name,
+                "Status": STATUS_LABELS[resultado["status"]],
+                "Novas Coletas": resultado["novas_coletas"],
+            })
 
         progress_bar.empty()
 
@@ -3,10 +3,11 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-from src.database import (get_consolidation_log, consolidate_survey_data,
-                          get_all_surveys, get_all_consolidated_data,
+from src.database import (get_consolidation_log, get_all_surveys,
                           get_surveys_with_recent_new_data,
-                          get_consolidated_data_for_surveys)
+                          get_question_frequencies,
+                          get_consolidated_data_summary,
+                          get_consolidated_data_page)
 from src.data_processing import CODIGOS_PARA_TEXTO_ORIGINAL
 
 st.set_page_config(layout="wide", page_title="Análise Consolidada")
@@ -44,6 +45,16 @@ st.header("🔬 Explorador de Dados Consolidados")
 st.markdown(
     "Selecione um conjunto de dados para carregar e analisar em detalhe.")
 
+
+@st.cache_data(ttl=600, show_spinner=False)
+def load_records_page(survey_ids: tuple | None, page_size: int,
+                      page_number: int) -> pd.DataFrame:
+    ids = list(survey_ids) if survey_ids is not None else None
+    return get_consolidated_data_page(ids,
+                                      limit=page_size,
+                                      offset=(page_number - 1) * page_size)
+
+
 # --- Controles Interativos ---
 all_surveys_df = get_all_surveys()
 all_surveys_options = {
@@ -55,7 +66,7 @@ id_to_name_map = {v: k for k, v in all_surveys_options.items()}
 option = st.selectbox(
     "Quais dados você gostaria de analisar?",
     ("Últimas 5 Pesquisas Ativas", "Selecionar uma Pesquisa Específica",
-     "Carregar TUDO (Lento)"),
+     "Carregar TUDO"),
     key="data_explorer_option")
 
 selected_survey_id = None
@@ -64,23 +75,27 @@ if option == "Selecionar uma Pesquisa Específica":
                                         options=all_surveys_options.keys())
     selected_survey_id = all_surveys_options[selected_survey_name]
 
-# Inicializa as variáveis no estado da sessão para guardar os dados e o rótulo
-if 'loaded_data' not in st.session_state:
-    st.session_state['loaded_data'] = pd.DataFrame()
+# Guarda na sessão apenas a seleção e os agregados (pequenos), nunca a tabela longa.
+# 'loaded_survey_ids' = None significa "todas as pesquisas".
+if 'loaded_frequencies' not in st.session_state:
+    st.session_state['loaded_frequencies'] = None
+if 'loaded_summary' not in st.session_state:
+    st.session_state['loaded_summary'] = None
+if 'loaded_survey_ids' not in st.session_state:
+    st.session_state['loaded_survey_ids'] = None
 if 'loaded_data_label' not in st.session_state:
     st.session_state['loaded_data_label'] = "Nenhum dado carregado."
 
 # Botão para acionar o carregamento
 if st.button("Carregar Dados para Análise"):
-    with st.spinner("Buscando dados no banco... Isso pode levar um momento."):
-        df_to_load = pd.DataFrame()
+    with st.spinner("Agregando dados no banco... Isso pode levar um momento."):
+        survey_ids_to_load = []
         label_to_set = "Nenhum dado encontrado para a seleção."
 
         if option == "Últimas 5 Pesquisas Ativas":
-            # Usando a nova função mais inteligente
             latest_ids = get_surveys_with_recent_new_data(limit_surveys=5)
             if latest_ids:
-                df_to_load = get_consolidated_data_for_surveys(latest_ids)
+                survey_ids_to_load = [int(sid) for sid in latest_ids]
                 latest_names = [
                     id_to_name_map.get(sid, f"ID {sid}") for sid in latest_ids
                 ]
@@ -88,48 +103,75 @@ if st.button("Carregar Dados para Análise"):
 
         elif option == "Selecionar uma Pesquisa Específica":
             if selected_survey_id:
-                df_to_load = get_consolidated_data_for_surveys(
-                    [selected_survey_id])
+                survey_ids_to_load = [int(selected_survey_id)]
                 label_to_set = f"Dados da Pesquisa: {id_to_name_map.get(selected_survey_id)}"
 
-        elif option == "Carregar TUDO (Lento)":
-            df_to_load = get_all_consolidated_data()
+        elif option == "Carregar TUDO":
+            survey_ids_to_load = None
             label_to_set = "Dados de Todas as Pesquisas"
 
-        st.session_state['loaded_data'] = df_to_load
+        if survey_ids_to_load is None or survey_ids_to_load:
+            st.session_state['loaded_frequencies'] = get_question_frequencies(
+                survey_ids_to_load)
+            st.session_state['loaded_summary'] = get_consolidated_data_summary(
+                survey_ids_to_load)
+        else:
+            st.session_state['loaded_frequencies'] = None
+            st.session_state['loaded_summary'] = None
+        st.session_state['loaded_survey_ids'] = (
+            tuple(survey_ids_to_load) if survey_ids_to_load is not None else None)
         st.session_state['loaded_data_label'] = label_to_set
 
-# --- Seção de Análise (Usa os dados carregados do st.session_state) ---
-df_loaded = st.session_state['loaded_data']
+# --- Seção de Análise (Usa os agregados guardados no st.session_state) ---
+freq_df = st.session_state['loaded_frequencies']
+summary = st.session_state['loaded_summary']
+loaded_survey_ids = st.session_state['loaded_survey_ids']
 data_label = st.session_state['loaded_data_label']
 
-if df_loaded.empty:
+if summary is None or summary.get('total_rows', 0) == 0:
     st.info(
         "Nenhum dado carregado. Selecione uma opção e clique no botão acima para começar."
     )
 else:
     st.success(
-        f"Analisando {len(df_loaded['respondent_id'].unique())} respondentes únicos."
-    )
+        f"Analisando {summary['unique_respondents']} respondentes únicos.")
 
-    # O expander agora usa o rótulo dinâmico
+    # Registros brutos: buscados sob demanda, uma página por vez
     with st.expander(f"Ver registros de: {data_label}"):
-        st.dataframe(df_loaded, width="stretch")
+        total_rows = summary['total_rows']
+        col_size, col_page = st.columns(2)
+        page_size = col_size.selectbox("Registros por página",
+                                       options=[100, 500, 1000, 5000],
+                                       index=1,
+                                       key="records_page_size")
+        total_pages = max(1, -(-total_rows // page_size))
+        page_number = col_page.number_input(f"Página (de {total_pages})",
+                                            min_value=1,
+                                            max_value=total_pages,
+                                            value=1,
+                                            step=1,
+                                            key="records_page_number")
+        st.caption(f"Total de registros consolidados: {total_rows:,}")
+        st.dataframe(load_records_page(loaded_survey_ids, int(page_size),
+                                       int(page_number)),
+                     width="stretch")
 
     st.subheader("Análise de Respostas por Pergunta")
 
-    unique_codes_in_df = set(df_loaded['question_code'].unique())
+    # Uma única passada: agrupa a tabela de frequência (já agregada no banco) por pergunta
+    frequencies_by_code = {
+        code: group[['answer_value', 'count']]
+        for code, group in freq_df.groupby('question_code', sort=False)
+    } if freq_df is not None and not freq_df.empty else {}
 
     for question_code in CODIGOS_PARA_TEXTO_ORIGINAL.keys():
-        if question_code in unique_codes_in_df:
+        if question_code in frequencies_by_code:
             question_text = CODIGOS_PARA_TEXTO_ORIGINAL.get(
                 question_code, "Texto não encontrado")
 
             with st.expander(f"**{question_code}**: {question_text}"):
-                question_df = df_loaded[df_loaded['question_code'] ==
-                                        question_code]
-                value_counts = question_df['answer_value'].value_counts(
-                ).reset_index()
+                value_counts = frequencies_by_code[question_code].reset_index(
+                    drop=True)
                 value_counts.columns = ['Resposta', 'Contagem']
                 st.markdown(
                     f"A pergunta **'{question_code}'** teve **{len(value_counts)}** respostas diferentes nesta amostra."
@@ -144,6 +144,7 @@ if total_respondentes > 0:
 
         elif tipo_grafico == 'Proporção (Pizza)':
             counts = df_filtrado[variavel_principal].value_counts()
+            counts = counts[counts > 0]  # Colunas 'category' listam também as ausentes
             fig = px.pie(counts,
                          values=counts.values,
                          names=counts.index,
@@ -3,26 +3,29 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-import itertools
-import math
 from src.database import get_analytics_data, get_all_consolidated_data
 from src.data_processing import map_renda_to_macro_faixa
+from src.sampling import (make_rng, hierarchical_stratified_sample,
+                          proportional_stratified_sample)
 
 st.set_page_config(layout="wide", page_title="Gerador de Amostra")
 st.logo("assets/logoBrain.png")
 
 
 # --- Funções de Carregamento e Auxiliares ---
-@st.cache_data(ttl=3600)
+# cache_resource: uma única cópia da base, compartilhada (somente leitura) por todas as sessões.
+# As amostras guardadas na sessão são apenas arrays de índices para esta base.
+@st.cache_resource(ttl=3600)
 def load_base_data():
     df = get_analytics_data()
     if not df.empty:
         if 'renda_faixa_padronizada' in df.columns:
             df['renda_macro_faixa'] = df['renda_faixa_padronizada'].apply(
-                map_renda_to_macro_faixa)
+                map_renda_to_macro_faixa).astype('category')
         if 'data_pesquisa' in df.columns:
             df['data_pesquisa'] = pd.to_datetime(df['data_pesquisa'],
                                                  errors='coerce')
+    df.attrs['base_token'] = pd.Timestamp.now().isoformat()
     return df
 
 
@@ -31,6 +34,14 @@ def convert_df_to_csv(df_to_convert):
     return df_to_convert.to_csv(index=False).encode('utf-8')
 
 
+# Rótulos de exibição das dimensões do plano de estratos
+PLAN_COLUMN_LABELS = {
+    'regiao': 'Região',
+    'renda_macro_faixa': 'Faixa de Renda',
+    'localidade': 'Localidade'
+}
+
+
 # --- Interface Principal ---
 st.title("🔬 Gerador e Planejador de Amostra")
 st.markdown(
@@ -151,11 +162,38 @@ with st.container(border=True):
             'Capital': capital_pct,
             'Interior': 100 - capital_pct
         }
+    # --- Dimensões opcionais de estratificação ---
+    dimensoes_extras = {}
+    with st.expander("Dimensões adicionais de estratificação (opcional)"):
+        st.caption(
+            "As cotas por célula são ajustadas por raking às marginais de todas as dimensões ativas."
+        )
+        col_e1, col_e2 = st.columns(2)
+        for col_widget, (titulo, coluna) in zip(
+            (col_e1, col_e2), (("Gênero", 'genero'), ("Faixa Etária", 'faixa_etaria'))):
+            with col_widget:
+                categorias = sorted(df_analytics[coluna].dropna().astype(str).unique().tolist())
+                if not categorias or not st.checkbox(f"Estratificar por {titulo}",
+                                                     key=f"usar_dim_{coluna}"):
+                    continue
+                peso_padrao = 100 // len(categorias)
+                pesos = {
+                    cat: st.number_input(f"{cat} (%)", 0, 100,
+                                         peso_padrao + (100 - peso_padrao * len(categorias) if i == 0 else 0),
+                                         key=f"peso_{coluna}_{cat}")
+                    for i, cat in enumerate(categorias)
+                }
+                soma_dim = sum(pesos.values())
+                if soma_dim == 100: st.success(f"Total {titulo}: {soma_dim}%")
+                else: st.error(f"Total {titulo}: {soma_dim}% (deve ser 100%)")
+                dimensoes_extras[coluna] = pesos
     st.subheader("Tamanho da Amostra Final")
     sample_size = st.number_input("Quantidade de Respondentes Desejada", 100,
                                   10000, 1200)
     parametros_validos = (abs(soma_regiao - 100)
-                          < 0.1) and (abs(soma_renda - 100) < 0.1)
+                          < 0.1) and (abs(soma_renda - 100) < 0.1) and all(
+                              abs(sum(p.values()) - 100) < 0.1
+                              for p in dimensoes_extras.values())
     if not parametros_validos:
         st.warning("Ajuste as porcentagens para que a soma seja 100%.")
     if 'analysis_report' not in st.session_state:
@@ -211,116 +249,78 @@ with st.container(border=True):
                 n_core = len(indices_core)
                 n_solicitado_hierarquico = max(0, n_total_necessario - n_core)
 
+                rng = make_rng()
                 indices_hierarquicos = set()
 
                 if n_solicitado_hierarquico > 0 and not df_pool_para_amostra.empty:
-                    # --- Etapa 5: Rodar Amostragem Hierárquica no Pool Restante ---
-                    
-                    # ESTÁGIO 5.1: Garantir cotas de RENDA primeiro (no pool)
-                    df_restante_pool = df_pool_para_amostra.copy()
-
-                    for renda, pct in renda_faixas_macro.items():
-                        if pct > 0:
-                            # Calcula o target para o N restante
-                            target_n_renda = int(round(n_solicitado_hierarquico * (pct / 100.0)))
-                            disponiveis_na_faixa = df_restante_pool[df_restante_pool['renda_macro_faixa'] == renda]
-                            n_a_pegar = min(target_n_renda, len(disponiveis_na_faixa))
-
-                            if n_a_pegar > 0:
-                                sub_amostra_indices = set()
-                                # Tenta balancear por Região/Localidade dentro da cota de renda
-                                for regiao, pct_regiao in regiao_pesos.items():
-                                    for local, pct_local in localidade_pesos.items():
-                                        sub_target_n = int(round(n_a_pegar * (pct_regiao / 100) * (pct_local / 100)))
-                                        sub_disponiveis = disponiveis_na_faixa[
-                                            (disponiveis_na_faixa['regiao'] == regiao) &
-                                            (disponiveis_na_faixa['localidade'] == local)
-                                        ]
-                                        sub_take_n = min(sub_target_n, len(sub_disponiveis))
-                                        if sub_take_n > 0:
-                                            selecionados = np.random.choice(sub_disponiveis.index, sub_take_n, replace=False)
-                                            sub_amostra_indices.update(selecionados)
-                                
-                                # Preenche o restante para a cota de renda (shortfall interno)
-                                sub_shortfall = n_a_pegar - len(sub_amostra_indices)
-                                if sub_shortfall > 0:
-                                    sub_restantes = disponiveis_na_faixa.index.difference(sub_amostra_indices)
-                                    n_to_fill_sub = min(sub_shortfall, len(sub_restantes))
-                                    if n_to_fill_sub > 0:
-                                        sub_amostra_indices.update(np.random.choice(sub_restantes, n_to_fill_sub, replace=False))
-                                
-                                indices_hierarquicos.update(sub_amostra_indices)
-                                df_restante_pool = df_restante_pool.drop(sub_amostra_indices) # Remove os já selecionados do pool
-
-                    # ESTÁGIO 5.2: Preencher o shortfall GERAL (no pool)
-                    shortfall_geral = n_solicitado_hierarquico - len(indices_hierarquicos)
-                    if shortfall_geral > 0 and not df_restante_pool.empty:
-                        n_to_fill_geral = min(shortfall_geral, len(df_restante_pool))
-                        if n_to_fill_geral > 0:
-                            indices_hierarquicos.update(
-                                np.random.choice(df_restante_pool.index, n_to_fill_geral, replace=False)
-                            )
+                    # --- Etapa 5: Amostragem Hierárquica Vetorizada no Pool Restante ---
+                    # Renda é a dimensão primária; Região e Localidade balanceiam dentro de cada cota.
+                    indices_hierarquicos = set(hierarchical_stratified_sample(
+                        df_pool_para_amostra,
+                        n_solicitado_hierarquico,
+                        primary=('renda_macro_faixa', renda_faixas_macro),
+                        secondary={
+                            'regiao': regiao_pesos,
+                            'localidade': localidade_pesos,
+                            **dimensoes_extras
+                        },
+                        rng=rng))
 
                 elif n_core >= n_total_necessario:
                     st.warning(f"A 'Amostra-Core' selecionada ({n_core} respondentes) ja atinge ou supera o N Solicitado ({n_total_necessario}). A amostra final contera apenas o grupo 'core'.")
                     # Se o core for maior, podemos truncar para o N exato
                     if n_core > n_total_necessario:
-                        indices_core = set(np.random.choice(list(indices_core), n_total_necessario, replace=False))
-
-
+                        indices_core = set(rng.choice(np.array(list(indices_core)), n_total_necessario, replace=False))
 
                 # --- Etapa 6: União da Amostra Final ---
                 indices_finais = indices_core.union(indices_hierarquicos)
-                amostra_final_df = df_para_relatorio.loc[list(indices_finais)].copy()
-                
-                # --- Lógica da Amostra Proporcional (não muda) ---
-                # Ela roda sobre a base consolidada (core + pool filtrado) para o relat?rio de coleta
-                strata_combinations = list(itertools.product(regiao_pesos.keys(), renda_faixas_macro.keys(), localidade_pesos.keys()))
-                strata_plan = []
-                n_base_proporcional = sample_size # Usamos o sample_size original para o plano ideal
-                
-                for combo in strata_combinations:
-                    target_pct = (regiao_pesos[combo[0]] / 100) * (renda_faixas_macro[combo[1]] / 100) * (localidade_pesos[combo[2]] / 100)
-                    mask = (df_para_relatorio['regiao'] == combo[0]) & \
-                           (df_para_relatorio['renda_macro_faixa'] == combo[1]) & \
-                           (df_para_relatorio['localidade'] == combo[2])
-                    available_n = mask.sum()
-                    strata_plan.append({
-                        "combo": combo,
-                        "target_n": target_pct * n_base_proporcional,
-                        "available_n": available_n,
-                        "ratio": available_n / (target_pct * n_base_proporcional) if target_pct > 0 else 1.0,
-                        "mask": mask
-                    })
-                
-                min_ratio = min([s['ratio'] for s in strata_plan if s['target_n'] > 0] + [1.0])
-                sampled_indices_prop = []
-                for plan in strata_plan:
-                    n_to_sample = int(round(plan['target_n'] * min_ratio))
-                    if n_to_sample > 0:
-                        available_indices = df_para_relatorio[plan['mask']].index
-                        n_to_sample = min(n_to_sample, len(available_indices)) # Garante que não tente pegar mais do que o disponível
-                        sampled_indices_prop.extend(
-                            np.random.choice(available_indices, n_to_sample, replace=False)
-                        )
-                amostra_proporcional_df = df_para_relatorio.loc[list(set(sampled_indices_prop))].copy()
-
-                # Salva os resultados no estado da sessão
+                amostra_idx = np.fromiter(indices_finais, dtype=df_analytics.index.dtype,
+                                          count=len(indices_finais))
+
+                # --- Amostra Proporcional ---
+                # Roda sobre a base consolidada (core + pool filtrado) para o relatório de coleta
+                sampled_indices_prop, plano_estratos = proportional_stratified_sample(
+                    df_para_relatorio,
+                    sample_size,  # Usamos o sample_size original para o plano ideal
+                    dimensions={
+                        'regiao': regiao_pesos,
+                        'renda_macro_faixa': renda_faixas_macro,
+                        'localidade': localidade_pesos,
+                        **dimensoes_extras
+                    },
+                    rng=rng)
+                if dimensoes_extras:
+                    # O painel de coleta é exibido por Região x Renda x Localidade
+                    plano_estratos = plano_estratos.groupby(
+                        ['regiao', 'renda_macro_faixa', 'localidade'],
+                        sort=False, as_index=False)[['target_n', 'available_n', 'quota_n']].sum()
+
+                # Salva apenas índices, contagens e alvos: a memória por sessão
+                # fica proporcional ao tamanho da amostra, não ao da base.
                 st.session_state.analysis_report = {
-                    "amostra_df": amostra_final_df,
-                    "amostra_proporcional_df": amostra_proporcional_df,
+                    "base_token": df_analytics.attrs.get('base_token'),
+                    "amostra_idx": amostra_idx,
+                    "amostra_proporcional_idx": np.asarray(sampled_indices_prop),
                     "report_df": report_df,
-                    "strata_plan": strata_plan,
+                    "strata_plan": plano_estratos,
                     "requested_size": sample_size
                 }
         st.rerun()
 
 # --- Exibição dos Relatórios ---
+if ('analysis_report' in st.session_state and st.session_state.analysis_report
+        and st.session_state.analysis_report.get('base_token') !=
+        df_analytics.attrs.get('base_token')):
+    # A base compartilhada foi recarregada: os índices guardados não valem mais.
+    st.session_state.analysis_report = None
+    st.info("A base de análise foi atualizada. Gere as amostras novamente.")
+
 if 'analysis_report' in st.session_state and st.session_state.analysis_report:
     report_data = st.session_state.analysis_report
-    amostra_final_df = report_data['amostra_df']
-    amostra_proporcional_df = report_data['amostra_proporcional_df']
-    report_df = report_data['report_df']
+    amostra_final_df = df_analytics.loc[report_data['amostra_idx']]
+    amostra_proporcional_df = df_analytics.loc[
+        report_data['amostra_proporcional_idx']]
+    report_df = report_data['report_df'].copy()
     strata_plan = report_data['strata_plan']
     final_size = len(amostra_final_df)
 
@@ -381,19 +381,13 @@ if 'analysis_report' in st.session_state and st.session_state.analysis_report:
 
     # --- PAINEL DE AÇÃO PARA COLETA (COM TOTAL) ---
     st.subheader("Painel de Ação para Coleta")
-    coletas_necessarias = [{
-        'Região':
-        p['combo'][0],
-        'Faixa de Renda':
-        p['combo'][1],
-        'Localidade':
-        p['combo'][2],
-        'Coletas Faltantes':
-        math.ceil(p['target_n'] - p['available_n'])
-    } for p in strata_plan if (p['target_n'] - p['available_n']) > 0]
-
-    if coletas_necessarias:
-        plano_coleta_df = pd.DataFrame(coletas_necessarias)
+    faltantes = strata_plan['target_n'] - strata_plan['available_n']
+    plano_coleta_df = strata_plan.loc[faltantes > 0, [
+        'regiao', 'renda_macro_faixa', 'localidade'
+    ]].rename(columns=PLAN_COLUMN_LABELS)
+    plano_coleta_df['Coletas Faltantes'] = np.ceil(faltantes[faltantes > 0])
+
+    if not plano_coleta_df.empty:
         total_geral_faltante = plano_coleta_df['Coletas Faltantes'].sum()
 
         st.metric(label="Total Geral de Coletas Adicionais Necessárias",
@@ -501,6 +495,7 @@ if 'analysis_report' in st.session_state and st.session_state.analysis_report:
                     st.write(f"**{title}**")
                     counts = amostra_final_df[col_name].value_counts(
                         normalize=True).mul(100)
+                    counts = counts[counts > 0]  # Colunas 'category' listam também as ausentes
                     st.dataframe(
                         counts.to_frame(name='%').style.format('{:.1f}%'))
 
@@ -564,16 +559,13 @@ if 'analysis_report' in st.session_state and st.session_state.analysis_report:
         if amostra_proporcional_df.empty:
             st.warning("Amostra Proporcional não pôde ser gerada.")
             st.markdown(
-                "Isso ocorre porque um ou mais perfis essenciais para o plano **não possuem nenhum respondente** na base de dados (disponibilidade zero)."
+                "Isso ocorre quando uma categoria inteira de alguma dimensão (ex: uma Região ou Faixa de Renda com peso maior que zero) **não possui nenhum respondente** na base filtrada. Estratos vazios isolados são compensados pelos demais."
             )
-            perfis_criticos = [{
-                'Região': p['combo'][0],
-                'Faixa de Renda': p['combo'][1],
-                'Localidade': p['combo'][2]
-            } for p in strata_plan
-                               if p['target_n'] > 0 and p['available_n'] == 0]
-            if perfis_criticos:
-                perfis_criticos_df = pd.DataFrame(perfis_criticos)
+            perfis_criticos_df = strata_plan.loc[
+                (strata_plan['target_n'] > 0) & (strata_plan['available_n'] == 0),
+                ['regiao', 'renda_macro_faixa', 'localidade'
+                 ]].rename(columns=PLAN_COLUMN_LABELS)
+            if not perfis_criticos_df.empty:
                 st.markdown("###### Perfis 'Gargalo' (Capital vs Interior)")
                 counts_localidade = perfis_criticos_df[
                     'Localidade'].value_counts()
@@ -2,10 +2,15 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-from src.database import (get_all_surveys, resync_full_survey,
-                          consolidate_survey_data, get_all_consolidated_data,
-                          save_analytics_data)
-from src.data_processing import process_and_standardize_data
+from src.database import (get_all_surveys, count_income_rows_to_reclassify,
+                          reclassify_income_classes, enqueue_pipeline_job,
+                          get_pipeline_jobs, cancel_pipeline_job,
+                          get_pipeline_runs, get_pipeline_metrics,
+                          PIPELINE_JOB_TYPES, PIPELINE_JOB_ACTIVE_STATUSES)
+from src.data_processing import load_income_rules
+from src import query_log
+from src.instrumentation import (KIND_PROFILE, KIND_RUN, recent_records,
+                                 records_to_frame, summarize_run)
 
 st.set_page_config(layout="wide", page_title="Administração")
 st.logo("assets/logoBrain.png")
@@ -15,6 +20,24 @@ st.warning(
     "As ferramentas nesta página executam operações pesadas e, em alguns casos, destrutivas. Use com cuidado e apenas quando necessário."
 )
 
+st.info(
+    "Re-sincronização, re-consolidação e a pipeline de transformação rodam no worker da fila de jobs "
+    "(`python -m src.job_worker`), fora desta página: fechar a aba não interrompe o job, e dois jobs "
+    "da mesma pesquisa nunca rodam ao mesmo tempo. Acompanhe o andamento em **📋 Fila de Jobs**."
+)
+
+
+def _enfileirar(job_type: str, survey_id: int | None = None, params: dict | None = None):
+    """Coloca o job na fila e mostra o resultado (job novo ou o que já estava ativo)."""
+    criado, msg, job_id = enqueue_pipeline_job(job_type, survey_id, params, requested_by="pagina_admin")
+    if criado:
+        st.success(f"✅ {msg}")
+    elif job_id is not None:
+        st.info(msg)
+    else:
+        st.error(f"❌ {msg}")
+
+
 # --- FERRAMENTA 1: Re-sincronização de Pesquisa Única ---
 with st.expander("🌀 Re-sincronização Completa de uma Pesquisa"):
     st.markdown(
@@ -26,7 +49,7 @@ with st.expander("🌀 Re-sincronização Completa de uma Pesquisa"):
         st.info("Nenhuma pesquisa ativa para selecionar.")
     else:
         survey_options = {
-            row['research_name']: (row['survey_id'], row['api_link'])
+            row['research_name']: row['survey_id']
             for index, row in all_surveys_df_sync.iterrows()
         }
 
@@ -36,36 +59,8 @@ with st.expander("🌀 Re-sincronização Completa de uma Pesquisa"):
             key="resync_selectbox"  # Usando uma chave única para o widget
         )
 
-        # O botão agora apenas define uma variável booleana
-        resync_button_clicked = st.button(
-            "Forçar Re-sincronização Completa desta Pesquisa")
-
-# --- A LÓGICA DE EXECUÇÃO AGORA FICA FORA DO EXPANDER ---
-# Ela só será acionada se o botão, que está lá dentro, for clicado.
-if resync_button_clicked:
-    # Verificamos se uma pesquisa foi selecionada
-    if 'selected_survey_name_resync' in locals(
-    ) and selected_survey_name_resync:
-        survey_id_to_resync, api_link_to_resync = survey_options[
-            selected_survey_name_resync]
-
-        # O st.status agora é criado no corpo principal da página, não aninhado.
-        with st.status(
-                f"Executando re-sincronização para '{selected_survey_name_resync}'...",
-                expanded=True) as status:
-            success, message = resync_full_survey(survey_id_to_resync,
-                                                  api_link_to_resync)
-
-            if success:
-                status.update(label="Concluído!",
-                              state="complete",
-                              expanded=False)
-                st.success(message)
-                # Adicionamos um rerun para que a lista de pesquisas seja atualizada
-                st.rerun()
-            else:
-                status.update(label="Falha!", state="error", expanded=True)
-                st.error(message)
+        if st.button("Forçar Re-sincronização Completa desta Pesquisa"):
+            _enfileirar("resync", int(survey_options[selected_survey_name_resync]))
 
 # --- FERRAMENTA 2: Re-consolidação Total ---
 with st.expander("🔄 Forçar Re-consolidação de Dados Brutos"):
@@ -74,30 +69,7 @@ with st.expander("🔄 Forçar Re-consolidação de Dados Brutos"):
     )
 
     if st.button("Re-consolidar TODAS as Pesquisas"):
-        with st.spinner("Iniciando re-consolidação de todos os dados..."):
-            all_surveys_df_recon = get_all_surveys()
-            success_count = 0
-            error_count = 0
-            progress_bar = st.progress(0, text="Iniciando...")
-
-            for i, row in enumerate(all_surveys_df_recon.itertuples()):
-                progress_text = f"Processando: {row.research_name} ({i+1}/{len(all_surveys_df_recon)})"
-                progress_bar.progress((i + 1) / len(all_surveys_df_recon),
-                                      text=progress_text)
-
-                success, msg = consolidate_survey_data(row.survey_id)
-                if success:
-                    success_count += 1
-                else:
-                    error_count += 1
-                    st.error(
-                        f"Erro na re-consolidação de '{row.research_name}': {msg}"
-                    )
-
-            progress_bar.empty()
-        st.success(
-            f"Re-consolidação concluída! ✅ Sucessos: {success_count} | ❌ Falhas: {error_count}"
-        )
+        _enfileirar("reconsolidate")
 
 # --- FERRAMENTA 3: Pipeline de Transformação Analítica ---
 st.markdown("---")
@@ -109,36 +81,153 @@ with st.container(border=True):
         "**Use para:** Processar todos os dados da `consolidated_data`, aplicar as regras de padronização e limpeza, e carregar o resultado na tabela final `analytics_respondents`. Execute isso após grandes mudanças ou para a carga inicial."
     )
 
+    capturar_perfil = st.checkbox(
+        "Capturar perfil (cProfile) desta execução",
+        help="Deixa a execução um pouco mais lenta; o perfil aparece em ⏱️ Desempenho da Pipeline.")
     if st.button("Executar Pipeline de Transformação Completa"):
-        with st.spinner(
-                "Iniciando pipeline... Este processo pode ser demorado."):
-            st.write("1. Buscando todos os dados consolidados e metadados...")
-            long_df = get_all_consolidated_data()
-            all_surveys_info = get_all_surveys()
-
-            if not long_df.empty:
-                st.write("2. Padronizando e enriquecendo os dados...")
-                analytics_df = process_and_standardize_data(
-                    long_df, all_surveys_info)
-
-                if not analytics_df.empty:
-                    st.write(
-                        f"3. Salvando {len(analytics_df)} registros processados na tabela de análise..."
-                    )
-                    success, msg = save_analytics_data(analytics_df)
-
-                    if success:
-                        st.success(
-                            f"✅ Pipeline de transformação concluída com sucesso! {msg}"
-                        )
-                        st.balloons()
-                    else:
-                        st.error(f"❌ Falha na etapa de salvamento: {msg}")
-                else:
-                    st.warning(
-                        "O processamento não gerou dados para salvar. Verifique a lógica de transformação."
-                    )
+        _enfileirar("transform", params={"perfil": True} if capturar_perfil else None)
+
+# --- Acompanhamento da fila ---
+st.markdown("---")
+st.header("📋 Fila de Jobs")
+
+JOB_STATUS_LABELS = {
+    "pending": "⏳ Na fila",
+    "running": "⚙️ Executando",
+    "succeeded": "✅ Concluído",
+    "failed": "❌ Falhou",
+    "cancelled": "🚫 Cancelado",
+}
+
+
+@st.fragment(run_every="5s")
+def painel_de_jobs():
+    jobs = get_pipeline_jobs(limit=30)
+    if jobs.empty:
+        st.info("Nenhum job registrado.")
+        return
+
+    tabela = pd.DataFrame({
+        "Job": jobs["job_id"],
+        "Tipo": jobs["job_type"].map(lambda t: PIPELINE_JOB_TYPES.get(t, (None, t))[1]),
+        "Pesquisa": jobs["research_name"].fillna("Todas"),
+        "Status": jobs["status"].map(JOB_STATUS_LABELS).fillna(jobs["status"]),
+        "Progresso": jobs["progress"].astype(float),
+        "Etapa": jobs["progress_text"],
+        "Tentativas": jobs["attempts"].astype(str) + "/" + jobs["max_attempts"].astype(str),
+        "Criado em": jobs["created_at"],
+        "Terminado em": jobs["finished_at"],
+        "Erro": jobs["last_error"],
+    })
+    st.dataframe(
+        tabela, hide_index=True, use_container_width=True,
+        column_config={"Progresso": st.column_config.ProgressColumn(min_value=0, max_value=1, format="percent")},
+    )
+
+    ativos = jobs[jobs["status"].isin(PIPELINE_JOB_ACTIVE_STATUSES)]
+    if ativos.empty:
+        st.caption("Nenhum job ativo.")
+    elif (ativos["status"] == "pending").all():
+        st.caption("Há jobs na fila aguardando um worker (`python -m src.job_worker`).")
+
+    pendentes = jobs.loc[jobs["status"] == "pending", "job_id"].tolist()
+    if pendentes:
+        col_job, col_botao = st.columns([3, 1])
+        job_a_cancelar = col_job.selectbox("Cancelar job na fila:", options=pendentes,
+                                           key="cancel_job_select")
+        if col_botao.button("Cancelar", key="cancel_job_button"):
+            success, msg = cancel_pipeline_job(int(job_a_cancelar))
+            (st.success if success else st.warning)(msg)
+
+
+painel_de_jobs()
+
+# --- Desempenho por execução ---
+st.markdown("---")
+with st.expander("⏱️ Desempenho da Pipeline"):
+    st.markdown(
+        "Tempo de relógio, linhas e bytes de cada etapa (busca na API, mapeamento, armazenamento, consolidação, padronização e carga) e das chamadas SQL, somadas por etapa e comando, por execução. Execuções do worker, da linha de comando e da atualização em **Gerenciar Pesquisas** ficam gravadas em `pipeline_metrics` por `PIPELINE_METRICS_RETENTION_DAYS` dias (padrão 30)."
+    )
+    origem = st.radio("Origem:", ["Gravadas no banco", "Memória deste servidor"], horizontal=True,
+                      key="metrics_source")
+
+    if origem == "Gravadas no banco":
+        execucoes = get_pipeline_runs(limit=50)
+    else:
+        memoria = records_to_frame(recent_records())
+        execucoes = memoria[memoria["kind"] == KIND_RUN].iloc[::-1]
+
+    if execucoes.empty:
+        st.info("Nenhuma execução registrada.")
+    else:
+        rotulos = {
+            row.run_id: f"{pd.Timestamp(row.started_at):%d/%m %H:%M} · {row.run_name} · {row.duration_s:.1f}s"
+                        + ("" if row.ok else " · ❌")
+            for row in execucoes.itertuples()
+        }
+        run_id = st.selectbox("Execução:", options=list(rotulos), format_func=rotulos.get,
+                              key="metrics_run")
+        registros = (get_pipeline_metrics(run_id) if origem == "Gravadas no banco"
+                     else records_to_frame(recent_records(run_id)))
+        etapas, consultas = summarize_run(registros)
+
+        st.subheader("Etapas")
+        st.dataframe(etapas, hide_index=True, use_container_width=True)
+        st.subheader("SQL")
+        st.dataframe(consultas, hide_index=True, use_container_width=True)
+
+        perfil = registros.loc[registros["kind"] == KIND_PROFILE, "details"]
+        if not perfil.empty:
+            st.subheader("Perfil (cProfile, por tempo acumulado)")
+            st.code(perfil.iloc[0], language="text")
+
+# --- Consultas lentas ---
+with st.expander("🐢 Consultas Lentas"):
+    st.markdown(
+        f"Consultas deste servidor que passaram de **{query_log.threshold_seconds() * 1000:.0f} ms** (variável `SLOW_QUERY_MS`), com o tempo dividido entre execução (servidor + rede), leitura das linhas e montagem do DataFrame, e o plano (`EXPLAIN`) quando a execução foi a parte lenta. Log em `{query_log.log_path()}`."
+    )
+    top_n = st.slider("Quantidade de comandos:", 5, 50, 20, key="slow_query_top")
+    resumo_lentas = query_log.slowest_statements(query_log.read_log(), top_n)
+    if resumo_lentas.empty:
+        st.info("Nenhuma consulta lenta registrada.")
+    else:
+        st.dataframe(resumo_lentas.drop(columns=["ultimo_plano"]), hide_index=True,
+                     use_container_width=True)
+        com_plano = resumo_lentas[resumo_lentas["ultimo_plano"].notna()]
+        if not com_plano.empty:
+            comando = st.selectbox("Ver plano de:", options=com_plano.index,
+                                   format_func=lambda i: f"{com_plano.at[i, 'sql']} [{com_plano.at[i, 'etapa']}]",
+                                   key="slow_query_plan")
+            st.code(com_plano.at[comando, "ultimo_plano"], language="text")
+
+# --- FERRAMENTA 4: Reclassificação de Renda ---
+st.markdown("---")
+with st.expander("💰 Reaplicar Regras de Classificação de Renda"):
+    st.markdown(
+        "**Use para:** Aplicar uma versão nova ou corrigida de `config/regras_classificacao_renda.json` sem rodar a pipeline completa. Recalcula apenas as classes de renda a partir do valor estimado já gravado, nas tabelas `analytics_respondents` e `analytics_respondents_historical`, e só nas linhas classificadas por uma versão diferente da vigente para a sua data."
+    )
+
+    regras_renda = load_income_rules()
+    if regras_renda is not None:
+        st.caption(f"Arquivo de regras carregado: `{regras_renda.version}`")
+        versoes_disponiveis = [v.id_versao for v in regras_renda.versions]
+        versoes_selecionadas = st.multiselect(
+            "Versões a reaplicar (vazio = todas):",
+            options=versoes_disponiveis,
+            key="income_reclass_versions")
+        version_ids = versoes_selecionadas or None
+
+        if st.button("Calcular prévia", key="income_reclass_preview"):
+            previa = count_income_rows_to_reclassify(regras_renda, version_ids)
+            if previa.empty:
+                st.success("Nenhuma linha a reclassificar: as tabelas já estão com as regras vigentes.")
+            else:
+                st.dataframe(previa, hide_index=True)
+
+        if st.button("Reclassificar Renda", key="income_reclass_run"):
+            with st.spinner("Reclassificando as classes de renda..."):
+                success, msg = reclassify_income_classes(regras_renda, version_ids)
+            if success:
+                st.success(f"✅ {msg}")
             else:
-                st.warning(
-                    "Tabela de dados consolidados está vazia. Nada a processar."
-                )
+                st.error(f"❌ {msg}")
@@ -1,8 +1,35 @@
 # scripts/extract_full_dataset.py
-import pandas as pd
-import psycopg2
+"""
+Exporta a base de análise completa (analytics_respondents + analytics_respondents_historical).
+
+O servidor gera o CSV com 'COPY (consulta) TO STDOUT', que vai direto para um arquivo
+gzip, sem passar pelo pandas. Opcionalmente o CSV é convertido em blocos, com tipos
+vindos do schema da tabela, para um dataset Parquet particionado por ano/survey_id.
+Filtros de data e de pesquisas vão para dentro da consulta.
+
+Uso:
+    python scripts/extract_full_dataset.py
+    python scripts/extract_full_dataset.py --formato parquet --inicio 2023-01-01 --pesquisas 12,15
+"""
+import argparse
+import datetime
+import gzip
+import shutil
+import time
 from pathlib import Path
 
+import psycopg2
+from psycopg2 import sql
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.csv as pa_csv
+    import pyarrow.dataset as ds
+    PARQUET_AVAILABLE = True
+except Exception:
+    PARQUET_AVAILABLE = False
+
 # ATENÇÃO: Preencha suas credenciais do Supabase aqui
 DB_HOST = "aws-0-us-east-2.pooler.supabase.com"
 DB_PORT = "6543"
@@ -11,15 +38,145 @@ DB_USER = "postgres.nscdlmklgfbkiqfakptp"
 DB_PASSWORD = "qI1guAb7RUvggOtv" # <-- COLOQUE SUA SENHA AQUI
 
 # Define o nome do arquivo de saída
-OUTPUT_FILENAME = "full_dataset_2021_2025.csv"
+OUTPUT_FILENAME = "full_dataset_2021_2025.csv.gz"
 OUTPUT_PATH = Path(__file__).parent.parent / OUTPUT_FILENAME
+PARQUET_DIRNAME = "full_dataset_2021_2025_parquet"
+
+ANALYTICS_TABLES = ("analytics_respondents", "analytics_respondents_historical")
+# BOM UTF-8 no início do CSV, como no 'utf-8-sig' de antes, para o Excel reconhecer acentos
+UTF8_BOM = b"\xef\xbb\xbf"
+GZIP_LEVEL = 6
+PARQUET_BLOCK_SIZE = 32 << 20
+
+# Tipos do Postgres (information_schema.columns.data_type) -> tipos Arrow
+PG_TO_ARROW = {
+    "integer": "int32",
+    "bigint": "int64",
+    "smallint": "int16",
+    "numeric": "float64",
+    "double precision": "float64",
+    "real": "float32",
+    "boolean": "bool",
+    "date": "date32",
+    "timestamp without time zone": "timestamp",
+    "timestamp with time zone": "timestamp_tz",
+}
+
+
+def build_export_query(data_inicio: datetime.date | None = None,
+                       data_fim: datetime.date | None = None,
+                       survey_ids: list | None = None) -> sql.Composed:
+    """
+    União das tabelas de análise com os filtros aplicados em cada ramo, para o
+    Postgres poder usar índices e descartar linhas antes de enviar.
+    """
+    filtros = []
+    if data_inicio is not None:
+        filtros.append(sql.SQL("data_pesquisa >= {}").format(sql.Literal(data_inicio)))
+    if data_fim is not None:
+        # Fim inclusivo: até o último instante do dia informado
+        filtros.append(sql.SQL("data_pesquisa < {}").format(
+            sql.Literal(data_fim + datetime.timedelta(days=1))))
+    if survey_ids:
+        filtros.append(sql.SQL("survey_id IN ({})").format(
+            sql.SQL(", ").join(sql.Literal(int(s)) for s in survey_ids)))
+    where = sql.SQL(" WHERE ") + sql.SQL(" AND ").join(filtros) if filtros else sql.SQL("")
+
+    return sql.SQL(" UNION ALL ").join(
+        sql.SQL("SELECT * FROM {}").format(sql.Identifier(table)) + where
+        for table in ANALYTICS_TABLES
+    )
+
+
+def copy_to_csv_gz(conn, query: sql.Composed, output_path: Path) -> int:
+    """Executa 'COPY (query) TO STDOUT' gravando direto num CSV gzip. Retorna o número de linhas."""
+    copy_sql = sql.SQL("COPY ({}) TO STDOUT WITH (FORMAT csv, HEADER true)").format(query)
+    cursor = conn.cursor()
+    try:
+        with gzip.open(output_path, "wb", compresslevel=GZIP_LEVEL) as f:
+            f.write(UTF8_BOM)
+            cursor.copy_expert(copy_sql.as_string(conn), f)
+        return cursor.rowcount
+    finally:
+        cursor.close()
+
 
-def extract_data():
+def get_column_types(conn, table: str = ANALYTICS_TABLES[0]) -> dict:
+    """Coluna -> tipo do Postgres, na ordem da tabela (a mesma do 'SELECT *')."""
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            SELECT column_name, data_type FROM information_schema.columns
+            WHERE table_name = %s ORDER BY ordinal_position;
+        """, (table,))
+        return dict(cursor.fetchall())
+    finally:
+        cursor.close()
+
+
+def _arrow_type(pg_type: str):
+    nome = PG_TO_ARROW.get(pg_type)
+    if nome == "timestamp":
+        return pa.timestamp("us")
+    if nome == "timestamp_tz":
+        return pa.timestamp("us", tz="UTC")
+    if nome is None:
+        return pa.string()
+    return pa.type_for_alias(nome)
+
+
+def csv_gz_to_parquet(csv_path: Path, output_dir: Path, column_types: dict,
+                      date_column: str = "data_pesquisa") -> int:
+    """
+    Converte o CSV gzip em blocos para um dataset Parquet particionado (hive) por
+    ano de 'date_column' e survey_id, com os tipos de 'column_types' (tipos do Postgres).
+    Retorna o número de linhas escritas.
+    """
+    if not PARQUET_AVAILABLE:
+        raise RuntimeError("pyarrow não está instalado; exportação Parquet indisponível.")
+
+    tipos = {col: _arrow_type(pg_type) for col, pg_type in column_types.items()}
+    reader = pa_csv.open_csv(
+        pa.input_stream(str(csv_path), compression="gzip"),
+        read_options=pa_csv.ReadOptions(block_size=PARQUET_BLOCK_SIZE),
+        convert_options=pa_csv.ConvertOptions(column_types=tipos, strings_can_be_null=True),
+    )
+    schema = reader.schema.append(pa.field("ano", pa.int32()))
+    total = 0
+
+    def batches():
+        nonlocal total
+        for batch in reader:
+            total += batch.num_rows
+            ano = pc.cast(pc.year(batch.column(date_column)), pa.int32())
+            yield pa.RecordBatch.from_arrays(batch.columns + [ano], schema=schema)
+
+    if output_dir.exists():
+        shutil.rmtree(output_dir)
+    ds.write_dataset(
+        batches(),
+        output_dir,
+        schema=schema,
+        format="parquet",
+        partitioning=ds.partitioning(pa.schema([("ano", pa.int32()), ("survey_id", schema.field("survey_id").type)]),
+                                     flavor="hive"),
+        existing_data_behavior="overwrite_or_ignore",
+    )
+    return total
+
+
+def extract_data(output_format: str = "csv.gz", data_inicio: datetime.date | None = None,
+                 data_fim: datetime.date | None = None, survey_ids: list | None = None,
+                 output_path: Path = OUTPUT_PATH):
     """
-    Conecta ao banco de dados, extrai os dados unificados e salva como CSV.
+    Conecta ao banco de dados, exporta os dados unificados via COPY para CSV gzip e,
+    se pedido, converte para Parquet particionado.
     """
     print("Iniciando extração de dados do banco de dados...")
-    
+    if output_format == "parquet" and not PARQUET_AVAILABLE:
+        print("\n❌ pyarrow não está instalado; use --formato csv.gz.")
+        return
+
     conn = None
     try:
         # --- 1. Conectar ao Banco ---
@@ -33,23 +190,25 @@ def extract_data():
         )
         print("   - Conexão bem-sucedida.")
 
-        # --- 2. Definir a Query ---
-        # A mesma query que une os dados de 2025 (live) com os dados históricos
-        query = """
-            SELECT * FROM analytics_respondents
-            UNION ALL
-            SELECT * FROM analytics_respondents_historical;
-        """
-        print("   - Executando a query de união...")
-        
-        # --- 3. Executar a Query e Carregar no Pandas ---
-        df = pd.read_sql_query(query, conn)
-        print(f"   - Consulta concluída. {len(df)} registros encontrados.")
-
-        # --- 4. Salvar o Arquivo CSV ---
-        print(f"   - Salvando dados no arquivo: {OUTPUT_FILENAME}...")
-        df.to_csv(OUTPUT_PATH, index=False, encoding='utf-8-sig')
-        print(f"\n✅ Sucesso! O arquivo '{OUTPUT_FILENAME}' foi criado na pasta raiz do seu projeto.")
+        # --- 2. Definir a Query (filtros aplicados no servidor) ---
+        query = build_export_query(data_inicio, data_fim, survey_ids)
+
+        # --- 3. COPY direto para o arquivo comprimido ---
+        print(f"   - Exportando via COPY para: {output_path.name}...")
+        inicio = time.perf_counter()
+        linhas = copy_to_csv_gz(conn, query, output_path)
+        print(f"   - {linhas} registros exportados em {time.perf_counter() - inicio:.1f}s "
+              f"({output_path.stat().st_size / 1024 ** 2:.1f} MB).")
+
+        # --- 4. Conversão opcional para Parquet ---
+        if output_format == "parquet":
+            parquet_dir = output_path.parent / PARQUET_DIRNAME
+            print(f"   - Convertendo para Parquet particionado por ano/survey_id em: {parquet_dir.name}/...")
+            inicio = time.perf_counter()
+            escritas = csv_gz_to_parquet(output_path, parquet_dir, get_column_types(conn))
+            print(f"   - {escritas} registros convertidos em {time.perf_counter() - inicio:.1f}s.")
+
+        print(f"\n✅ Sucesso! Exportação concluída na pasta: {output_path.parent}")
 
     except psycopg2.OperationalError as e:
         print("\n❌ ERRO DE CONEXÃO: Não foi possível conectar ao banco de dados. Verifique suas credenciais.")
@@ -61,5 +220,14 @@ def extract_data():
             conn.close()
             print("\n   - Conexão com o banco de dados fechada.")
 
+
 if __name__ == "__main__":
-    extract_data()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Exporta a base de análise completa (viva + histórica).")
+    parser.add_argument("--formato", choices=["csv.gz", "parquet"], default="csv.gz")
+    parser.add_argument("--inicio", type=datetime.date.fromisoformat, help="data inicial (AAAA-MM-DD)")
+    parser.add_argument("--fim", type=datetime.date.fromisoformat, help="data final, inclusiva (AAAA-MM-DD)")
+    parser.add_argument("--pesquisas", type=lambda v: [int(s) for s in v.split(",") if s.strip()],
+                        help="survey_ids separados por vírgula")
+    parser.add_argument("--saida", type=Path, default=OUTPUT_PATH)
+    args = parser.parse_args()
+    extract_data(args.formato, args.inicio, args.fim, args.pesquisas, args.saida)
@@ -1,12 +1,15 @@
 # scripts/load_historical_data.py
-import pandas as pd
-import psycopg2
-import sys
-import numpy as np
+import argparse
 import datetime
-from psycopg2.extras import execute_values
+import hashlib
+import io
+import sys
 from pathlib import Path
 
+import numpy as np
+import pandas as pd
+import psycopg2
+
 # Adiciona o diretório raiz ao path para que possamos importar 'src'
 ROOT_DIR = Path(__file__).parent.parent
 sys.path.append(str(ROOT_DIR))
@@ -14,9 +17,10 @@ from src.data_processing import (  # noqa: E402
     categorize_generation, reclassificar_idade, classify_cidade,
     map_estado_to_regiao, map_uf_to_estado_nome, padronizar_resposta,
     calcular_media_faixa, classificar_faixa_antiga, map_renda_to_macro_faixa,
-    load_classification_rules, classify_income_by_rules, 
+    load_income_rules, apply_over_uniques,
     MAPA_INTENCAO_COMPRA, MAPA_TEMPO_INTENCAO
 )
+from src.date_parsing import HISTORICAL_FORMATS, format_date_report, parse_dates  # noqa: E402
 # Carregue suas credenciais (pode ser de um .env ou direto aqui para este script único)
 DB_HOST = "aws-0-us-east-2.pooler.supabase.com"
 DB_PORT = "6543"
@@ -24,224 +28,379 @@ DB_NAME = "postgres"
 DB_USER = "postgres.nscdlmklgfbkiqfakptp"
 DB_PASSWORD = "qI1guAb7RUvggOtv"
 
-# --- NOVA FUNÇÃO DE PARSING DE DATA ---
-def parse_flexible_date(date_obj):
+CSV_PATH = ROOT_DIR / "scripts" / "base2124_v24abr - Base.csv"
+HISTORICAL_TABLE = "analytics_respondents_historical"
+STAGING_TABLE = "analytics_respondents_historical_staging"
+RUNS_TABLE = "historical_etl_runs"
+CHUNK_SIZE = 50_000
+# Semente da imputação de datas de 2022: a mesma base gera sempre as mesmas datas,
+# então recarregar não altera linhas já gravadas.
+IMPUTATION_SEED = 2022
+# 'Código' sempre como texto: sem isso o pandas infere o tipo por bloco e um bloco com
+# um código vazio vira float ('104.0'), mudando a chave conforme o tamanho do bloco.
+# Vazios continuam nulos (NA padrão do read_csv) e são descartados no merge.
+CSV_DTYPES = {'Código': str}
+
+COLUMN_MAPPING = {
+    "Código": "respondent_id", "NomeEstudo": "research_name",
+    "Fim": "data_pesquisa", "FE2P5": "idade_original",
+    "FE2P10": "renda_texto_original", "Estado": "estado_original",
+    "Município": "cidade_original", "FE2P3": "genero",
+    "IC4P30": "intencao_compra_original",
+    "IC4P32": "tempo_intencao_original"
+}
+
+# Selecionar e ordenar colunas para corresponder à tabela do DB
+FINAL_COLS = [
+    'respondent_id', 'survey_id', 'research_name', 'data_pesquisa', 'idade_original', 'idade_numerica',
+    'geracao', 'faixa_etaria', 'renda_texto_original', 'renda_valor_estimado', 'renda_faixa_padronizada',
+    'renda_macro_faixa', 'renda_classe_agregada', 'renda_classe_detalhada', 'cidade_original', 'localidade',
+    'estado_original', 'estado_nome', 'regiao', 'intencao_compra_original', 'intencao_compra_padronizada',
+    'tempo_intencao_original', 'tempo_intencao_padronizado', 'genero', 'latitude', 'longitude',
+    'renda_regra_versao'
+]
+# Colunas INTEGER da tabela: o COPY não aceita '35.0' num inteiro
+INTEGER_COLS = ['survey_id', 'idade_numerica', 'renda_valor_estimado']
+KEY_COLS = ['respondent_id', 'survey_id']
+
+
+def file_md5(path: Path) -> str:
+    digest = hashlib.md5()
+    with open(path, 'rb') as f:
+        for bloco in iter(lambda: f.read(1 << 20), b''):
+            digest.update(bloco)
+    return digest.hexdigest()
+
+
+def scan_csv(csv_path: Path, chunksize: int) -> tuple[list, int]:
     """
-    Tenta converter um objeto para data de forma flexível.
-    Lida com strings, NaNs, e o texto '-'.
+    Pré-leitura só das colunas necessárias para decisões globais da base:
+    os nomes de estudo (para o survey_id) e quantas datas de 2022 precisam de imputação.
     """
-    if pd.isna(date_obj):
-        return pd.NaT
-    
-    # Converte para string e limpa espaços extras
-    date_str = str(date_obj).strip()
-    
-    if date_str in ('-', '', 'nan'):
-        return pd.NaT
-        
-    # Tenta o formato DD/MM/YYYY (comum no Brasil)
-    try:
-        return datetime.datetime.strptime(date_str, '%d/%m/%Y')
-    except ValueError:
-        pass
-        
-    # Tenta o formato MM/DD/YYYY (comum nos EUA)
-    try:
-        return datetime.datetime.strptime(date_str, '%m/%d/%Y')
-    except ValueError:
-        pass
-        
-    # Tenta deixar o Pandas inferir (pega formatos como YYYY-MM-DD)
-    try:
-        return pd.to_datetime(date_str)
-    except (ValueError, TypeError):
-        pass
-        
-    # Se nada funcionar, retorna Nulo
-    return pd.NaT
-
-def run_etl(load=True):
-    print("Iniciando processo de ETL para dados históricos...")
-    
-    # --- EXTRACT ---
-    print("1. Lendo o arquivo CSV...")
-    df = pd.read_csv("scripts/base2124_v24abr - Base.csv")
-    
-    # --- TRANSFORM ---
-    print("2. Transformando os dados...")
-
-    # Mapeamento de colunas (de-para)
-    print("   - Mapeando nomes de colunas...")
-    column_mapping = {
-        "Código": "respondent_id", "NomeEstudo": "research_name",
-        "Fim": "data_pesquisa", "FE2P5": "idade_original",
-        "FE2P10": "renda_texto_original", "Estado": "estado_original",
-        "Município": "cidade_original", "FE2P3": "genero",
-        "IC4P30": "intencao_compra_original",
-        "IC4P32": "tempo_intencao_original"
-    }
-    df.rename(columns=column_mapping, inplace=True)
-
-    # Criando 'survey_id' a partir do nome do estudo
-    print("   - Gerando survey_id a partir do nome do estudo...")
-    df['research_name'] = df['research_name'].astype('category')
-    df['survey_id'] = df['research_name'].cat.codes + 1000
-
-    # --- NOVA LÓGICA DE IMPUTAÇÃO (VERSÃO 3.0 - DISTRIBUIÇÃO MENSAL) ---
-    print("   - Iniciando imputação com DISTRIBUIÇÃO MENSAL para registros de 2022...")
-    
+    nomes = set()
+    n_imputar = 0
+    for chunk in pd.read_csv(csv_path, usecols=['NomeEstudo', 'Fim', 'ano_pesquisa'], chunksize=chunksize):
+        nomes.update(chunk['NomeEstudo'].dropna().unique())
+        n_imputar += int(((chunk['Fim'] == '-') & (chunk['ano_pesquisa'] == 2022)).sum())
+    return sorted(nomes), n_imputar
+
+
+def build_survey_id_map(nomes: list, existentes: dict | None = None) -> dict:
+    """
+    research_name -> survey_id. Estudos já carregados mantêm o id gravado; os novos
+    recebem ids sequenciais a partir de 1000 (ordem alfabética, como os códigos de
+    categoria usados antes), depois do maior id existente.
+    """
+    mapa = dict(existentes or {})
+    proximo = max([999] + list(mapa.values())) + 1
+    for nome in nomes:
+        if nome not in mapa:
+            mapa[nome] = proximo
+            proximo += 1
+    return mapa
+
+
+def generate_imputed_dates(num_registros: int, seed: int = IMPUTATION_SEED) -> np.ndarray:
+    """Datas de dias úteis de 2022, distribuídas igualmente entre os meses e embaralhadas."""
+    rng = np.random.default_rng(seed)
+    # 1. Calcula a distribuição base por mês
+    registros_por_mes = num_registros // 12
+    registros_restantes = num_registros % 12
+
+    datas_imputadas_final = []
+    # 2. Itera sobre cada mês de 2022
+    for mes in range(1, 13):
+        # Adiciona 1 aos primeiros meses para distribuir o resto
+        num_neste_mes = registros_por_mes + (1 if mes <= registros_restantes else 0)
+
+        # Pega o primeiro e o último dia do mês
+        primeiro_dia = datetime.date(2022, mes, 1)
+        ultimo_dia_mes = (datetime.date(2022, mes % 12 + 1, 1) - datetime.timedelta(days=1)) if mes < 12 else datetime.date(2022, 12, 31)
+
+        # Gera uma lista de dias úteis para aquele mês
+        dias_uteis_no_mes = pd.bdate_range(start=primeiro_dia, end=ultimo_dia_mes)
+
+        if not dias_uteis_no_mes.empty:
+            # 3. Sorteia N datas dentro dos dias úteis do mês
+            datas_imputadas_final.extend(rng.choice(dias_uteis_no_mes.values, size=num_neste_mes, replace=True))
+
+    # 4. Embaralha a lista final
+    datas = np.array(datas_imputadas_final, dtype='datetime64[ns]')
+    rng.shuffle(datas)
+    return datas
+
+
+def transform_chunk(df: pd.DataFrame, survey_ids: dict, datas_imputadas: np.ndarray,
+                    regras_de_renda) -> tuple[pd.DataFrame, dict, int]:
+    """
+    Transforma um bloco do CSV com os helpers vetorizados compartilhados.
+
+    Returns:
+        (df_final, relatorio_datas, datas_consumidas): datas_consumidas é quantas
+        datas imputadas o bloco usou, para o próximo bloco continuar de onde parou.
+    """
+    df = df.rename(columns=COLUMN_MAPPING)
+    codigos = df['respondent_id'].str.strip()
+    df['respondent_id'] = codigos.where(codigos != '')
+
+    # survey_id estável entre blocos e execuções (ver build_survey_id_map)
+    df['survey_id'] = df['research_name'].map(survey_ids).fillna(999).astype(int)
+
+    # Imputação das datas de 2022 ausentes ('-'), consumindo a sequência pré-sorteada
     mask_problema = (df['data_pesquisa'] == '-') & (df['ano_pesquisa'] == 2022)
-    registros_para_imputar = df[mask_problema]
-    num_registros = len(registros_para_imputar)
-    
-    if num_registros > 0:
-        print(f"   - Encontrados {num_registros} registros de 2022 sem data para imputar.")
-        
-        # 1. Calcula a distribuição base por mês
-        registros_por_mes = num_registros // 12
-        registros_restantes = num_registros % 12
-        
-        datas_imputadas_final = []
-        
-        # 2. Itera sobre cada mês de 2022
-        for mes in range(1, 13):
-            # Adiciona 1 aos primeiros meses para distribuir o resto
-            num_neste_mes = registros_por_mes + (1 if mes <= registros_restantes else 0)
-            
-            # Pega o primeiro e o último dia do mês
-            primeiro_dia = datetime.date(2022, mes, 1)
-            ultimo_dia_mes = (datetime.date(2022, mes % 12 + 1, 1) - datetime.timedelta(days=1)) if mes < 12 else datetime.date(2022, 12, 31)
-            
-            # Gera uma lista de dias úteis para aquele mês
-            dias_uteis_no_mes = pd.bdate_range(start=primeiro_dia, end=ultimo_dia_mes)
-            
-            if not dias_uteis_no_mes.empty:
-                # 3. Sorteia N datas dentro dos dias úteis do mês
-                datas_sorteadas = np.random.choice(dias_uteis_no_mes, size=num_neste_mes, replace=True)
-                datas_imputadas_final.extend(datas_sorteadas)
-
-        # 4. Embaralha a lista final e atribui aos registros
-        np.random.shuffle(datas_imputadas_final)
-        df.loc[mask_problema, 'data_pesquisa'] = datas_imputadas_final
-
-        print(f"   - Imputação de {len(datas_imputadas_final)} datas distribuídas mensalmente concluída.")
-
-    else:
-        print("   - Nenhum registro de 2022 com data ausente ('-') encontrado.")
-
-    print("   - Processando e padronizando colunas...")
-    # SUBSTITUÍDO: Usando a nova função de conversão robusta
-    print("   - Convertendo datas com a nova função flexível...")
-    df['data_pesquisa'] = df['data_pesquisa'].apply(parse_flexible_date)
+    n_bloco = int(mask_problema.sum())
+    if n_bloco:
+        df['data_pesquisa'] = df['data_pesquisa'].astype(object)
+        df.loc[mask_problema, 'data_pesquisa'] = pd.Series(
+            list(datas_imputadas[:n_bloco]), index=df.index[mask_problema], dtype=object)
+
+    # Conversão vetorizada: DD/MM/YYYY, depois MM/DD/YYYY e, por fim, inferência (ver src/date_parsing.py)
+    df['data_pesquisa'], relatorio_datas = parse_dates(df['data_pesquisa'], HISTORICAL_FORMATS)
 
     # Criando colunas derivadas (usando nossas funções existentes)
-    print("   - Processando e padronizando colunas...")
-    df['data_pesquisa'] = pd.to_datetime(df['data_pesquisa'], errors='coerce', format='%m/%d/%Y')
     df['idade_numerica'] = pd.to_numeric(df['idade_original'], errors='coerce')
-    df['geracao'] = df['idade_numerica'].apply(categorize_generation)  # noqa: F405
-    df['faixa_etaria'] = df['idade_numerica'].apply(reclassificar_idade)
-    df['regiao'] = df['estado_original'].apply(map_estado_to_regiao)
-    df['estado_nome'] = df['estado_original'].apply(map_uf_to_estado_nome)
-    df['localidade'] = df['cidade_original'].apply(classify_cidade)
-
-    # --- BLOCO DE TRANSFORMAÇÃO CORRIGIDO E COMPLETO ---
+    df['geracao'] = apply_over_uniques(df['idade_numerica'], categorize_generation)
+    df['faixa_etaria'] = apply_over_uniques(df['idade_numerica'], reclassificar_idade)
+    df['regiao'] = apply_over_uniques(df['estado_original'], map_estado_to_regiao)
+    df['estado_nome'] = apply_over_uniques(df['estado_original'], map_uf_to_estado_nome)
+    df['localidade'] = apply_over_uniques(df['cidade_original'], classify_cidade)
 
-    # 1. Padrão de Intenção de Compra (que estava faltando)
-    df['intencao_compra_padronizada'] = df['intencao_compra_original'].apply(lambda x: padronizar_resposta(x, MAPA_INTENCAO_COMPRA))
-    df['tempo_intencao_padronizado'] = df['tempo_intencao_original'].apply(lambda x: padronizar_resposta(x, MAPA_TEMPO_INTENCAO))
+    # 1. Padrão de Intenção de Compra
+    df['intencao_compra_padronizada'] = apply_over_uniques(df['intencao_compra_original'], lambda x: padronizar_resposta(x, MAPA_INTENCAO_COMPRA))
+    df['tempo_intencao_padronizado'] = apply_over_uniques(df['tempo_intencao_original'], lambda x: padronizar_resposta(x, MAPA_TEMPO_INTENCAO))
 
     # 2. Padrão de Renda (agora incluindo TODAS as colunas)
-    df['renda_valor_estimado'] = df['renda_texto_original'].apply(calcular_media_faixa)
-    df['renda_faixa_padronizada'] = df['renda_valor_estimado'].apply(classificar_faixa_antiga)
-    df['renda_macro_faixa'] = df['renda_faixa_padronizada'].apply(map_renda_to_macro_faixa)
-
-    # Carrega as regras de classificação para usar na próxima etapa
-    regras_de_renda = load_classification_rules()
-    # Aplica a nova função de classificação baseada em regras e data
-    resultados_renda = df.apply(lambda row: classify_income_by_rules(
-        row['renda_valor_estimado'], row['data_pesquisa'], regras_de_renda),
-        axis=1)
-    df[['renda_classe_agregada', 'renda_classe_detalhada']] = pd.DataFrame(resultados_renda.tolist(), index=df.index)
+    df['renda_valor_estimado'] = apply_over_uniques(df['renda_texto_original'], calcular_media_faixa)
+    df['renda_faixa_padronizada'] = apply_over_uniques(df['renda_valor_estimado'], classificar_faixa_antiga)
+    df['renda_macro_faixa'] = apply_over_uniques(df['renda_faixa_padronizada'], map_renda_to_macro_faixa)
+
+    # Classificação baseada em regras e data, registrando a versão da regra usada
+    df[['renda_classe_agregada', 'renda_classe_detalhada', 'renda_regra_versao']] = regras_de_renda.classify(
+        df['renda_valor_estimado'], df['data_pesquisa'])
 
     # 3. Preenchendo colunas restantes que não temos no CSV
     for col in ['latitude', 'longitude']:
         if col not in df.columns:
             df[col] = None
 
-    # Selecionar e ordenar colunas para corresponder à tabela do DB
-    final_cols = [
-        'respondent_id', 'survey_id', 'research_name', 'data_pesquisa', 'idade_original', 'idade_numerica',
-        'geracao', 'faixa_etaria', 'renda_texto_original', 'renda_valor_estimado', 'renda_faixa_padronizada',
-        'renda_macro_faixa', 'renda_classe_agregada', 'renda_classe_detalhada', 'cidade_original', 'localidade',
-        'estado_original', 'estado_nome', 'regiao', 'intencao_compra_original', 'intencao_compra_padronizada',
-        'tempo_intencao_original', 'tempo_intencao_padronizado', 'genero', 'latitude', 'longitude'
-    ]
-    df_final = df[final_cols]
-    
-    # --- LOAD ---
-    df_final = df_final.astype(object).where(pd.notna(df_final), None)
-    print("   - Transformação concluída.\n")
-
-    print("\n--- RELATÓRIO DE QUALIDADE (Valores Nulos) ---")
-    null_counts = df_final.isnull().sum()
-    null_counts = null_counts[null_counts > 0].sort_values(ascending=False)
-    
-    if not null_counts.empty:
-        print("   - Contagem de valores nulos por coluna (apenas colunas com nulos):")
-        # Imprime o dataframe de nulos como uma string formatada
-        print(null_counts.to_string())
-    else:
-        print("   - Ótima notícia! Nenhuma coluna possui valores nulos após a transformação.")
-
-
-    print("\n--- RELATÓRIO DE DISTRIBUIÇÃO TEMPORAL ---")
-    # Filtra apenas os registros que têm uma data válida após o processamento
-    df_dates = df_final.dropna(subset=['data_pesquisa']).copy()
-    
-    if not df_dates.empty:
-        df_dates['data_pesquisa'] = pd.to_datetime(df_dates['data_pesquisa'])
-        
-        print("\n   - Contagem de coletas por Ano:")
-        yearly_counts = df_dates['data_pesquisa'].dt.year.value_counts().sort_index()
-        print(yearly_counts.to_string())
-        
-        print("\n   - Contagem de coletas por Trimestre:")
-        quarterly_counts = df_dates['data_pesquisa'].dt.to_period('Q').value_counts().sort_index()
-        print(quarterly_counts.to_string())
-
-        print("\n   - Contagem de coletas por Mês:")
-        monthly_counts = df_dates['data_pesquisa'].dt.to_period('M').value_counts().sort_index()
-        print(monthly_counts.to_string())
-    else:
-        print("   - Nenhuma data válida encontrada para gerar o relatório de distribuição.")
-
-
-
-    print("\n--- FASE DE CARGA ---")
-    if not load:
-        print("\nInterrompida | Cenário de análise")
-    
-    else:
-        print(f"3. Carregando {len(df_final)} registros para o banco de dados...")
+    df_final = df[FINAL_COLS].copy()
+    for col in INTEGER_COLS:
+        df_final[col] = pd.to_numeric(df_final[col], errors='coerce').round().astype('Int64')
+    return df_final, relatorio_datas, n_bloco
+
+
+class EtlReport:
+    """Acumula, bloco a bloco, os relatórios de qualidade e de distribuição temporal."""
+
+    def __init__(self):
+        self.linhas = 0
+        self.nulos = pd.Series(dtype='int64')
+        self.datas = {}
+        self.por_ano = pd.Series(dtype='int64')
+        self.por_trimestre = pd.Series(dtype='int64')
+        self.por_mes = pd.Series(dtype='int64')
+
+    def add(self, df_final: pd.DataFrame, relatorio_datas: dict):
+        self.linhas += len(df_final)
+        self.nulos = self.nulos.add(df_final.isnull().sum(), fill_value=0)
+        for etapa, total in relatorio_datas.items():
+            self.datas[etapa] = self.datas.get(etapa, 0) + total
+        datas = df_final['data_pesquisa'].dropna()
+        self.por_ano = self.por_ano.add(datas.dt.year.value_counts(), fill_value=0)
+        self.por_trimestre = self.por_trimestre.add(datas.dt.to_period('Q').value_counts(), fill_value=0)
+        self.por_mes = self.por_mes.add(datas.dt.to_period('M').value_counts(), fill_value=0)
+
+    def print(self):
+        print("   - Conversão de datas (linhas por formato):")
+        print("     " + format_date_report(self.datas).replace("\n", "\n     "))
+
+        print("\n--- RELATÓRIO DE QUALIDADE (Valores Nulos) ---")
+        null_counts = self.nulos[self.nulos > 0].astype(int).sort_values(ascending=False)
+        if not null_counts.empty:
+            print("   - Contagem de valores nulos por coluna (apenas colunas com nulos):")
+            print(null_counts.to_string())
+        else:
+            print("   - Ótima notícia! Nenhuma coluna possui valores nulos após a transformação.")
+
+        print("\n--- RELATÓRIO DE DISTRIBUIÇÃO TEMPORAL ---")
+        if not self.por_ano.empty:
+            print("\n   - Contagem de coletas por Ano:")
+            print(self.por_ano.astype(int).sort_index().to_string())
+            print("\n   - Contagem de coletas por Trimestre:")
+            print(self.por_trimestre.astype(int).sort_index().to_string())
+            print("\n   - Contagem de coletas por Mês:")
+            print(self.por_mes.astype(int).sort_index().to_string())
+        else:
+            print("   - Nenhuma data válida encontrada para gerar o relatório de distribuição.")
+
+
+# --- CARGA: staging via COPY + merge atômico ---
+
+def ensure_historical_schema(cursor):
+    """
+    Garante a tabela histórica (mesmas colunas, na mesma ordem, da tabela viva, para
+    o 'UNION ALL' de get_analytics_data), a chave primária (respondent_id, survey_id)
+    e o log de cargas. Tabelas antigas sem chave têm as duplicatas de recargas removidas.
+    """
+    cursor.execute(f"CREATE TABLE IF NOT EXISTS {HISTORICAL_TABLE} (LIKE analytics_respondents INCLUDING DEFAULTS);")
+    cursor.execute(f"ALTER TABLE {HISTORICAL_TABLE} ADD COLUMN IF NOT EXISTS renda_regra_versao TEXT;")
+    cursor.execute(
+        "SELECT 1 FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'p';",
+        (HISTORICAL_TABLE,))
+    if cursor.fetchone() is None:
+        cursor.execute(f"""
+            DELETE FROM {HISTORICAL_TABLE} a
+            USING {HISTORICAL_TABLE} b
+            WHERE a.respondent_id = b.respondent_id
+              AND a.survey_id = b.survey_id
+              AND a.ctid < b.ctid;
+        """)
+        if cursor.rowcount:
+            print(f"   - {cursor.rowcount} linhas duplicadas de cargas anteriores removidas.")
+        cursor.execute(f"DELETE FROM {HISTORICAL_TABLE} WHERE respondent_id IS NULL OR survey_id IS NULL;")
+        cursor.execute(f"ALTER TABLE {HISTORICAL_TABLE} ADD PRIMARY KEY (respondent_id, survey_id);")
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {RUNS_TABLE} (
+            file_hash TEXT PRIMARY KEY,
+            file_name TEXT,
+            rows_loaded INTEGER,
+            loaded_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+        );
+    """)
+
+
+def get_existing_survey_ids(cursor) -> dict:
+    cursor.execute(f"""
+        SELECT research_name, MIN(survey_id) FROM {HISTORICAL_TABLE}
+        WHERE research_name IS NOT NULL GROUP BY research_name;
+    """)
+    return dict(cursor.fetchall())
+
+
+def copy_chunk(cursor, df_final: pd.DataFrame):
+    """Envia o bloco para a staging via COPY (CSV em memória, '\\N' como nulo)."""
+    buffer = io.StringIO()
+    df_final.to_csv(buffer, index=False, header=False, na_rep='\\N')
+    buffer.seek(0)
+    cols_sql = ','.join(f'"{c}"' for c in df_final.columns)
+    cursor.copy_expert(
+        f"COPY {STAGING_TABLE} ({cols_sql}) FROM STDIN WITH (FORMAT csv, NULL '\\N')", buffer)
+
+
+def merge_staging(cursor) -> int:
+    """
+    Upsert da staging na tabela histórica pela chave primária. Linhas sem chave são
+    descartadas e, entre duplicatas da mesma chave, vale a última do arquivo. Linhas
+    idênticas às já gravadas não são reescritas. Retorna o número de linhas inseridas ou alteradas.
+    """
+    cols_sql = ', '.join(f'"{c}"' for c in FINAL_COLS)
+    update_cols = [c for c in FINAL_COLS if c not in KEY_COLS]
+    set_sql = ', '.join(f'"{c}" = EXCLUDED."{c}"' for c in update_cols)
+    atual = ', '.join(f'h."{c}"' for c in update_cols)
+    novo = ', '.join(f'EXCLUDED."{c}"' for c in update_cols)
+    cursor.execute(f"""
+        INSERT INTO {HISTORICAL_TABLE} AS h ({cols_sql})
+        SELECT DISTINCT ON (respondent_id, survey_id) {cols_sql}
+        FROM {STAGING_TABLE}
+        WHERE respondent_id IS NOT NULL AND survey_id IS NOT NULL
+        ORDER BY respondent_id, survey_id, staging_ordem DESC
+        ON CONFLICT (respondent_id, survey_id) DO UPDATE SET {set_sql}
+        WHERE ({atual}) IS DISTINCT FROM ({novo});
+    """)
+    return cursor.rowcount
+
+
+def run_etl(load=True, csv_path: Path = CSV_PATH, chunksize: int = CHUNK_SIZE, force: bool = False):
+    """
+    ETL da base histórica em blocos: pré-leitura das decisões globais, transformação
+    bloco a bloco e, com 'load', COPY de cada bloco para uma staging temporária e merge
+    na tabela histórica, tudo numa única transação (uma falha não deixa carga parcial).
+    Um arquivo já carregado (mesmo hash) é ignorado, a menos que 'force' seja usado.
+    """
+    print("Iniciando processo de ETL para dados históricos...")
+    csv_path = Path(csv_path)
+    regras_de_renda = load_income_rules()
+    if regras_de_renda is None:
+        print("❌ Regras de classificação de renda ausentes ou inválidas. Abortando.")
+        return
+
+    conn = cursor = None
+    existentes = {}
+    if load:
+        file_hash = file_md5(csv_path)
         conn = psycopg2.connect(host=DB_HOST, port=DB_PORT, dbname=DB_NAME, user=DB_USER, password=DB_PASSWORD)
         cursor = conn.cursor()
-    
-        try:
-            # Usando execute_values para uma inserção em massa de alta performance
-            values = [tuple(row) for row in df_final.to_numpy()]
-            cols_sql = ','.join(f'"{c}"' for c in df_final.columns)
-            
-            query = f"INSERT INTO analytics_respondents_historical ({cols_sql}) VALUES %s"
-            execute_values(cursor, query, values)
-            
-            conn.commit()
-            print(f"✅ Sucesso! {cursor.rowcount} registros inseridos em 'analytics_respondents_historical'.")
-        except Exception as e:
+        ensure_historical_schema(cursor)
+        conn.commit()
+        cursor.execute(f"SELECT loaded_at, rows_loaded FROM {RUNS_TABLE} WHERE file_hash = %s;", (file_hash,))
+        carga_anterior = cursor.fetchone()
+        if carga_anterior and not force:
+            print(f"✅ Arquivo já carregado em {carga_anterior[0]:%d/%m/%Y %H:%M} ({carga_anterior[1]} linhas). "
+                  "Nada a fazer (use --forcar para recarregar).")
+            cursor.close()
+            conn.close()
+            return
+        existentes = get_existing_survey_ids(cursor)
+
+    try:
+        # --- EXTRACT (pré-leitura) ---
+        print("1. Pré-lendo estudos e datas ausentes...")
+        nomes, n_imputar = scan_csv(csv_path, chunksize)
+        survey_ids = build_survey_id_map(nomes, existentes)
+        datas_imputadas = generate_imputed_dates(n_imputar)
+        print(f"   - {len(nomes)} estudos; {n_imputar} registros de 2022 sem data serão imputados (distribuição mensal).")
+
+        if load:
+            # Sem restrições (CTAS não copia NOT NULL/chave): uma linha sem 'Código' não derruba o
+            # COPY, é descartada no merge. 'staging_ordem' guarda a ordem do arquivo para o desempate.
+            cursor.execute(f"CREATE TEMP TABLE {STAGING_TABLE} ON COMMIT DROP AS "
+                           f"SELECT * FROM {HISTORICAL_TABLE} WITH NO DATA;")
+            cursor.execute(f"ALTER TABLE {STAGING_TABLE} ADD COLUMN staging_ordem BIGSERIAL;")
+
+        # --- TRANSFORM (+ COPY) bloco a bloco ---
+        print(f"2. Transformando os dados em blocos de {chunksize} linhas...")
+        relatorio = EtlReport()
+        consumidas = 0
+        for i, chunk in enumerate(pd.read_csv(csv_path, chunksize=chunksize, dtype=CSV_DTYPES)):
+            df_final, relatorio_datas, usadas = transform_chunk(
+                chunk, survey_ids, datas_imputadas[consumidas:], regras_de_renda)
+            consumidas += usadas
+            relatorio.add(df_final, relatorio_datas)
+            if load:
+                copy_chunk(cursor, df_final)
+            print(f"   - Bloco {i + 1}: {len(df_final)} linhas ({relatorio.linhas} no total).")
+        print("   - Transformação concluída.\n")
+        relatorio.print()
+
+        # --- LOAD ---
+        print("\n--- FASE DE CARGA ---")
+        if not load:
+            print("\nInterrompida | Cenário de análise")
+            return
+        print(f"3. Mesclando {relatorio.linhas} registros em '{HISTORICAL_TABLE}'...")
+        alteradas = merge_staging(cursor)
+        cursor.execute(f"""
+            INSERT INTO {RUNS_TABLE} (file_hash, file_name, rows_loaded) VALUES (%s, %s, %s)
+            ON CONFLICT (file_hash) DO UPDATE SET rows_loaded = EXCLUDED.rows_loaded, loaded_at = CURRENT_TIMESTAMP;
+        """, (file_hash, csv_path.name, relatorio.linhas))
+        conn.commit()
+        print(f"✅ Sucesso! {alteradas} registros inseridos/atualizados em '{HISTORICAL_TABLE}' "
+              f"({relatorio.linhas - alteradas} já estavam iguais).")
+    except Exception as e:
+        if conn is not None:
             conn.rollback()
-            print(f"❌ Erro ao carregar dados: {e}")
-        finally:
+        print(f"❌ Erro no ETL (nenhuma alteração foi gravada): {e}")
+    finally:
+        if conn is not None:
             cursor.close()
             conn.close()
 
+
 if __name__ == "__main__":
-    run_etl()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="ETL da base histórica 2021-24 para 'analytics_respondents_historical'.")
+    parser.add_argument("--csv", type=Path, default=CSV_PATH)
+    parser.add_argument("--bloco", type=int, default=CHUNK_SIZE, help="linhas por bloco")
+    parser.add_argument("--sem-carga", action="store_true", help="só transforma e imprime os relatórios")
+    parser.add_argument("--forcar", action="store_true", help="recarrega mesmo se o arquivo já foi carregado")
+    args = parser.parse_args()
+    run_etl(load=not args.sem_carga, csv_path=args.csv, chunksize=args.bloco, force=args.forcar)
@@ -0,0 +1,129 @@
+# src/analytics_schema.py
+"""
+Tipos declarados das colunas da base de análise (analytics_respondents +
+analytics_respondents_historical), aplicados em 'get_analytics_data'.
+
+Sem eles, cada coluna de texto chega do banco como uma string Python por linha e
+as colunas NUMERIC (latitude/longitude) como objetos Decimal. Quase todas as
+colunas de texto são rótulos de poucos valores distintos (região, geração,
+classes de renda...), então viram 'category'; números inteiros viram inteiros
+anuláveis do menor tamanho que comporta os valores e as coordenadas, float64.
+As coordenadas não vão para float32: a base segue para os exportadores
+(src/export.py), que escreveriam o valor float32 pela representação em float64
+(1.1 viraria 1.100000023841858).
+
+Colunas fora do esquema são mantidas como vieram.
+
+Relatório de memória (antes/depois, por coluna):
+    df_tipado = apply_analytics_schema(df)
+    print(format_memory_report(memory_report(df, df_tipado)))
+"""
+import logging
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+CATEGORY = "category"
+
+ANALYTICS_SCHEMA: dict[str, str] = {
+    # Chave: alta cardinalidade, fica como texto
+    "respondent_id": "str",
+    "survey_id": "Int32",
+    "research_name": CATEGORY,
+    "data_pesquisa": "datetime64[ns]",
+    "idade_original": CATEGORY,
+    "idade_numerica": "Int16",
+    "geracao": CATEGORY,
+    "faixa_etaria": CATEGORY,
+    "renda_texto_original": CATEGORY,
+    "renda_valor_estimado": "Int32",
+    "renda_faixa_padronizada": CATEGORY,
+    "renda_macro_faixa": CATEGORY,
+    "renda_classe_agregada": CATEGORY,
+    "renda_classe_detalhada": CATEGORY,
+    "renda_regra_versao": CATEGORY,
+    "cidade_original": CATEGORY,
+    "localidade": CATEGORY,
+    "estado_original": CATEGORY,
+    "estado_nome": CATEGORY,
+    "regiao": CATEGORY,
+    "intencao_compra_original": CATEGORY,
+    "intencao_compra_padronizada": CATEGORY,
+    "tempo_intencao_original": CATEGORY,
+    "tempo_intencao_padronizado": CATEGORY,
+    "genero": CATEGORY,
+    "latitude": "float64",
+    "longitude": "float64",
+}
+
+
+def _already_typed(series: pd.Series, dtype: str) -> bool:
+    if dtype.startswith("datetime64"):
+        # Qualquer resolução serve (o driver pode entregar em microssegundos)
+        return pd.api.types.is_datetime64_any_dtype(series)
+    return str(series.dtype) == dtype
+
+
+def _convert(series: pd.Series, dtype: str) -> pd.Series:
+    if dtype == CATEGORY:
+        # Categorias em ordem alfabética: ordenações e gráficos ficam como com texto
+        return series.astype("str").where(series.notna()).astype(CATEGORY)
+    if dtype == "str":
+        return series.astype("str").where(series.notna())
+    if dtype.startswith("datetime64"):
+        return pd.to_datetime(series, errors="coerce").astype(dtype)
+    # Numéricos: Decimal/objeto -> número; fora da faixa ou não numérico vira nulo
+    numeric = pd.to_numeric(series, errors="coerce")
+    if dtype.startswith("Int"):
+        info = np.iinfo(dtype.lower())
+        numeric = numeric.where(numeric.between(info.min, info.max)).round()
+    return numeric.astype(dtype)
+
+
+def apply_analytics_schema(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Converte as colunas conhecidas para os tipos de ANALYTICS_SCHEMA.
+    Uma coluna que não puder ser convertida fica como veio (e o motivo vai para o log).
+    """
+    if df.empty:
+        return df
+    converted = {}
+    for column, dtype in ANALYTICS_SCHEMA.items():
+        if column not in df.columns or _already_typed(df[column], dtype):
+            continue
+        try:
+            converted[column] = _convert(df[column], dtype)
+        except (TypeError, ValueError) as e:
+            logger.warning("Coluna '%s' mantida como %s (conversão para %s falhou: %s)",
+                           column, df[column].dtype, dtype, e)
+    if not converted:
+        return df
+    return df.assign(**converted)
+
+
+def memory_report(before: pd.DataFrame, after: pd.DataFrame) -> pd.DataFrame:
+    """
+    Memória por coluna (memory_usage(deep=True)) antes e depois da tipagem,
+    com uma linha final 'TOTAL' (incluindo o índice).
+    """
+    antes = before.memory_usage(deep=True)
+    depois = after.memory_usage(deep=True).reindex(antes.index)
+    report = pd.DataFrame({
+        "dtype_antes": before.dtypes.astype(str).reindex(antes.index).fillna(""),
+        "dtype_depois": after.dtypes.astype(str).reindex(antes.index).fillna(""),
+        "mb_antes": antes / 1024 ** 2,
+        "mb_depois": depois / 1024 ** 2,
+    })
+    report.loc["TOTAL"] = ["", "", report["mb_antes"].sum(), report["mb_depois"].sum()]
+    report["reducao"] = report["mb_antes"] / report["mb_depois"]
+    return report.rename_axis("coluna")
+
+
+def format_memory_report(report: pd.DataFrame) -> str:
+    return report.to_string(formatters={
+        "mb_antes": "{:.2f}".format,
+        "mb_depois": "{:.2f}".format,
+        "reducao": "{:.1f}x".format,
+    })
@@ -0,0 +1,223 @@
+# src/area_categorization.py
+"""
+Categorização das respostas de áreas comuns (APAC9P85_1..5) com cache persistente.
+
+O mapeamento texto normalizado -> categoria é estável entre execuções, então fica
+guardado (no banco, tabela 'area_categorization_cache') sob uma chave de versão
+que muda sempre que as regras, os protótipos ou a configuração do vetorizador mudam.
+A cada exportação, só os textos nunca vistos são categorizados, em um único lote
+para todas as colunas, contra uma matriz de protótipos ajustada uma única vez.
+"""
+import hashlib
+import json
+import math
+import re
+import unicodedata
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+from src.data_processing import (
+    AREA_COMUM_CATEGORIAS_ALVO,
+    AREA_MAPA_EXATO,
+    AREA_REGRAS_POR_TERMO,
+    _normalizar_texto_area,
+    categorizar_area_comum,
+)
+
+try:
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    SKLEARN_AVAILABLE = True
+except Exception:
+    SKLEARN_AVAILABLE = False
+
+
+AREA_CATEGORY_PROTOTYPES = {
+    "Áreas Aquáticas | Piscinas": "piscina adulto infantil deck raia solario",
+    "Atividade Física | Academias": "academia fitness musculacao pilates treino",
+    "Serviço": "lavanderia coworking minimercado minimarket mini market restaurante bar bar molhado mercado autonomo pub portaria espaco delivery espaco beleza lounge louge car wash",
+    "Convivência | Ambientes fechados": "salao de festas espaco gourmet sala de jogos brinquedoteca",
+    "Infraestrutura Pet": "pet place pet care dog wash espaco pet",
+    "Áreas Infantis & Familiares": "playground parquinho praca infantil familia criancas",
+    "Convivência | Churrasqueiras": "churrasqueira grill barbecue espaco churrasco",
+    "Atividade Física | Quadras": "quadra poliesportiva beach tenis tenis futsal",
+    "Atividade Física | Caminhada e Ciclovia": "pista caminhada ciclovia corrida cooper bicicletario",
+    "Convivência | Ambientes abertos": "rooftop praca de eventos ambiente externo jardim redario",
+    "Áreas Aquáticas | Sauna e SPA": "sauna spa hidromassagem ofuro relaxamento",
+}
+
+VECTORIZER_PARAMS = {
+    "analyzer": "char_wb",
+    "ngram_range": (3, 5),
+    "min_df": 1,
+    "max_features": 12000,
+}
+
+SEMANTIC_MIN_SCORE = 0.12
+
+# Revisão manual da lógica de 'categorizar_area_comum'. As tabelas de regras já entram
+# na chave de versão; incremente só ao mudar o código que as aplica.
+AREA_RULES_REVISION = 1
+
+
+def _build_version_key() -> str:
+    payload = json.dumps(
+        {
+            "regras": AREA_RULES_REVISION,
+            "mapa_exato": AREA_MAPA_EXATO,
+            "regras_por_termo": AREA_REGRAS_POR_TERMO,
+            "categorias": AREA_COMUM_CATEGORIAS_ALVO,
+            "prototipos": AREA_CATEGORY_PROTOTYPES,
+            "vetorizador": VECTORIZER_PARAMS,
+            "min_score": SEMANTIC_MIN_SCORE,
+            "semantico": SKLEARN_AVAILABLE,
+        },
+        sort_keys=True,
+        ensure_ascii=False,
+        default=list,
+    )
+    return "v1-" + hashlib.md5(payload.encode("utf-8")).hexdigest()[:12]
+
+
+AREA_CATEGORIZATION_VERSION = _build_version_key()
+
+
+def normalize_semantic_text(text: str) -> str:
+    if not isinstance(text, str):
+        return ""
+    text = ''.join(
+        c for c in unicodedata.normalize('NFD', text)
+        if unicodedata.category(c) != 'Mn'
+    ).lower()
+    text = re.sub(r'[^a-z0-9\s]', ' ', text)
+    text = re.sub(r'\s+', ' ', text).strip()
+    return text
+
+
+class _PrototypeMatcher:
+    """
+    Vetorizador TF-IDF de n-gramas de caracteres ajustado uma única vez sobre os
+    protótipos. N-gramas fora do vocabulário não pontuam, mas continuam contando
+    na norma do texto (com o maior IDF), para não inflar a similaridade.
+    """
+
+    def __init__(self):
+        self.categories = [
+            c for c in AREA_CATEGORY_PROTOTYPES if c in set(AREA_COMUM_CATEGORIAS_ALVO)
+        ]
+        prototype_texts = [
+            normalize_semantic_text(AREA_CATEGORY_PROTOTYPES[c]) for c in self.categories
+        ]
+        self.vectorizer = TfidfVectorizer(norm=None, **VECTORIZER_PARAMS)
+        proto = self.vectorizer.fit_transform(prototype_texts).toarray()
+        norms = np.linalg.norm(proto, axis=1, keepdims=True)
+        self.prototypes = proto / np.where(norms > 0, norms, 1.0)
+        self.analyzer = self.vectorizer.build_analyzer()
+        self.vocabulary = self.vectorizer.vocabulary_
+        self.oov_idf = float(self.vectorizer.idf_.max())
+
+    def best_match(self, texts: list[str]) -> tuple[list[str], np.ndarray]:
+        matrix = self.vectorizer.transform(texts)
+        dots = np.asarray(matrix @ self.prototypes.T)
+        full_norms = np.empty(len(texts))
+        for i, text in enumerate(texts):
+            counts = Counter(self.analyzer(text))
+            in_vocab_sq = float(matrix[i].multiply(matrix[i]).sum())
+            oov_sq = sum((tf * self.oov_idf) ** 2 for gram, tf in counts.items()
+                         if gram not in self.vocabulary)
+            full_norms[i] = math.sqrt(in_vocab_sq + oov_sq)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            similarity = np.where(full_norms[:, None] > 0,
+                                  dots / full_norms[:, None], 0.0)
+        best_idx = similarity.argmax(axis=1)
+        best_score = similarity.max(axis=1)
+        return [self.categories[i] for i in best_idx], best_score
+
+
+_MATCHER: _PrototypeMatcher | None = None
+_CACHE_IN_MEMORY: dict[str, dict[str, str]] = {}
+
+
+def _get_matcher() -> _PrototypeMatcher:
+    global _MATCHER
+    if _MATCHER is None:
+        _MATCHER = _PrototypeMatcher()
+    return _MATCHER
+
+
+def categorize_new_texts(normalized_texts: list[str]) -> dict[str, tuple[str, float | None]]:
+    """
+    Categoriza, em lote, textos já normalizados (via '_normalizar_texto_area'):
+    regras explícitas primeiro e, para os que caírem em 'Outros', a similaridade
+    com os protótipos.
+
+    Returns:
+        dict: texto_normalizado -> (categoria, score_semantico ou None)
+    """
+    results = {text: (categorizar_area_comum(text), None) for text in normalized_texts}
+    if not SKLEARN_AVAILABLE:
+        return results
+
+    outros = {
+        text: normalize_semantic_text(text)
+        for text, (categoria, _) in results.items() if categoria == "Outros"
+    }
+    candidates = sorted({sem for sem in outros.values() if sem})
+    if not candidates:
+        return results
+
+    matcher = _get_matcher()
+    if not matcher.categories:
+        return results
+    sugeridas, scores = matcher.best_match(candidates)
+    semantic_map = dict(zip(candidates, zip(sugeridas, scores)))
+    for text, sem in outros.items():
+        if sem in semantic_map:
+            categoria, score = semantic_map[sem]
+            if score >= SEMANTIC_MIN_SCORE:
+                results[text] = (categoria, float(score))
+            else:
+                results[text] = ("Outros", float(score))
+    return results
+
+
+def _load_cache() -> dict[str, str]:
+    cache = _CACHE_IN_MEMORY.get(AREA_CATEGORIZATION_VERSION)
+    if cache is None:
+        from src.database import get_area_category_cache  # Importação local para evitar import circular
+        cache = get_area_category_cache(AREA_CATEGORIZATION_VERSION)
+        _CACHE_IN_MEMORY[AREA_CATEGORIZATION_VERSION] = cache
+    return cache
+
+
+def categorize_area_columns(df: pd.DataFrame, columns: list[str]) -> dict[str, pd.Series]:
+    """
+    Categoriza as colunas de áreas comuns de 'df' passando pelo dicionário
+    persistente texto normalizado -> categoria.
+
+    Returns:
+        dict: coluna -> série categorizada (mesmo índice de 'df').
+    """
+    columns = [col for col in columns if col in df.columns]
+    if not columns:
+        return {}
+
+    # Valores brutos distintos de todas as colunas, normalizados uma única vez
+    raw_uniques = pd.unique(pd.concat([df[col] for col in columns], ignore_index=True))
+    raw_to_norm = {raw: _normalizar_texto_area(raw) for raw in raw_uniques}
+
+    cache = _load_cache()
+    missing = sorted({norm for norm in raw_to_norm.values() if norm not in cache})
+    if missing:
+        novos = categorize_new_texts(missing)
+        cache.update({text: categoria for text, (categoria, _) in novos.items()})
+        if SKLEARN_AVAILABLE:
+            from src.database import save_area_category_cache  # Importação local para evitar import circular
+            save_area_category_cache(
+                [(text, categoria, score) for text, (categoria, score) in novos.items()],
+                AREA_CATEGORIZATION_VERSION,
+            )
+
+    raw_to_category = {raw: cache[norm] for raw, norm in raw_to_norm.items()}
+    return {col: df[col].map(raw_to_category) for col in columns}
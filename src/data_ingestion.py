@@ -6,36 +6,66 @@ import pandas as pd
 import io
 import numpy as np 
 
+from src.instrumentation import instrument_stage
+
+
+# Medido por fora do cache: acertos do cache aparecem como etapas de poucos milissegundos
+@instrument_stage()
 @st.cache_data(ttl=3600)
-def fetch_data_from_api(api_url: str) -> list | None:
+def fetch_dataframe_from_api(api_url: str) -> pd.DataFrame | None:
     """
     Tenta buscar dados de uma URL de API que retorna CSV/TSV.
     Não exibe mensagens no Streamlit diretamente.
 
     Returns:
-        list: Lista de dicionários com os dados.
-        []: Se a API retornar um arquivo vazio ou malformado.
+        pd.DataFrame: Dados brutos, com None no lugar dos valores ausentes.
+        DataFrame vazio: Se a API retornar um arquivo vazio ou malformado.
         None: Se houver um erro grave na requisição (rede, status HTTP ruim).
     """
     try:
         response = requests.get(api_url)
         response.raise_for_status()
-
-        csv_data = io.StringIO(response.text)
-
-        # ETAPA 1: Leitura correta do arquivo usando o separador de tabulação.
-        df = pd.read_csv(csv_data, sep='\t')
-
-        # ETAPA 2: Sanitização dos dados.
-        # Substitui todos os valores NaN (nativos do numpy/pandas) por None (nativo do Python).
-        # O 'None' do Python será corretamente convertido para 'null' no JSON.
-        df = df.replace({np.nan: None})
-
-        return df.to_dict(orient='records')
+        return parse_api_export(response.text)
 
     except requests.exceptions.RequestException:
         return None # Erro de requisição
     except pd.errors.EmptyDataError:
-        return [] # CSV vazio
+        return pd.DataFrame() # CSV vazio
     except Exception:
-        return None # Outro erro ao processar CSV
\ No newline at end of file
+        return None # Outro erro ao processar CSV
+
+
+def parse_api_export(text: str) -> pd.DataFrame:
+    """
+    Converte o corpo TSV da API no DataFrame bruto.
+    Levanta pd.errors.EmptyDataError se o corpo estiver vazio.
+    """
+    csv_data = io.StringIO(text)
+
+    # ETAPA 1: Leitura correta do arquivo usando o separador de tabulação.
+    df = pd.read_csv(csv_data, sep='\t')
+
+    # ETAPA 2: Sanitização dos dados.
+    # Substitui todos os valores NaN (nativos do numpy/pandas) por None (nativo do Python).
+    # O 'None' do Python será corretamente convertido para 'null' no JSON.
+    return df.replace({np.nan: None})
+
+
+def dataframe_to_records(df: pd.DataFrame | None) -> list | None:
+    """Converte o DataFrame da API na lista de dicionários usada no armazenamento bruto."""
+    if df is None:
+        return None
+    return df.to_dict(orient='records')
+
+
+@instrument_stage()
+def fetch_data_from_api(api_url: str) -> list | None:
+    """
+    Versão em lista de dicionários de 'fetch_dataframe_from_api'.
+
+    Returns:
+        list: Lista de dicionários com os dados.
+        []: Se a API retornar um arquivo vazio ou malformado.
+        None: Se houver um erro grave na requisição (rede, status HTTP ruim).
+    """
+    return dataframe_to_records(fetch_dataframe_from_api(api_url))
@@ -4,10 +4,12 @@ import pandas as pd
 import numpy as np
 import re
 import unicodedata
-import json
-from pathlib import Path
 from datetime import datetime
 
+from src.date_parsing import DAYFIRST_FORMATS, parse_dates
+from src.income_rules import IncomeRuleSet, IncomeRulesError, get_income_rules
+from src.instrumentation import instrument_stage
+
 # --- Dicionário de Mapeamento de Perguntas Alvo ---
 perguntas_alvo_codigos = {
     "Código": ["Código"],
@@ -448,75 +450,153 @@ CODIGOS_PARA_TEXTO_ORIGINAL = {
 }
 
 
-def map_api_columns_to_target_codes(records: list) -> tuple[list, set]:
-    """
-    Mapeia os nomes das colunas (chaves) dos registros brutos de API para os códigos alvo padronizados.
-    Usa SOMENTE correspondência exata. A similaridade semântica foi desativada.
-    Não exibe mensagens no Streamlit diretamente.
-
-    Args:
-        records (list): Uma lista de dicionários, onde cada dicionário é um registro de respondente bruto.
-                        As chaves são os nomes das colunas da API.
-
-    Returns:
-        tuple: Uma tupla contendo:
-               - list: Nova lista de dicionários com chaves mapeadas.
-               - set: Um conjunto de códigos alvo que foram mapeados com sucesso (ex: {'Código', 'FE2P3'}).
-    """
-    if not records:
-        return [], set()
-
-    exact_match_map = {}
+def _build_alias_index() -> dict:
+    """Índice texto alvo (minúsculo) -> código, montado uma única vez na importação."""
+    alias_index = {}
     for code, texts in perguntas_alvo_codigos.items():
         for text in texts:
             clean_text = text.strip().lower()
             if clean_text:
-                exact_match_map[clean_text] = code
+                alias_index[clean_text] = code
+    return alias_index
 
-    processed_records = []
-    unique_mapped_codes = set(
-    )  # Para armazenar os códigos alvo que foram efetivamente mapeados
 
-    original_columns = list(records[0].keys())
-    column_name_map = {}
+ALIAS_INDEX = _build_alias_index()
 
-    for original_col in original_columns:
-        mapped_key = original_col  # Inicia com o nome original
 
+def build_api_column_map(columns, survey_id: int | None = None,
+                         fuzzy: bool = True) -> tuple[dict, set]:
+    """
+    Resolve cada nome de coluna da API para o seu código alvo.
+    Primeiro por correspondência exata (com o código ou com um dos textos alvo);
+    as colunas que sobrarem passam pelo índice aproximado de src/header_matching.py,
+    cujas decisões ficam persistidas por (survey_id, cabeçalho).
+
+    Returns:
+        tuple: (mapa coluna_original -> coluna_mapeada, conjunto de códigos mapeados)
+    """
+    column_name_map = {}
+    unique_mapped_codes = set()
+
+    for original_col in columns:
         if original_col is None:
             column_name_map[original_col] = None
             continue
+        if not isinstance(original_col, str):
+            column_name_map[original_col] = original_col
+            continue
 
         normalized_original_col = original_col.strip()
         if not normalized_original_col:
             column_name_map[original_col] = ''
             continue
 
-        normalized_original_col_lower = normalized_original_col.lower()
-
-        # 1. Tentar correspondência exata com o código alvo (a chave no dicionário)
+        mapped_key = original_col  # Sem correspondência exata, mantém o nome original
+        # 1. Correspondência exata com o código alvo (a chave no dicionário)
         if normalized_original_col in perguntas_alvo_codigos:
             mapped_key = normalized_original_col
             unique_mapped_codes.add(mapped_key)
-        # 2. Tentar correspondência exata com os textos alvo (valores no dicionário)
-        elif normalized_original_col_lower in exact_match_map:
-            mapped_key = exact_match_map[normalized_original_col_lower]
+        # 2. Correspondência exata com os textos alvo (valores no dicionário)
+        elif normalized_original_col.lower() in ALIAS_INDEX:
+            mapped_key = ALIAS_INDEX[normalized_original_col.lower()]
             unique_mapped_codes.add(mapped_key)
-        # Se não encontrou correspondência exata, mapped_key permanece original_col
 
         column_name_map[original_col] = mapped_key
 
-    # Aplicar o mapeamento a todos os registros
-    for record in records:
-        new_record = {}
-        for original_key, value in record.items():
-            mapped_key = column_name_map.get(original_key, original_key)
-            new_record[mapped_key] = value
-        processed_records.append(new_record)
+    # 3. Correspondência aproximada para as colunas que não casaram exatamente.
+    # Um código já ocupado por correspondência exata não é atribuído de novo e,
+    # se dois cabeçalhos caírem no mesmo código, nenhum dos dois é mapeado.
+    unmatched = [
+        col for col, mapped in column_name_map.items()
+        if isinstance(col, str) and mapped == col and col.strip() not in perguntas_alvo_codigos
+    ]
+    if fuzzy and unmatched:
+        from src.header_matching import resolve_fuzzy_headers  # Importação local para evitar import circular
+        fuzzy_map = {
+            col: code for col, code in resolve_fuzzy_headers(unmatched, survey_id).items()
+            if code is not None and code not in unique_mapped_codes
+        }
+        claimed = pd.Series(list(fuzzy_map.values()), dtype=object).value_counts()
+        for col, code in fuzzy_map.items():
+            if claimed[code] == 1:
+                column_name_map[col] = code
+                unique_mapped_codes.add(code)
+
+    return column_name_map, unique_mapped_codes
+
+
+@instrument_stage()
+def map_api_dataframe_columns(df: pd.DataFrame,
+                              survey_id: int | None = None) -> tuple[pd.DataFrame, set]:
+    """
+    Renomeia as colunas de um DataFrame bruto da API para os códigos alvo padronizados,
+    num único rename de colunas (sem copiar registro a registro).
+    Quando duas colunas caem no mesmo código, prevalece a última, como no mapeamento por registro.
+
+    Returns:
+        tuple: (DataFrame com colunas mapeadas, conjunto de códigos alvo mapeados)
+    """
+    if df is None or df.empty:
+        return df, set()
+
+    column_name_map, unique_mapped_codes = build_api_column_map(df.columns, survey_id)
+    mapped_df = df.rename(columns=column_name_map)
+    if mapped_df.columns.has_duplicates:
+        mapped_df = mapped_df.loc[:, ~mapped_df.columns.duplicated(keep='last')]
+    return mapped_df, unique_mapped_codes
+
+
+@instrument_stage()
+def map_api_columns_to_target_codes(records: list) -> tuple[list, set]:
+    """
+    Mapeia os nomes das colunas (chaves) dos registros brutos de API para os códigos alvo padronizados.
+    Usa correspondência exata e, para as colunas restantes, a correspondência aproximada
+    de src/header_matching.py (ver 'build_api_column_map').
+    Não exibe mensagens no Streamlit diretamente.
+    Mantido para quem já tem a lista de registros; o pipeline usa 'map_api_dataframe_columns'.
 
+    Args:
+        records (list): Uma lista de dicionários, onde cada dicionário é um registro de respondente bruto.
+                        As chaves são os nomes das colunas da API.
+
+    Returns:
+        tuple: Uma tupla contendo:
+               - list: Nova lista de dicionários com chaves mapeadas.
+               - set: Um conjunto de códigos alvo que foram mapeados com sucesso (ex: {'Código', 'FE2P3'}).
+    """
+    if not records:
+        return [], set()
+
+    column_name_map, unique_mapped_codes = build_api_column_map(records[0].keys())
+    processed_records = [
+        {column_name_map.get(key, key): value for key, value in record.items()}
+        for record in records
+    ]
     return processed_records, unique_mapped_codes
 
 
+def apply_over_uniques(series: pd.Series, func) -> pd.Series:
+    """
+    Equivalente a 'series.apply(func)' para funções escalares puras, mas executando
+    'func' uma única vez por valor distinto (colunas como cidade, estado e faixas de
+    renda têm poucos milhares de valores distintos em centenas de milhares de linhas).
+    Valores ausentes também passam por 'func' (uma vez), como no apply.
+    """
+    if series.empty:
+        return series.apply(func)
+
+    codes, uniques = pd.factorize(series, use_na_sentinel=True)
+    results = [func(value) for value in uniques]
+    missing_mask = codes < 0
+    if missing_mask.any():
+        results.append(func(series[missing_mask].iloc[0]))
+        codes = np.where(missing_mask, len(results) - 1, codes)
+
+    lookup = np.empty(len(results), dtype=object)
+    lookup[:] = results
+    return pd.Series(lookup[codes], index=series.index, name=series.name).infer_objects()
+
+
 # --- 1. LÓGICA DE IDADE ---
 
 
@@ -550,22 +630,24 @@ def reclassificar_idade(age):
 
 
 # --- 2. LÓGICA DE RENDA ---
-@st.cache_data
-def load_classification_rules():
-    """Carrega as regras de classificação de renda do arquivo JSON."""
+def load_income_rules() -> IncomeRuleSet | None:
+    """
+    Regras de renda validadas e compiladas (ver src/income_rules.py). O registro
+    recarrega o arquivo sozinho quando ele muda; aqui só se reporta o erro na interface.
+    """
     try:
-        rule_path = Path(
-            __file__
-        ).parent.parent / "config" / "regras_classificacao_renda.json"
-        with open(rule_path, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except FileNotFoundError:
-        st.error(
-            "Arquivo de regras 'config/regras_classificacao_renda.json' não encontrado."
-        )
+        return get_income_rules()
+    except IncomeRulesError as e:
+        st.error(f"Regras de classificação de renda inválidas: {e}")
         return None
 
 
+def load_classification_rules():
+    """Carrega as regras de classificação de renda do arquivo JSON (dicionário bruto)."""
+    regras = load_income_rules()
+    return regras.raw if regras is not None else None
+
+
 def classify_income_by_rules(valor, data_criacao_pesquisa, all_rules):
     """Classifica a renda e retorna uma tupla: (classe_agregada, classe_detalhada)"""
     if pd.isna(valor) or pd.isna(data_criacao_pesquisa) or all_rules is None:
@@ -724,106 +806,101 @@ def _normalizar_texto_area(valor: str) -> str:
     ).lower().strip()
 
 
+AREA_RESPOSTAS_VAZIAS = frozenset({"-", "na", "n/a", "none", "nan"})
+
+AREA_MAPA_EXATO = {
+    "academia": "Atividade Física | Academias",
+    "academia ao ar livre": "Atividade Física | Academias",
+    "quadra poliesportiva": "Atividade Física | Quadras",
+    "quadra de beach tenis": "Atividade Física | Quadras",
+    "pista de caminhada": "Atividade Física | Caminhada e Ciclovia",
+    "ciclovia": "Atividade Física | Caminhada e Ciclovia",
+    "bicicletario": "Atividade Física | Caminhada e Ciclovia",
+    "lavanderia": "Serviço",
+    "coworking": "Serviço",
+    "minimercado": "Serviço",
+    "minimarket": "Serviço",
+    "mini market": "Serviço",
+    "restaurante": "Serviço",
+    "bar": "Serviço",
+    "bar molhado": "Serviço",
+    "mercado autonomo": "Serviço",
+    "pub": "Serviço",
+    "portaria": "Serviço",
+    "espaco delivery": "Serviço",
+    "espaco beleza": "Serviço",
+    "lounge": "Serviço",
+    "louge": "Serviço",
+    "car wash": "Serviço",
+    "salao de festas": "Convivência | Ambientes fechados",
+    "espaco gourmet": "Convivência | Ambientes fechados",
+    "sala de jogos": "Convivência | Ambientes fechados",
+    "churrasqueira": "Convivência | Churrasqueiras",
+    "churrasqueira com deck/bar": "Convivência | Churrasqueiras",
+    "playground": "Áreas Infantis & Familiares",
+    "parquinho": "Áreas Infantis & Familiares",
+    "brinquedoteca": "Áreas Infantis & Familiares",
+    "praca": "Áreas Infantis & Familiares",
+    "piscina": "Áreas Aquáticas | Piscinas",
+    "piscina adulto e infantil": "Áreas Aquáticas | Piscinas",
+    "piscina adulto": "Áreas Aquáticas | Piscinas",
+    "piscina e deck": "Áreas Aquáticas | Piscinas",
+    "spa": "Áreas Aquáticas | Sauna e SPA",
+    "sauna": "Áreas Aquáticas | Sauna e SPA",
+    "espaco pet": "Infraestrutura Pet",
+    "pet place": "Infraestrutura Pet",
+    "praca de eventos (food truck/ feira organicos/ festa junina, ect)": "Convivência | Ambientes abertos",
+    "rooftop": "Convivência | Ambientes abertos",
+}
+
+# Regras por trecho de texto, em ordem de prioridade: vale a primeira regra com
+# qualquer termo presente. Termos entre '\b' só casam como palavra inteira.
+AREA_REGRAS_POR_TERMO = [
+    ("Convivência | Churrasqueiras", ["churrasque"]),
+    ("Atividade Física | Academias", ["academ", "fitness"]),
+    ("Atividade Física | Quadras", ["quadra", "beach tenis"]),
+    ("Atividade Física | Caminhada e Ciclovia", ["ciclovia", "caminhada", "cooper", "bicicletario"]),
+    ("Serviço", [
+        "lavanderia", "coworking", "minimercado", "minimarket", "mini market",
+        "restaurante", "bar molhado", "mercado autonomo", r"\bbar\b", r"\bpub\b",
+        "portaria", "delivery", "espaco beleza", "lounge", "louge", "car wash",
+    ]),
+    ("Infraestrutura Pet", ["pet"]),
+    ("Áreas Aquáticas | Piscinas", ["piscina"]),
+    ("Áreas Aquáticas | Sauna e SPA", ["sauna", r"\bspa\b"]),
+    ("Áreas Infantis & Familiares", ["playground", "parquinho", "brinquedoteca"]),
+    ("Convivência | Ambientes abertos", ["praca de eventos", "rooftop", "ambiente aberto"]),
+    ("Convivência | Ambientes fechados", ["salao de festas", "festas", "gourmet", "jogos"]),
+]
+
+
+def _compilar_regras_area(regras: list) -> list[tuple[str, re.Pattern]]:
+    """Compila cada regra numa única alternação, preservando a ordem de prioridade."""
+    compiladas = []
+    for categoria, termos in regras:
+        alternativas = [t if t.startswith("\\b") else re.escape(t) for t in termos]
+        compiladas.append((categoria, re.compile("|".join(alternativas))))
+    return compiladas
+
+
+_AREA_REGRAS_COMPILADAS = _compilar_regras_area(AREA_REGRAS_POR_TERMO)
+
+
 def categorizar_area_comum(valor: str) -> str:
     """
     Mapeia respostas das colunas APAC9P85_1..5 para as categorias-alvo de áreas comuns.
     Retorna 'Outros' quando não encontrar regra explícita.
     """
     texto = _normalizar_texto_area(valor)
-    if not texto or texto in {"-", "na", "n/a", "none", "nan"}:
+    if not texto or texto in AREA_RESPOSTAS_VAZIAS:
         return "Sem resposta"
 
-    mapa_exato = {
-        "academia": "Atividade Física | Academias",
-        "academia ao ar livre": "Atividade Física | Academias",
-        "quadra poliesportiva": "Atividade Física | Quadras",
-        "quadra de beach tenis": "Atividade Física | Quadras",
-        "pista de caminhada": "Atividade Física | Caminhada e Ciclovia",
-        "ciclovia": "Atividade Física | Caminhada e Ciclovia",
-        "bicicletario": "Atividade Física | Caminhada e Ciclovia",
-        "lavanderia": "Serviço",
-        "coworking": "Serviço",
-        "minimercado": "Serviço",
-        "minimarket": "Serviço",
-        "mini market": "Serviço",
-        "restaurante": "Serviço",
-        "bar": "Serviço",
-        "bar molhado": "Serviço",
-        "mercado autonomo": "Serviço",
-        "pub": "Serviço",
-        "portaria": "Serviço",
-        "espaco delivery": "Serviço",
-        "espaco beleza": "Serviço",
-        "lounge": "Serviço",
-        "louge": "Serviço",
-        "car wash": "Serviço",
-        "salao de festas": "Convivência | Ambientes fechados",
-        "espaco gourmet": "Convivência | Ambientes fechados",
-        "sala de jogos": "Convivência | Ambientes fechados",
-        "churrasqueira": "Convivência | Churrasqueiras",
-        "churrasqueira com deck/bar": "Convivência | Churrasqueiras",
-        "playground": "Áreas Infantis & Familiares",
-        "parquinho": "Áreas Infantis & Familiares",
-        "brinquedoteca": "Áreas Infantis & Familiares",
-        "praca": "Áreas Infantis & Familiares",
-        "piscina": "Áreas Aquáticas | Piscinas",
-        "piscina adulto e infantil": "Áreas Aquáticas | Piscinas",
-        "piscina adulto": "Áreas Aquáticas | Piscinas",
-        "piscina e deck": "Áreas Aquáticas | Piscinas",
-        "spa": "Áreas Aquáticas | Sauna e SPA",
-        "sauna": "Áreas Aquáticas | Sauna e SPA",
-        "espaco pet": "Infraestrutura Pet",
-        "pet place": "Infraestrutura Pet",
-        "praca de eventos (food truck/ feira organicos/ festa junina, ect)": "Convivência | Ambientes abertos",
-        "rooftop": "Convivência | Ambientes abertos",
-    }
-    if texto in mapa_exato:
-        return mapa_exato[texto]
-
-    def _has_word(t: str, w: str) -> bool:
-        return re.search(rf'\b{re.escape(w)}\b', t) is not None
-
-    if "churrasque" in texto:
-        return "Convivência | Churrasqueiras"
-    if "academ" in texto or "fitness" in texto:
-        return "Atividade Física | Academias"
-    if "quadra" in texto or "beach tenis" in texto:
-        return "Atividade Física | Quadras"
-    if "ciclovia" in texto or "caminhada" in texto or "cooper" in texto or "bicicletario" in texto:
-        return "Atividade Física | Caminhada e Ciclovia"
-    if (
-        "lavanderia" in texto
-        or "coworking" in texto
-        or "minimercado" in texto
-        or "minimarket" in texto
-        or "mini market" in texto
-        or "restaurante" in texto
-        or "bar molhado" in texto
-        or "mercado autonomo" in texto
-        or _has_word(texto, "bar")
-        or _has_word(texto, "pub")
-        or "portaria" in texto
-        or "delivery" in texto
-        or "espaco beleza" in texto
-        or "lounge" in texto
-        or "louge" in texto
-        or "car wash" in texto
-    ):
-        return "Serviço"
-    if "pet" in texto:
-        return "Infraestrutura Pet"
-    if "piscina" in texto:
-        return "Áreas Aquáticas | Piscinas"
-    if "sauna" in texto or _has_word(texto, "spa"):
-        return "Áreas Aquáticas | Sauna e SPA"
-    if "playground" in texto or "parquinho" in texto or "brinquedoteca" in texto:
-        return "Áreas Infantis & Familiares"
-    if "praca de eventos" in texto or "rooftop" in texto or "ambiente aberto" in texto:
-        return "Convivência | Ambientes abertos"
-    if "salao de festas" in texto or "festas" in texto or "gourmet" in texto or "jogos" in texto:
-        return "Convivência | Ambientes fechados"
-    if texto == "praca":
-        return "Áreas Infantis & Familiares"
+    if texto in AREA_MAPA_EXATO:
+        return AREA_MAPA_EXATO[texto]
+
+    for categoria, padrao in _AREA_REGRAS_COMPILADAS:
+        if padrao.search(texto):
+            return categoria
 
     return "Outros"
 
@@ -859,13 +936,13 @@ MAPA_ESTADO_REGIAO = {
     'RS': 'Sul',
     'SC': 'Sul'
 }
-LISTA_CAPITAIS = [
+LISTA_CAPITAIS = frozenset([
     'ARACAJU', 'BELEM', 'BELO HORIZONTE', 'BOA VISTA', 'BRASILIA',
     'CAMPO GRANDE', 'CUIABA', 'CURITIBA', 'FLORIANOPOLIS', 'FORTALEZA',
     'GOIANIA', 'JOAO PESSOA', 'MACAPA', 'MACEIO', 'MANAUS', 'NATAL', 'PALMAS',
     'PORTO ALEGRE', 'PORTO VELHO', 'RECIFE', 'RIO BRANCO', 'RIO DE JANEIRO',
     'SALVADOR', 'SAO LUIS', 'SAO PAULO', 'TERESINA', 'VITORIA'
-]
+])
 
 
 def normalizar_texto(texto):
@@ -976,10 +1053,15 @@ def impute_missing_states(df: pd.DataFrame) -> pd.DataFrame:
     # Substitui o hífen por um valor Nulo padrão (NaN) para facilitar o uso das funções do Pandas
     df['Estado_temp'] = df['Estado'].replace('-', pd.NA)
 
-    # Calcula a moda (estado mais frequente) para cada grupo de 'survey_id'
-    # 'transform' aplica o resultado de volta a todas as linhas do grupo original.
-    df['estado_imputado'] = df.groupby('survey_id')['Estado_temp'].transform(
-        lambda x: x.mode()[0] if not x.mode().empty else pd.NA)
+    # Calcula a moda (estado mais frequente) para cada grupo de 'survey_id' de forma vetorizada:
+    # contagem por (survey_id, estado) já ordenada, e idxmax pega a primeira contagem máxima,
+    # ou seja, o menor estado em caso de empate (mesmo desempate de Series.mode()[0]).
+    contagens = df.groupby(['survey_id', 'Estado_temp'], sort=True).size()
+    if contagens.empty:
+        df['estado_imputado'] = pd.NA
+    else:
+        moda_por_pesquisa = contagens.groupby(level='survey_id').idxmax().str[1]
+        df['estado_imputado'] = df['survey_id'].map(moda_por_pesquisa)
 
     # Cria a nova coluna 'Estado_corrigido' preenchendo os nulos com o valor imputado
     df['Estado_corrigido'] = df['Estado_temp'].fillna(df['estado_imputado'])
@@ -991,12 +1073,13 @@ def impute_missing_states(df: pd.DataFrame) -> pd.DataFrame:
 
 
 # --- FUNÇÃO ORQUESTRADORA ---
+@instrument_stage()
 def process_and_standardize_data(long_df: pd.DataFrame,
                                  surveys_df: pd.DataFrame) -> pd.DataFrame:
     if long_df.empty:
         return pd.DataFrame()
 
-    regras_de_renda = load_classification_rules()
+    regras_de_renda = load_income_rules()
     if regras_de_renda is None:
         return pd.DataFrame()
 
@@ -1019,8 +1102,8 @@ def process_and_standardize_data(long_df: pd.DataFrame,
             wide_df[col] = None
 
     # 2. Transformações e Validações de Dados
-    wide_df['data_pesquisa'] = pd.to_datetime(wide_df['Data'],
-                                              errors='coerce',
+    wide_df['data_pesquisa'], _ = parse_dates(wide_df['Data'],
+                                              DAYFIRST_FORMATS,
                                               dayfirst=True)
     hoje = pd.to_datetime('today').normalize()
     future_dates_mask = wide_df['data_pesquisa'] > hoje
@@ -1033,32 +1116,33 @@ def process_and_standardize_data(long_df: pd.DataFrame,
     wide_df['genero'] = wide_df['FE2P3']
     wide_df['latitude'] = pd.to_numeric(wide_df['Latitude'], errors='coerce')
     wide_df['longitude'] = pd.to_numeric(wide_df['Longitude'], errors='coerce')
-    wide_df['estado_nome'] = wide_df['Estado_corrigido'].apply(
-        map_uf_to_estado_nome)
-    wide_df['regiao'] = wide_df['Estado_corrigido'].apply(map_estado_to_regiao)
-    wide_df['localidade'] = wide_df['FE2P7'].apply(classify_cidade)
+    # Colunas derivadas calculadas uma vez por valor distinto (ver apply_over_uniques)
+    wide_df['estado_nome'] = apply_over_uniques(wide_df['Estado_corrigido'],
+                                                map_uf_to_estado_nome)
+    wide_df['regiao'] = apply_over_uniques(wide_df['Estado_corrigido'],
+                                           map_estado_to_regiao)
+    wide_df['localidade'] = apply_over_uniques(wide_df['FE2P7'], classify_cidade)
     wide_df['idade_numerica'] = pd.to_numeric(wide_df['FE2P5'],
                                               errors='coerce')
-    wide_df['geracao'] = wide_df['idade_numerica'].apply(categorize_generation)
-    wide_df['faixa_etaria'] = wide_df['idade_numerica'].apply(
-        reclassificar_idade)
-    wide_df['intencao_compra_padronizada'] = wide_df['IC4P30'].apply(
-        lambda x: padronizar_resposta(x, MAPA_INTENCAO_COMPRA))
-    wide_df['tempo_intencao_padronizado'] = wide_df['IC4P32'].apply(
-        lambda x: padronizar_resposta(x, MAPA_TEMPO_INTENCAO))
-    wide_df['renda_valor_estimado'] = wide_df['FE2P10'].apply(
-        calcular_media_faixa)
-    wide_df['renda_faixa_padronizada'] = wide_df['renda_valor_estimado'].apply(
-        classificar_faixa_antiga)
-    wide_df['renda_macro_faixa'] = wide_df['renda_faixa_padronizada'].apply(
-        map_renda_to_macro_faixa)
-
-    # Aplica a nova função de classificação que retorna uma tupla
-    resultados_renda = wide_df.apply(lambda row: classify_income_by_rules(
-        row['renda_valor_estimado'], row['creation_date'], regras_de_renda),
-                                     axis=1)
-    wide_df[['renda_classe_agregada', 'renda_classe_detalhada'
-             ]] = pd.DataFrame(resultados_renda.tolist(), index=wide_df.index)
+    wide_df['geracao'] = apply_over_uniques(wide_df['idade_numerica'],
+                                            categorize_generation)
+    wide_df['faixa_etaria'] = apply_over_uniques(wide_df['idade_numerica'],
+                                                 reclassificar_idade)
+    wide_df['intencao_compra_padronizada'] = apply_over_uniques(
+        wide_df['IC4P30'], lambda x: padronizar_resposta(x, MAPA_INTENCAO_COMPRA))
+    wide_df['tempo_intencao_padronizado'] = apply_over_uniques(
+        wide_df['IC4P32'], lambda x: padronizar_resposta(x, MAPA_TEMPO_INTENCAO))
+    wide_df['renda_valor_estimado'] = apply_over_uniques(wide_df['FE2P10'],
+                                                         calcular_media_faixa)
+    wide_df['renda_faixa_padronizada'] = apply_over_uniques(
+        wide_df['renda_valor_estimado'], classificar_faixa_antiga)
+    wide_df['renda_macro_faixa'] = apply_over_uniques(
+        wide_df['renda_faixa_padronizada'], map_renda_to_macro_faixa)
+
+    # Classificação por regras vigentes na data de criação da pesquisa, registrando a versão usada
+    wide_df[['renda_classe_agregada', 'renda_classe_detalhada', 'renda_regra_versao'
+             ]] = regras_de_renda.classify(wide_df['renda_valor_estimado'],
+                                           wide_df['creation_date'])
 
     # 4. Selecionar e Renomear Colunas para a Tabela Final
     final_cols_map = {
@@ -1076,6 +1160,7 @@ def process_and_standardize_data(long_df: pd.DataFrame,
         'renda_macro_faixa': 'renda_macro_faixa',
         'renda_classe_agregada': 'renda_classe_agregada',
         'renda_classe_detalhada': 'renda_classe_detalhada',
+        'renda_regra_versao': 'renda_regra_versao',
         'cidade_original': 'FE2P7',
         'localidade': 'localidade',
         'estado_original': 'Estado',
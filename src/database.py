@@ -2,6 +2,7 @@
 
 import streamlit as st  # Mantido para st.cache_resource
 import psycopg2
+import logging
 import os
 import pandas as pd
 import numpy as np
@@ -12,8 +13,26 @@ from psycopg2 import sql
 from psycopg2.extras import execute_values
 
 # Importações locais para evitar problemas de importação circular
-from src.data_ingestion import fetch_data_from_api
-from src.data_processing import map_api_columns_to_target_codes
+from src.analytics_schema import apply_analytics_schema
+from src.data_ingestion import dataframe_to_records, fetch_dataframe_from_api
+from src.data_processing import map_api_dataframe_columns
+from src.income_rules import CLASSE_NAO_CLASSIFICADO, CLASSE_VERSAO_INCOMPATIVEL
+from src.instrumentation import InstrumentedCursor, instrument_stage, timed_dataframe_read
+
+logger = logging.getLogger(__name__)
+
+
+def report_error(message: str):
+    """Mostra o erro na interface (quando há sessão do Streamlit) e registra no log."""
+    logger.error(message)
+    st.error(message)
+
+
+def report_progress(message: str):
+    """Mostra uma etapa em andamento na interface e registra no log."""
+    logger.info(message)
+    st.write(message)
+
 
 # --- Configuração do Banco de Dados PostgreSQL (Usando Secrets do Replit) ---
 DB_HOST = os.environ.get("DB_HOST")
@@ -23,11 +42,13 @@ DB_USER = os.environ.get("DB_USER")
 DB_PASSWORD = os.environ.get("DB_PASSWORD")
 
 
-@st.cache_resource
-def get_db_connection():
+def open_db_connection(instrumented: bool = True):
     """
-    Estabelece conexão com o banco de dados e inclui um bloco de diagnóstico
-    para verificar se os secrets foram carregados corretamente.
+    Abre uma conexão nova (sem cache) com o banco de dados e inclui um bloco de
+    diagnóstico para verificar se os secrets foram carregados corretamente.
+    Usada diretamente pelo worker da fila de jobs, que precisa de uma sessão própria.
+
+    Com 'instrumented', os cursores registram o tempo de cada SQL (src/instrumentation.py).
     """
     # --- Bloco de Diagnóstico de Secrets ---
     db_secrets = {
@@ -43,7 +64,7 @@ def get_db_connection():
     
     if missing_secrets:
         error_message = f"ERRO CRÍTICO: As seguintes variáveis de ambiente (Secrets) não foram encontradas ou estão vazias: {', '.join(missing_secrets)}. Por favor, verifique a configuração de 'Secrets' no seu painel do Streamlit Cloud."
-        st.error(error_message)
+        report_error(error_message)
         raise ConnectionError(error_message)
     
     # --- Fim do Bloco de Diagnóstico ---
@@ -54,14 +75,30 @@ def get_db_connection():
             port=db_secrets["DB_PORT"],
             database=db_secrets["DB_NAME"],
             user=db_secrets["DB_USER"],
-            password=db_secrets["DB_PASSWORD"]
+            password=db_secrets["DB_PASSWORD"],
+            cursor_factory=InstrumentedCursor if instrumented else None
         )
         return conn
     except Exception as e:
-        st.error(f"Falha ao conectar ao PostgreSQL após carregar os secrets. Verifique se as credenciais estão corretas e se o banco está acessível. Erro: {e}")
+        report_error(f"Falha ao conectar ao PostgreSQL após carregar os secrets. Verifique se as credenciais estão corretas e se o banco está acessível. Erro: {e}")
         raise ConnectionError(f"Não foi possível conectar ao banco de dados: {e}")
 
 
+@st.cache_resource
+def get_db_connection():
+    """Conexão compartilhada pelo processo (cacheada pelo Streamlit)."""
+    return open_db_connection()
+
+
+def read_sql(query, conn, params=None) -> pd.DataFrame:
+    """
+    'pd.read_sql_query' medido: execução, leitura das linhas e montagem do DataFrame
+    vão separados para o log de consultas lentas (src/query_log.py).
+    """
+    with timed_dataframe_read():
+        return pd.read_sql_query(query, conn, params=params)
+
+
 
 def init_db_schema() -> bool:
     conn = get_db_connection()
@@ -100,18 +137,42 @@ def init_db_schema() -> bool:
                 unique_questions_consolidated INTEGER
             );
         """)
-        # Tabela de Dados Consolidados
+        # Dados Consolidados (formato longo), codificados por dicionário: cada código de
+        # pergunta e cada texto de resposta distinto é gravado uma vez só
         cursor.execute("""
-            CREATE TABLE IF NOT EXISTS consolidated_data (
-                id SERIAL PRIMARY KEY,
+            CREATE TABLE IF NOT EXISTS questions (
+                question_id SERIAL PRIMARY KEY,
+                question_code TEXT NOT NULL UNIQUE
+            );
+        """)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS answers (
+                answer_id SERIAL PRIMARY KEY,
+                answer_value TEXT NOT NULL
+            );
+        """)
+        # Unicidade pelo hash: respostas abertas longas não cabem numa entrada de índice btree
+        cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS answers_valor_unico ON answers (md5(answer_value));")
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS consolidated_answers (
+                id BIGSERIAL PRIMARY KEY,
                 respondent_id TEXT NOT NULL,
-                survey_id INTEGER NOT NULL,
-                question_code TEXT NOT NULL,
-                answer_value TEXT,
-                FOREIGN KEY (survey_id) REFERENCES surveys(survey_id) ON DELETE CASCADE,
-                UNIQUE (respondent_id, survey_id, question_code)
+                survey_id INTEGER NOT NULL REFERENCES surveys(survey_id) ON DELETE CASCADE,
+                question_id INTEGER NOT NULL REFERENCES questions(question_id),
+                answer_id INTEGER REFERENCES answers(answer_id),
+                UNIQUE (respondent_id, survey_id, question_id)
             );
         """)
+        # Instalações antigas têm 'consolidated_data' como tabela: a conversão para os
+        # dicionários é feita à parte ('python -m src.pipeline migrate'). Até lá a visão
+        # não é criada e a sequência de 'consolidated_answers' pula os ids antigos, para
+        # as consolidações novas não colidirem com as linhas a migrar.
+        if _consolidated_legacy_table_exists(cursor):
+            _advance_consolidated_sequence(cursor)
+            report_progress("Aviso: 'consolidated_data' ainda está no formato antigo. "
+                            "Rode 'python -m src.pipeline migrate' para convertê-la.")
+        else:
+            create_consolidated_view(cursor)
         # Tabela Final para Análise (Formato Largo e Tratado)
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS analytics_respondents (
@@ -145,16 +206,287 @@ def init_db_schema() -> bool:
                         FOREIGN KEY (survey_id) REFERENCES surveys(survey_id) ON DELETE CASCADE
                     );
                 """)
+        # Versão das regras de renda que classificou cada linha (ver src/income_rules.py).
+        # Sempre acrescentada ao final, nas duas tabelas, para o 'UNION ALL' de get_analytics_data
+        # continuar alinhado por posição.
+        cursor.execute("ALTER TABLE analytics_respondents ADD COLUMN IF NOT EXISTS renda_regra_versao TEXT;")
+        cursor.execute("ALTER TABLE IF EXISTS analytics_respondents_historical ADD COLUMN IF NOT EXISTS renda_regra_versao TEXT;")
+        # Dicionário persistente texto normalizado -> categoria das áreas comuns (APAC9P85_*)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS area_categorization_cache (
+                texto_norm TEXT NOT NULL,
+                versao TEXT NOT NULL,
+                categoria TEXT NOT NULL,
+                score_semantico NUMERIC(6, 4),
+                created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (texto_norm, versao)
+            );
+        """)
+        # Decisões da correspondência aproximada de cabeçalhos da API (código NULL = sem correspondência)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS header_mapping_decisions (
+                survey_id INTEGER NOT NULL,
+                header TEXT NOT NULL,
+                versao TEXT NOT NULL,
+                mapped_code TEXT,
+                score NUMERIC(6, 4),
+                matched_text TEXT,
+                decided_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (survey_id, header, versao)
+            );
+        """)
+        # Fila de jobs pesados da pipeline, executados pelo worker (src/job_worker.py)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS pipeline_jobs (
+                job_id BIGSERIAL PRIMARY KEY,
+                job_type TEXT NOT NULL,
+                survey_id INTEGER REFERENCES surveys(survey_id) ON DELETE CASCADE,
+                params JSONB NOT NULL DEFAULT '{}'::jsonb,
+                status TEXT NOT NULL DEFAULT 'pending'
+                    CHECK (status IN ('pending', 'running', 'succeeded', 'failed', 'cancelled')),
+                attempts INTEGER NOT NULL DEFAULT 0,
+                max_attempts INTEGER NOT NULL DEFAULT 3,
+                run_after TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                progress NUMERIC(5, 4),
+                progress_text TEXT,
+                result JSONB,
+                last_error TEXT,
+                requested_by TEXT,
+                worker_id TEXT,
+                created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                started_at TIMESTAMP WITH TIME ZONE,
+                heartbeat_at TIMESTAMP WITH TIME ZONE,
+                finished_at TIMESTAMP WITH TIME ZONE
+            );
+        """)
+        # No máximo um job ativo (na fila ou rodando) por tipo e pesquisa: dois admins
+        # clicando no mesmo botão caem no mesmo job
+        cursor.execute("""
+            CREATE UNIQUE INDEX IF NOT EXISTS pipeline_jobs_ativo_unico
+            ON pipeline_jobs (job_type, COALESCE(survey_id, 0))
+            WHERE status IN ('pending', 'running');
+        """)
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS pipeline_jobs_fila
+            ON pipeline_jobs (run_after, job_id) WHERE status = 'pending';
+        """)
+        # Tempos por etapa e por SQL das execuções da pipeline (src/instrumentation.py)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS pipeline_metrics (
+                id BIGSERIAL PRIMARY KEY,
+                run_id TEXT NOT NULL,
+                run_name TEXT,
+                kind TEXT NOT NULL,
+                stage TEXT NOT NULL,
+                parent TEXT,
+                started_at TIMESTAMP WITH TIME ZONE NOT NULL,
+                duration_s DOUBLE PRECISION NOT NULL,
+                rows_in BIGINT,
+                rows_out BIGINT,
+                bytes BIGINT,
+                ok BOOLEAN NOT NULL DEFAULT TRUE,
+                details TEXT
+            );
+        """)
+        # Registros 'sql' somados por etapa e rótulo (ver src/instrumentation.py)
+        cursor.execute("""
+            ALTER TABLE pipeline_metrics
+                ADD COLUMN IF NOT EXISTS calls INTEGER NOT NULL DEFAULT 1,
+                ADD COLUMN IF NOT EXISTS max_duration_s DOUBLE PRECISION;
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS pipeline_metrics_run ON pipeline_metrics (run_id);")
+        cursor.execute("CREATE INDEX IF NOT EXISTS pipeline_metrics_inicio ON pipeline_metrics (started_at) WHERE kind = 'run';")
         conn.commit()
         return True
     except Exception as e:
         conn.rollback()
-        st.error(f"Erro ao inicializar o schema do banco de dados: {e}")
+        report_error(f"Erro ao inicializar o schema do banco de dados: {e}")
         raise Exception(f"Erro ao inicializar esquema do DB: {e}")
     finally:
         cursor.close()
 
 
+def _consolidated_legacy_table_exists(cursor) -> bool:
+    """True se 'consolidated_data' ainda é a tabela do formato antigo (e não a visão)."""
+    cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass('consolidated_data');")
+    row = cursor.fetchone()
+    return row is not None and row[0] == 'r'
+
+
+def _advance_consolidated_sequence(cursor):
+    """Leva a sequência de 'consolidated_answers' para depois do maior id da tabela antiga (só avança)."""
+    cursor.execute("""
+        SELECT setval(s.seq, m.max_id)
+        FROM (SELECT pg_get_serial_sequence('consolidated_answers', 'id')::regclass AS seq) s,
+             (SELECT MAX(id) AS max_id FROM consolidated_data) m
+        WHERE m.max_id > COALESCE(pg_sequence_last_value(s.seq), 0);
+    """)
+
+
+def create_consolidated_view(cursor):
+    # Visão de compatibilidade com o formato antigo (texto) para leituras e consultas avulsas.
+    # LEFT JOIN nos dois dicionários: contagens sobre a visão dispensam as junções.
+    cursor.execute("""
+        CREATE OR REPLACE VIEW consolidated_data AS
+        SELECT c.id, c.respondent_id, c.survey_id, q.question_code, a.answer_value
+        FROM consolidated_answers c
+        LEFT JOIN questions q ON q.question_id = c.question_id
+        LEFT JOIN answers a ON a.answer_id = c.answer_id;
+    """)
+
+
+CONSOLIDATED_LEGACY_TABLE = "consolidated_data_legacy"
+
+
+def migrate_consolidated_data(batch_size: int = 50_000) -> tuple[bool, str]:
+    """
+    Converte a antiga tabela 'consolidated_data' (código e resposta em texto por linha)
+    para 'consolidated_answers' + dicionários 'questions'/'answers', preservando os ids.
+
+    Roda numa conexão própria e copia em lotes por faixa de id, com um commit por lote;
+    uma migração interrompida pode ser repetida (as linhas já copiadas são ignoradas).
+    Linhas já gravadas em 'consolidated_answers' por consolidações feitas depois da
+    atualização prevalecem sobre as antigas. Ao final, a tabela antiga é renomeada para
+    'consolidated_data_legacy' (não é apagada) e a visão 'consolidated_data' é criada.
+
+    Returns:
+        tuple[bool, str]: (sucesso, mensagem)
+    """
+    conn = open_db_connection()
+    cursor = conn.cursor()
+    try:
+        # Advisory lock de sessão: uma migração por vez
+        cursor.execute("SELECT pg_try_advisory_lock(hashtext('migrate_consolidated_data'));")
+        if not cursor.fetchone()[0]:
+            return False, "Outra migração de 'consolidated_data' está em andamento."
+        # O estado só é conferido com o lock na mão
+        if not _consolidated_legacy_table_exists(cursor):
+            create_consolidated_view(cursor)
+            conn.commit()
+            return True, "Nada a migrar: 'consolidated_data' já está no formato por dicionário."
+        cursor.execute("SELECT to_regclass(%s) IS NOT NULL;", (CONSOLIDATED_LEGACY_TABLE, ))
+        if cursor.fetchone()[0]:
+            return False, f"A tabela '{CONSOLIDATED_LEGACY_TABLE}' já existe; renomeie ou apague antes de migrar."
+
+        report_progress("Migrando 'consolidated_data' para o armazenamento por dicionário...")
+        cursor.execute("""
+            INSERT INTO questions (question_code)
+            SELECT DISTINCT question_code FROM consolidated_data ORDER BY question_code
+            ON CONFLICT (question_code) DO NOTHING;
+        """)
+        cursor.execute("""
+            INSERT INTO answers (answer_value)
+            SELECT DISTINCT answer_value FROM consolidated_data WHERE answer_value IS NOT NULL
+            ON CONFLICT ((md5(answer_value))) DO NOTHING;
+        """)
+        conn.commit()
+
+        cursor.execute("SELECT MIN(id), MAX(id) FROM consolidated_data;")
+        min_id, max_id = cursor.fetchone()
+        migrated = 0
+        if min_id is not None:
+            for start in range(min_id, max_id + 1, batch_size):
+                # Sem alvo no ON CONFLICT: ignora tanto o id já copiado numa tentativa
+                # anterior quanto a pergunta já consolidada no formato novo
+                cursor.execute("""
+                    INSERT INTO consolidated_answers (id, respondent_id, survey_id, question_id, answer_id)
+                    SELECT c.id, c.respondent_id, c.survey_id, q.question_id, a.answer_id
+                    FROM consolidated_data c
+                    JOIN questions q ON q.question_code = c.question_code
+                    LEFT JOIN answers a ON md5(a.answer_value) = md5(c.answer_value)
+                    WHERE c.id >= %s AND c.id < %s
+                    ON CONFLICT DO NOTHING;
+                """, (start, start + batch_size))
+                migrated += cursor.rowcount
+                conn.commit()
+                report_progress(f"  - ids até {min(start + batch_size - 1, max_id)} de {max_id}: "
+                                f"{migrated} registros copiados.")
+
+        _advance_consolidated_sequence(cursor)
+        cursor.execute(sql.SQL("ALTER TABLE consolidated_data RENAME TO {};").format(
+            sql.Identifier(CONSOLIDATED_LEGACY_TABLE)))
+        create_consolidated_view(cursor)
+        conn.commit()
+        return True, (f"Migração concluída: {migrated} registros copiados para 'consolidated_answers'; "
+                      f"tabela antiga mantida como '{CONSOLIDATED_LEGACY_TABLE}'.")
+    except Exception as e:
+        conn.rollback()
+        report_error(f"Erro na migração de 'consolidated_data': {e}")
+        return False, f"Erro na migração de 'consolidated_data': {e}"
+    finally:
+        cursor.close()
+        conn.close()  # Encerrar a sessão libera o advisory lock
+
+
+def encode_dictionary_values(cursor, table: str, values) -> dict:
+    """
+    Ids dos valores no dicionário 'questions' (códigos) ou 'answers' (respostas),
+    inserindo os que ainda não existem. Inserções concorrentes do mesmo valor
+    convergem para o mesmo id (ON CONFLICT + releitura).
+
+    Returns:
+        dict: valor -> id
+    """
+    values = sorted({v for v in values if v is not None})
+    if not values:
+        return {}
+    if table == "questions":
+        insert_sql = "INSERT INTO questions (question_code) VALUES %s ON CONFLICT (question_code) DO NOTHING;"
+        select_sql = "SELECT question_code, question_id FROM questions WHERE question_code = ANY(%s);"
+        keys = values
+    elif table == "answers":
+        insert_sql = "INSERT INTO answers (answer_value) VALUES %s ON CONFLICT ((md5(answer_value))) DO NOTHING;"
+        select_sql = "SELECT answer_value, answer_id FROM answers WHERE md5(answer_value) = ANY(%s);"
+        keys = [hashlib.md5(v.encode("utf-8")).hexdigest() for v in values]
+    else:
+        raise ValueError(f"Dicionário desconhecido: {table}")
+
+    cursor.execute(select_sql, (keys, ))
+    ids = dict(cursor.fetchall())
+    missing = [(v, ) for v in values if v not in ids]
+    if missing:
+        execute_values(cursor, insert_sql, missing)
+        cursor.execute(select_sql, (keys, ))
+        ids = dict(cursor.fetchall())
+    return ids
+
+
+def read_consolidated_encoded(conn, where_clause: str = "", params: tuple = (),
+                              descending: bool = False) -> pd.DataFrame:
+    """
+    Lê 'consolidated_answers' trazendo só os ids e monta 'question_code' e
+    'answer_value' como categóricos direto dos dicionários, sem transferir o
+    texto de cada linha. Mesmas colunas da visão 'consolidated_data'.
+    """
+    order = "DESC" if descending else ""
+    codes_df = read_sql(f"""
+        SELECT id, respondent_id, survey_id, question_id, answer_id
+        FROM consolidated_answers
+        {where_clause}
+        ORDER BY id {order};
+    """, conn, params=params or None)
+
+    question_ids = codes_df["question_id"].dropna().unique().astype(int).tolist()
+    answer_ids = codes_df["answer_id"].dropna().unique().astype(int).tolist()
+    questions = read_sql(
+        "SELECT question_id, question_code FROM questions WHERE question_id = ANY(%s) ORDER BY question_code;",
+        conn, params=(question_ids, ))
+    answers = read_sql(
+        "SELECT answer_id, answer_value FROM answers WHERE answer_id = ANY(%s) ORDER BY answer_value;",
+        conn, params=(answer_ids, ))
+
+    # Posição do id no dicionário ordenado = código do categórico (-1 = nulo)
+    question_codes = pd.Index(questions["question_id"]).get_indexer(codes_df["question_id"])
+    answer_codes = pd.Index(answers["answer_id"]).get_indexer(codes_df["answer_id"])
+    return pd.DataFrame({
+        "id": codes_df["id"],
+        "respondent_id": codes_df["respondent_id"],
+        "survey_id": codes_df["survey_id"],
+        "question_code": pd.Categorical.from_codes(question_codes, categories=questions["question_code"]),
+        "answer_value": pd.Categorical.from_codes(answer_codes, categories=answers["answer_value"]),
+    })
+
+
 # --- Funções de CRUD para a tabela 'surveys' ---
 
 
@@ -235,7 +567,7 @@ def delete_survey(survey_id: int) -> bool:
     # Lista de tabelas das quais devemos deletar, em ordem de dependência (filhos primeiro)
     tables_to_delete_from = [
         "analytics_respondents",
-        "consolidated_data",
+        "consolidated_answers",
         "consolidation_log",
         "survey_respondent_data",
         "surveys"  # A tabela principal, 'surveys', é sempre a última
@@ -295,10 +627,10 @@ def get_all_surveys() -> pd.DataFrame:
             FROM surveys 
             ORDER BY creation_date DESC;
         """
-        df = pd.read_sql_query(query, conn)
+        df = read_sql(query, conn)
         return df
     except Exception as e:
-        st.error(f"Erro detalhado ao buscar pesquisas (get_all_surveys): {e}")
+        report_error(f"Erro detalhado ao buscar pesquisas (get_all_surveys): {e}")
         # Mantive o print para nos ajudar em futuros debugs
         print(f"DEBUG get_all_surveys: {e}")
         return pd.DataFrame()
@@ -379,6 +711,8 @@ def get_total_expected_collection() -> int:
         cursor.close()
 
 
+@instrument_stage(rows_in=lambda args, kwargs: len((args[1] if len(args) > 1 else kwargs.get("raw_api_data")) or []),
+                  rows_out=lambda result: result[1])
 def store_respondent_data(
         survey_id: int,
         raw_api_data: list,
@@ -458,11 +792,12 @@ def store_respondent_data(
         cursor.close()
 
 
+@instrument_stage(rows_in=lambda args, kwargs: None)
 def consolidate_survey_data(survey_id: int) -> tuple[bool, str]:
     """
     Extrai dados do JSONB da tabela survey_respondent_data,
     filtra apenas pelas chaves que estão no dicionário de mapeamento,
-    e insere os dados na tabela consolidada.
+    e insere os dados na tabela consolidada (ids dos dicionários 'questions'/'answers').
     """
     from src.data_processing import perguntas_alvo_codigos  # Importação local para evitar import circular
     target_codes = set(perguntas_alvo_codigos.keys())
@@ -500,19 +835,27 @@ def consolidate_survey_data(survey_id: int) -> tuple[bool, str]:
         if not values_to_insert:
             return True, "Nenhuma pergunta mapeada encontrada nos dados dos respondentes."
 
-        # 3. Inserir os dados na tabela consolidada usando ON CONFLICT
+        # 3. Codificar códigos e respostas pelos dicionários (inserindo os novos)
+        question_ids = encode_dictionary_values(cursor, "questions", questions_found_in_this_run)
+        answer_ids = encode_dictionary_values(cursor, "answers", (row[3] for row in values_to_insert))
+        encoded_values = [
+            (respondent_id, survey_id, question_ids[key], answer_ids.get(value))
+            for respondent_id, survey_id, key, value in values_to_insert
+        ]
+
+        # 4. Inserir os dados na tabela consolidada usando ON CONFLICT
         # Isso garante que se o processo for executado novamente, ele não criará duplicatas, apenas atualizará os dados existentes.
         query = sql.SQL("""
-            INSERT INTO consolidated_data (respondent_id, survey_id, question_code, answer_value)
+            INSERT INTO consolidated_answers (respondent_id, survey_id, question_id, answer_id)
             VALUES %s
-            ON CONFLICT (respondent_id, survey_id, question_code)
-            DO UPDATE SET answer_value = EXCLUDED.answer_value;
+            ON CONFLICT (respondent_id, survey_id, question_id)
+            DO UPDATE SET answer_id = EXCLUDED.answer_id;
         """)
 
         # psycopg2.extras.execute_values é otimizado para inserções em lote
-        execute_values(cursor, query, values_to_insert)
+        execute_values(cursor, query, encoded_values)
 
-        # 4. Atualizar a tabela de log com as métricas
+        # 5. Atualizar a tabela de log com as métricas
         log_query = sql.SQL("""
             INSERT INTO consolidation_log (survey_id, last_consolidated_at, unique_questions_consolidated)
             VALUES (%s, NOW(), %s)
@@ -553,7 +896,7 @@ def get_consolidation_log() -> pd.DataFrame:
         ORDER BY s.creation_date DESC;
     """
     try:
-        df = pd.read_sql_query(query, conn)
+        df = read_sql(query, conn)
         return df
     except Exception:
         return pd.DataFrame()
@@ -571,10 +914,10 @@ def get_consolidated_data(limit: int = 1000) -> pd.DataFrame:
     query = "SELECT * FROM consolidated_data ORDER BY id DESC LIMIT %s;"
 
     try:
-        df = pd.read_sql_query(query, conn, params=(limit, ))
+        df = read_sql(query, conn, params=(limit, ))
         return df
     except Exception as e:
-        st.error(f"Erro ao buscar dados consolidados: {e}")
+        report_error(f"Erro ao buscar dados consolidados: {e}")
         return pd.DataFrame()
 
 
@@ -614,19 +957,18 @@ def update_survey_stats(survey_id: int, collected_count: int,
 
 def get_all_consolidated_data() -> pd.DataFrame:
     """
-    Busca TODOS os dados da tabela consolidada.
+    Busca TODOS os dados da tabela consolidada
+    ('question_code' e 'answer_value' como categóricos, ver 'read_consolidated_encoded').
     """
     conn = get_db_connection()
     if conn is None:
         return pd.DataFrame()
 
-    query = "SELECT * FROM consolidated_data ORDER BY id;"
-
     try:
-        df = pd.read_sql_query(query, conn)
+        df = read_consolidated_encoded(conn)
         return df
     except Exception as e:
-        st.error(f"Erro ao buscar todos os dados consolidados: {e}")
+        report_error(f"Erro ao buscar todos os dados consolidados: {e}")
         return pd.DataFrame()
 
 
@@ -662,21 +1004,128 @@ def get_surveys_with_recent_new_data(limit_surveys: int = 5) -> list:
 
 def get_consolidated_data_for_surveys(survey_ids: list) -> pd.DataFrame:
     """
-    Busca todos os dados consolidados para uma lista específica de survey_ids.
+    Busca todos os dados consolidados para uma lista específica de survey_ids
+    ('question_code' e 'answer_value' como categóricos, ver 'read_consolidated_encoded').
     """
     conn = get_db_connection()
     if conn is None or not survey_ids:
         return pd.DataFrame()
 
-    # A cláusula "WHERE survey_id = ANY(%s)" é uma forma eficiente de buscar múltiplos IDs
-    query = "SELECT * FROM consolidated_data WHERE survey_id = ANY(%s) ORDER BY id DESC;"
+    try:
+        # A cláusula "WHERE survey_id = ANY(%s)" é uma forma eficiente de buscar múltiplos IDs;
+        # passamos a lista de IDs como um único parâmetro
+        df = read_consolidated_encoded(conn, "WHERE survey_id = ANY(%s)", (list(survey_ids), ),
+                                       descending=True)
+        return df
+    except Exception as e:
+        report_error(f"Erro ao buscar dados consolidados por pesquisa: {e}")
+        return pd.DataFrame()
+
+
+def get_question_frequencies(survey_ids: list | None = None) -> pd.DataFrame:
+    """
+    Retorna as tabelas de frequência de respostas agregadas no próprio PostgreSQL,
+    no formato longo (question_code, answer_value, count).
+    Se 'survey_ids' for None, agrega sobre todas as pesquisas.
+    Respostas nulas são ignoradas, como no value_counts do Pandas.
+    """
+    conn = get_db_connection()
+    if conn is None or (survey_ids is not None and not survey_ids):
+        return pd.DataFrame(columns=['question_code', 'answer_value', 'count'])
+
+    where_clause = "WHERE answer_id IS NOT NULL"
+    params = ()
+    if survey_ids is not None:
+        where_clause += " AND survey_id = ANY(%s)"
+        params = (list(survey_ids), )
+
+    # Agrupa pelos ids inteiros e só então busca os textos nos dicionários
+    query = f"""
+        SELECT q.question_code, a.answer_value, f.count
+        FROM (
+            SELECT question_id, answer_id, COUNT(*) AS count
+            FROM consolidated_answers
+            {where_clause}
+            GROUP BY question_id, answer_id
+        ) f
+        JOIN questions q ON q.question_id = f.question_id
+        JOIN answers a ON a.answer_id = f.answer_id
+        ORDER BY q.question_code, f.count DESC, a.answer_value;
+    """
+    try:
+        df = read_sql(query, conn, params=params)
+        return df
+    except Exception as e:
+        report_error(f"Erro ao buscar frequências de respostas: {e}")
+        return pd.DataFrame(columns=['question_code', 'answer_value', 'count'])
+
+
+def get_consolidated_data_summary(survey_ids: list | None = None) -> dict:
+    """
+    Conta linhas e respondentes únicos da tabela consolidada para um conjunto
+    de pesquisas (ou para todas, se 'survey_ids' for None), sem trazer os registros.
+    """
+    summary = {"total_rows": 0, "unique_respondents": 0}
+    conn = get_db_connection()
+    if conn is None or (survey_ids is not None and not survey_ids):
+        return summary
+
+    where_clause = ""
+    params = ()
+    if survey_ids is not None:
+        where_clause = "WHERE survey_id = ANY(%s)"
+        params = (list(survey_ids), )
+
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            f"""
+            SELECT COUNT(*), COUNT(DISTINCT respondent_id)
+            FROM consolidated_answers
+            {where_clause};
+            """, params)
+        total_rows, unique_respondents = cursor.fetchone()
+        summary["total_rows"] = int(total_rows or 0)
+        summary["unique_respondents"] = int(unique_respondents or 0)
+        return summary
+    except Exception as e:
+        conn.rollback()
+        report_error(f"Erro ao resumir dados consolidados: {e}")
+        return summary
+    finally:
+        cursor.close()
+
 
+def get_consolidated_data_page(survey_ids: list | None = None,
+                               limit: int = 500,
+                               offset: int = 0) -> pd.DataFrame:
+    """
+    Busca uma página dos registros consolidados (mais recentes primeiro),
+    para visualização paginada sem carregar a tabela inteira na sessão.
+    """
+    conn = get_db_connection()
+    if conn is None or (survey_ids is not None and not survey_ids):
+        return pd.DataFrame()
+
+    where_clause = ""
+    params: tuple = ()
+    if survey_ids is not None:
+        where_clause = "WHERE survey_id = ANY(%s)"
+        params = (list(survey_ids), )
+
+    query = f"""
+        SELECT * FROM consolidated_data
+        {where_clause}
+        ORDER BY id DESC
+        LIMIT %s OFFSET %s;
+    """
     try:
-        # Passamos a lista de IDs como um único parâmetro
-        df = pd.read_sql_query(query, conn, params=(survey_ids, ))
+        df = read_sql(query,
+                      conn,
+                      params=params + (int(limit), int(offset)))
         return df
     except Exception as e:
-        st.error(f"Erro ao buscar dados consolidados por pesquisa: {e}")
+        report_error(f"Erro ao buscar página de dados consolidados: {e}")
         return pd.DataFrame()
 
 
@@ -706,10 +1155,10 @@ def get_updatable_surveys() -> pd.DataFrame:
                 (collected_percentage < 99.00 OR collected_percentage IS NULL)
             ORDER BY creation_date DESC;
         """
-        df = pd.read_sql_query(query, conn)
+        df = read_sql(query, conn)
         return df
     except Exception as e:
-        st.error(f"Erro detalhado ao buscar pesquisas atualizáveis: {e}")
+        report_error(f"Erro detalhado ao buscar pesquisas atualizáveis: {e}")
         return pd.DataFrame()
 
 
@@ -727,7 +1176,7 @@ def resync_full_survey(survey_id: int, api_link: str) -> tuple[bool, str]:
     # Tabelas das quais os dados da pesquisa serão deletados, em ordem
     tables_to_delete_from = [
         "analytics_respondents",  # Se já estiver em uso
-        "consolidated_data",
+        "consolidated_answers",
         "consolidation_log",
         "survey_respondent_data"
     ]
@@ -735,7 +1184,7 @@ def resync_full_survey(survey_id: int, api_link: str) -> tuple[bool, str]:
     cursor = conn.cursor()
     try:
         # --- PARTE 1: DELETAR DADOS ANTIGOS ---
-        st.write(
+        report_progress(
             f"Iniciando re-sincronização para survey_id: {survey_id}. Removendo dados antigos..."
         )
         for table in tables_to_delete_from:
@@ -743,33 +1192,34 @@ def resync_full_survey(survey_id: int, api_link: str) -> tuple[bool, str]:
                 query = sql.SQL("DELETE FROM {table} WHERE survey_id = %s"
                                 ).format(table=sql.Identifier(table))
                 cursor.execute(query, (survey_id, ))
-                st.write(f"  - Registros de '{table}' removidos.")
+                report_progress(f"  - Registros de '{table}' removidos.")
             except psycopg2.errors.UndefinedTable:
                 # Ignora o erro se a tabela ainda não existir (ex: analytics_respondents)
-                st.write(f"  - Tabela '{table}' não encontrada, pulando.")
+                report_progress(f"  - Tabela '{table}' não encontrada, pulando.")
                 pass
 
         # --- PARTE 2: RE-INGERIR E PROCESSAR NOVOS DADOS ---
-        st.write("Buscando dados atualizados da API...")
-        raw_data_list = fetch_data_from_api(api_link)
-        if raw_data_list is None or not raw_data_list:
+        report_progress("Buscando dados atualizados da API...")
+        raw_df = fetch_dataframe_from_api(api_link)
+        if raw_df is None or raw_df.empty:
             raise ValueError(
                 "Falha ao buscar dados da API ou a API não retornou dados.")
 
-        st.write("Mapeando colunas e salvando novos dados dos respondentes...")
-        mapped_data_list, _ = map_api_columns_to_target_codes(raw_data_list)
+        report_progress("Mapeando colunas e salvando novos dados dos respondentes...")
+        mapped_df, _ = map_api_dataframe_columns(raw_df, survey_id)
+        mapped_data_list = dataframe_to_records(mapped_df)
         success, num_added, warn_msg = store_respondent_data(
             survey_id, mapped_data_list)
         if not success:
             raise Exception(
                 f"Falha ao armazenar dados dos respondentes: {warn_msg}")
 
-        st.write("Consolidando dados...")
+        report_progress("Consolidando dados...")
         consol_success, consol_msg = consolidate_survey_data(survey_id)
         if not consol_success:
             raise Exception(f"Falha ao consolidar dados: {consol_msg}")
 
-        st.write("Atualizando estatísticas...")
+        report_progress("Atualizando estatísticas...")
         survey_df = get_all_surveys(
         )  # Pega os dados atualizados para o expected_total
         expected_total = survey_df.loc[survey_df['survey_id'] == survey_id,
@@ -791,6 +1241,7 @@ def resync_full_survey(survey_id: int, api_link: str) -> tuple[bool, str]:
 # Em src/database.py
 
 
+@instrument_stage()
 def save_analytics_data(df: pd.DataFrame) -> tuple[bool, str]:
     """
     Versão final que lida com valores NaN antes de salvar na tabela de analytics.
@@ -870,7 +1321,8 @@ def check_api_link_exists(api_link: str) -> str | None:
 
 def get_analytics_data() -> pd.DataFrame:
     """
-    Busca dados da tabela principal E da tabela histórica, unindo os resultados.
+    Busca dados da tabela principal E da tabela histórica, unindo os resultados,
+    já com os tipos compactos de src/analytics_schema.py (rótulos como 'category').
     """
     conn = get_db_connection()
     if conn is None: return pd.DataFrame()
@@ -882,17 +1334,470 @@ def get_analytics_data() -> pd.DataFrame:
         SELECT * FROM analytics_respondents_historical;
     """
     try:
-        df = pd.read_sql_query(query, conn)
-        return df
+        df = read_sql(query, conn)
+        return apply_analytics_schema(df)
     except Exception as e:
         if "relation \"analytics_respondents_historical\" does not exist" in str(e):
              # Se a tabela histórica ainda não existe, busca apenas da principal
              st.warning("Tabela histórica não encontrada, carregando apenas dados recentes.")
-             return pd.read_sql_query("SELECT * FROM analytics_respondents;", conn)
+             return apply_analytics_schema(read_sql("SELECT * FROM analytics_respondents;", conn))
         else:
-            st.error(f"Erro ao buscar dados de análise: {e}")
+            report_error(f"Erro ao buscar dados de análise: {e}")
             return pd.DataFrame()
 
 
 
+def get_area_category_cache(versao: str) -> dict:
+    """
+    Carrega o dicionário texto normalizado -> categoria das áreas comuns
+    para a versão de categorização informada.
+    """
+    conn = get_db_connection()
+    if conn is None: return {}
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            "SELECT texto_norm, categoria FROM area_categorization_cache WHERE versao = %s;",
+            (versao,))
+        return dict(cursor.fetchall())
+    except Exception as e:
+        conn.rollback()
+        report_error(f"Erro ao carregar o cache de categorização de áreas: {e}")
+        return {}
+    finally:
+        cursor.close()
+
+
+def save_area_category_cache(entries: list, versao: str) -> tuple[bool, str]:
+    """
+    Persiste novas entradas (texto_norm, categoria, score_semantico) do dicionário
+    de categorização de áreas. Entradas já existentes para a versão são mantidas.
+    """
+    conn = get_db_connection()
+    if conn is None: return False, "Falha na conexão com o banco de dados."
+    if not entries: return True, "Nenhuma categorização nova para salvar."
+
+    values = [(texto, versao, categoria, score) for texto, categoria, score in entries]
+    cursor = conn.cursor()
+    try:
+        execute_values(
+            cursor,
+            """
+            INSERT INTO area_categorization_cache (texto_norm, versao, categoria, score_semantico)
+            VALUES %s
+            ON CONFLICT (texto_norm, versao) DO NOTHING;
+            """,
+            values,
+        )
+        conn.commit()
+        return True, f"{len(values)} categorizações de áreas salvas."
+    except Exception as e:
+        conn.rollback()
+        return False, f"Erro ao salvar o cache de categorização de áreas: {e}"
+    finally:
+        cursor.close()
+
+
+def get_header_mapping_decisions(survey_id: int, versao: str) -> dict:
+    """
+    Carrega as decisões já tomadas (cabeçalho -> código ou None) para os
+    cabeçalhos da pesquisa na versão informada do índice aproximado.
+    """
+    conn = get_db_connection()
+    if conn is None: return {}
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            """
+            SELECT header, mapped_code FROM header_mapping_decisions
+            WHERE survey_id = %s AND versao = %s;
+            """, (survey_id, versao))
+        return dict(cursor.fetchall())
+    except Exception as e:
+        conn.rollback()
+        report_error(f"Erro ao carregar decisões de mapeamento de cabeçalhos: {e}")
+        return {}
+    finally:
+        cursor.close()
+
+
+def save_header_mapping_decisions(survey_id: int, versao: str,
+                                  entries: list) -> tuple[bool, str]:
+    """
+    Persiste decisões (header, mapped_code, score, matched_text) da correspondência
+    aproximada para a pesquisa. Decisões já existentes são mantidas.
+    """
+    conn = get_db_connection()
+    if conn is None: return False, "Falha na conexão com o banco de dados."
+    if not entries: return True, "Nenhuma decisão nova para salvar."
+
+    values = [(survey_id, header, versao, code, score, text)
+              for header, code, score, text in entries]
+    cursor = conn.cursor()
+    try:
+        execute_values(
+            cursor,
+            """
+            INSERT INTO header_mapping_decisions (survey_id, header, versao, mapped_code, score, matched_text)
+            VALUES %s
+            ON CONFLICT (survey_id, header, versao) DO NOTHING;
+            """,
+            values,
+        )
+        conn.commit()
+        return True, f"{len(values)} decisões de mapeamento salvas."
+    except Exception as e:
+        conn.rollback()
+        return False, f"Erro ao salvar decisões de mapeamento de cabeçalhos: {e}"
+    finally:
+        cursor.close()
+
+
+# --- Reclassificação de renda após mudança nas regras ---
+
+# Tabela -> (junção para obter a data de referência, expressão da data).
+# Na tabela viva a classificação usa a data de criação da pesquisa; na histórica, a data da coleta.
+INCOME_RECLASSIFICATION_TABLES = {
+    "analytics_respondents": (
+        "JOIN surveys s ON s.survey_id = t.survey_id", "s.creation_date"),
+    "analytics_respondents_historical": ("", "t.data_pesquisa::date"),
+}
+
+
+def _income_reclassification_cte(table: str, versoes: list, faixas: list) -> sql.Composed:
+    """
+    CTE 'alvo' com as linhas de 'table' dentro da validade das versões informadas
+    cuja classificação foi feita por outra versão (ou nenhuma), já com a nova classe.
+    """
+    join, data_ref = INCOME_RECLASSIFICATION_TABLES[table]
+    return sql.SQL("""
+        WITH versoes (fingerprint, data_inicio, data_fim) AS (VALUES {versoes}),
+        faixas (fingerprint, min_renda, max_renda, classe_agregada, classe_detalhada) AS (VALUES {faixas}),
+        alvo AS (
+            SELECT t.ctid AS linha, v.fingerprint,
+                   COALESCE(f.classe_agregada, {nao_classificado}) AS classe_agregada,
+                   COALESCE(f.classe_detalhada, {nao_classificado}) AS classe_detalhada
+            FROM {table} t {join}
+            JOIN versoes v ON {data_ref} BETWEEN v.data_inicio AND v.data_fim
+            LEFT JOIN faixas f ON f.fingerprint = v.fingerprint
+                 AND t.renda_valor_estimado BETWEEN f.min_renda AND f.max_renda
+            WHERE t.renda_valor_estimado IS NOT NULL
+              AND t.renda_regra_versao IS DISTINCT FROM v.fingerprint
+        )
+    """).format(
+        versoes=sql.SQL(", ").join(map(sql.Literal, versoes)),
+        faixas=sql.SQL(", ").join(map(sql.Literal, faixas)),
+        nao_classificado=sql.Literal(CLASSE_NAO_CLASSIFICADO),
+        table=sql.Identifier(table),
+        join=sql.SQL(join),
+        data_ref=sql.SQL(data_ref),
+    )
+
+
+def _existing_income_tables(cursor) -> list:
+    tabelas = []
+    for table in INCOME_RECLASSIFICATION_TABLES:
+        cursor.execute("SELECT to_regclass(%s) IS NOT NULL;", (table,))
+        if cursor.fetchone()[0]:
+            tabelas.append(table)
+    return tabelas
+
+
+def count_income_rows_to_reclassify(rules, version_ids: list | None = None) -> pd.DataFrame:
+    """
+    Prévia da reclassificação: quantas linhas de cada tabela, por versão de regra,
+    estão classificadas com uma versão diferente da vigente para a sua data.
+    'rules' é um IncomeRuleSet (src/income_rules.py).
+    """
+    conn = get_db_connection()
+    if conn is None: return pd.DataFrame()
+    versoes, faixas = rules.sql_rows(version_ids)
+    if not versoes: return pd.DataFrame(columns=["tabela", "versao", "linhas"])
+
+    cursor = conn.cursor()
+    try:
+        linhas = []
+        for table in _existing_income_tables(cursor):
+            query = _income_reclassification_cte(table, versoes, faixas) + sql.SQL(
+                "SELECT fingerprint, COUNT(*) FROM alvo GROUP BY fingerprint ORDER BY fingerprint;")
+            cursor.execute(query)
+            linhas.extend((table, fingerprint, total) for fingerprint, total in cursor.fetchall())
+        return pd.DataFrame(linhas, columns=["tabela", "versao", "linhas"])
+    except Exception as e:
+        conn.rollback()
+        report_error(f"Erro ao calcular a prévia da reclassificação de renda: {e}")
+        return pd.DataFrame()
+    finally:
+        cursor.close()
+
+
+def reclassify_income_classes(rules, version_ids: list | None = None) -> tuple[bool, str]:
+    """
+    Recalcula só 'renda_classe_agregada', 'renda_classe_detalhada' e 'renda_regra_versao'
+    a partir do 'renda_valor_estimado' já gravado, em 'analytics_respondents' e
+    'analytics_respondents_historical', com um UPDATE por tabela juntando as faixas
+    das regras (VALUES) às linhas dentro da validade de cada versão.
+
+    Só são tocadas as linhas cuja versão gravada difere da vigente para a sua data.
+    Com 'version_ids', restringe-se à janela de validade dessas versões; sem ele,
+    linhas que ficaram fora de qualquer versão passam a 'Versão de Regra Incompatível'.
+    """
+    conn = get_db_connection()
+    if conn is None: return False, "Falha na conexão com o banco de dados."
+    versoes, faixas = rules.sql_rows(version_ids)
+    if not versoes: return True, "Nenhuma versão de regra selecionada."
+
+    todas_versoes, _ = rules.sql_rows()
+    cursor = conn.cursor()
+    try:
+        resumo = []
+        for table in _existing_income_tables(cursor):
+            query = _income_reclassification_cte(table, versoes, faixas) + sql.SQL("""
+                UPDATE {table} t
+                SET renda_classe_agregada = a.classe_agregada,
+                    renda_classe_detalhada = a.classe_detalhada,
+                    renda_regra_versao = a.fingerprint
+                FROM alvo a
+                WHERE t.ctid = a.linha;
+            """).format(table=sql.Identifier(table))
+            cursor.execute(query)
+            atualizadas = cursor.rowcount
+
+            fora_de_versao = 0
+            if version_ids is None:
+                join, data_ref = INCOME_RECLASSIFICATION_TABLES[table]
+                cursor.execute(sql.SQL("""
+                    WITH versoes (fingerprint, data_inicio, data_fim) AS (VALUES {versoes}),
+                    fora AS (
+                        SELECT t.ctid AS linha
+                        FROM {table} t {join}
+                        WHERE t.renda_regra_versao IS NOT NULL
+                          AND {data_ref} IS NOT NULL
+                          AND NOT EXISTS (
+                              SELECT 1 FROM versoes v
+                              WHERE {data_ref} BETWEEN v.data_inicio AND v.data_fim
+                          )
+                    )
+                    UPDATE {table} t
+                    SET renda_classe_agregada = {incompativel},
+                        renda_classe_detalhada = {incompativel},
+                        renda_regra_versao = NULL
+                    FROM fora f
+                    WHERE t.ctid = f.linha;
+                """).format(
+                    versoes=sql.SQL(", ").join(map(sql.Literal, todas_versoes)),
+                    table=sql.Identifier(table),
+                    join=sql.SQL(join),
+                    data_ref=sql.SQL(data_ref),
+                    incompativel=sql.Literal(CLASSE_VERSAO_INCOMPATIVEL),
+                ))
+                fora_de_versao = cursor.rowcount
+            resumo.append(f"{table}: {atualizadas} reclassificadas"
+                          + (f", {fora_de_versao} fora de qualquer versão" if fora_de_versao else ""))
+        conn.commit()
+        return True, "Reclassificação de renda concluída. " + "; ".join(resumo) + "."
+    except Exception as e:
+        conn.rollback()
+        return False, f"Erro ao reclassificar a renda: {e}"
+    finally:
+        cursor.close()
+
+
 # Fim
+
+
+# --- Fila de jobs da pipeline ('pipeline_jobs') ---
+
+PIPELINE_JOB_TYPES = {
+    # tipo: (exige survey_id, descrição)
+    "resync": (True, "Re-sincronização completa"),
+    "reconsolidate": (False, "Re-consolidação de dados brutos"),
+    "transform": (False, "Pipeline de transformação completa"),
+    "refresh": (False, "Atualização a partir da API"),
+}
+PIPELINE_JOB_ACTIVE_STATUSES = ("pending", "running")
+
+
+def enqueue_pipeline_job(job_type: str, survey_id: int | None = None,
+                         params: dict | None = None, requested_by: str | None = None,
+                         max_attempts: int = 3) -> tuple[bool, str, int | None]:
+    """
+    Coloca um job na fila 'pipeline_jobs'. Se já houver um job ativo do mesmo tipo
+    para a mesma pesquisa, nada é criado e o id do existente é devolvido.
+
+    Returns:
+        (criado, mensagem, job_id)
+    """
+    if job_type not in PIPELINE_JOB_TYPES:
+        return False, f"Tipo de job desconhecido: '{job_type}'.", None
+    if PIPELINE_JOB_TYPES[job_type][0] and survey_id is None:
+        return False, f"O job '{job_type}' exige uma pesquisa.", None
+
+    conn = get_db_connection()
+    if conn is None: return False, "Falha na conexão com o banco de dados.", None
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            INSERT INTO pipeline_jobs (job_type, survey_id, params, requested_by, max_attempts)
+            VALUES (%s, %s, %s, %s, %s)
+            ON CONFLICT (job_type, COALESCE(survey_id, 0)) WHERE status IN ('pending', 'running')
+            DO NOTHING
+            RETURNING job_id;
+        """, (job_type, survey_id, json.dumps(params or {}), requested_by, max_attempts))
+        row = cursor.fetchone()
+        if row is None:
+            cursor.execute("""
+                SELECT job_id, status FROM pipeline_jobs
+                WHERE job_type = %s AND COALESCE(survey_id, 0) = COALESCE(%s, 0)
+                  AND status IN ('pending', 'running');
+            """, (job_type, survey_id))
+            existente = cursor.fetchone()
+            conn.commit()
+            if existente is None:
+                return False, "Não foi possível criar o job; tente novamente.", None
+            return False, f"Já existe um job igual ({existente[1]}): #{existente[0]}.", existente[0]
+        conn.commit()
+        return True, f"Job #{row[0]} colocado na fila.", row[0]
+    except Exception as e:
+        conn.rollback()
+        report_error(f"Erro ao colocar o job na fila: {e}")
+        return False, f"Erro ao colocar o job na fila: {e}", None
+    finally:
+        cursor.close()
+
+
+def get_pipeline_jobs(limit: int = 50, job_ids: list | None = None) -> pd.DataFrame:
+    """Jobs mais recentes (ou os de 'job_ids'), com o nome da pesquisa."""
+    conn = get_db_connection()
+    if conn is None: return pd.DataFrame()
+    filtro = sql.SQL("WHERE j.job_id = ANY(%s)") if job_ids else sql.SQL("")
+    query = sql.SQL("""
+        SELECT j.job_id, j.job_type, j.survey_id, s.research_name, j.status, j.attempts,
+               j.max_attempts, j.progress, j.progress_text, j.last_error, j.result,
+               j.requested_by, j.worker_id, j.created_at, j.started_at, j.heartbeat_at,
+               j.finished_at, j.run_after
+        FROM pipeline_jobs j
+        LEFT JOIN surveys s ON s.survey_id = j.survey_id
+        {filtro}
+        ORDER BY j.job_id DESC
+        LIMIT %s;
+    """).format(filtro=filtro)
+    args = ([list(job_ids)] if job_ids else []) + [limit]
+    try:
+        return read_sql(query.as_string(conn), conn, params=args)
+    except Exception as e:
+        conn.rollback()
+        report_error(f"Erro ao buscar os jobs da pipeline: {e}")
+        return pd.DataFrame()
+
+
+def cancel_pipeline_job(job_id: int) -> tuple[bool, str]:
+    """Cancela um job que ainda está na fila (jobs em execução não são interrompidos)."""
+    conn = get_db_connection()
+    if conn is None: return False, "Falha na conexão com o banco de dados."
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            UPDATE pipeline_jobs SET status = 'cancelled', finished_at = CURRENT_TIMESTAMP
+            WHERE job_id = %s AND status = 'pending';
+        """, (job_id,))
+        cancelado = cursor.rowcount == 1
+        conn.commit()
+        if cancelado:
+            return True, f"Job #{job_id} cancelado."
+        return False, f"Job #{job_id} não está mais na fila (já começou ou terminou)."
+    except Exception as e:
+        conn.rollback()
+        report_error(f"Erro ao cancelar o job #{job_id}: {e}")
+        return False, f"Erro ao cancelar o job: {e}"
+    finally:
+        cursor.close()
+
+
+# --- Métricas de execução da pipeline ('pipeline_metrics') ---
+
+PIPELINE_METRICS_COLUMNS = ("run_id", "run_name", "kind", "stage", "parent", "started_at",
+                            "duration_s", "rows_in", "rows_out", "bytes", "ok", "details",
+                            "calls", "max_duration_s")
+
+
+def save_pipeline_metrics(records: list) -> tuple[bool, str]:
+    """Grava os registros de uma execução (StageRecord de src/instrumentation.py)."""
+    if not records:
+        return True, "Nenhuma métrica para gravar."
+    conn = get_db_connection()
+    if conn is None: return False, "Falha na conexão com o banco de dados."
+    cursor = conn.cursor()
+    try:
+        execute_values(
+            cursor,
+            sql.SQL("INSERT INTO pipeline_metrics ({}) VALUES %s").format(
+                sql.SQL(", ").join(map(sql.Identifier, PIPELINE_METRICS_COLUMNS))).as_string(conn),
+            [tuple(getattr(r, c) for c in PIPELINE_METRICS_COLUMNS) for r in records],
+            page_size=1000,
+        )
+        conn.commit()
+        return True, f"{len(records)} métricas gravadas."
+    except Exception as e:
+        conn.rollback()
+        logger.warning(f"Erro ao gravar métricas da pipeline: {e}")
+        return False, f"Erro ao gravar métricas da pipeline: {e}"
+    finally:
+        cursor.close()
+
+
+def purge_pipeline_metrics(older_than_days: int) -> tuple[bool, str]:
+    """Apaga de 'pipeline_metrics' as execuções iniciadas há mais de 'older_than_days' dias."""
+    conn = get_db_connection()
+    if conn is None: return False, "Falha na conexão com o banco de dados."
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            DELETE FROM pipeline_metrics
+            WHERE run_id IN (SELECT run_id FROM pipeline_metrics
+                             WHERE kind = 'run' AND started_at < NOW() - make_interval(days => %s));
+        """, (older_than_days, ))
+        removed = cursor.rowcount
+        conn.commit()
+        return True, f"{removed} métricas com mais de {older_than_days} dias apagadas."
+    except Exception as e:
+        conn.rollback()
+        logger.warning(f"Erro ao limpar as métricas da pipeline: {e}")
+        return False, f"Erro ao limpar as métricas da pipeline: {e}"
+    finally:
+        cursor.close()
+
+
+def get_pipeline_runs(limit: int = 50) -> pd.DataFrame:
+    """Execuções gravadas em 'pipeline_metrics', da mais recente para a mais antiga."""
+    conn = get_db_connection()
+    if conn is None: return pd.DataFrame()
+    query = """
+        SELECT run_id, run_name, started_at, duration_s, ok, details,
+               EXISTS (SELECT 1 FROM pipeline_metrics p
+                       WHERE p.run_id = m.run_id AND p.kind = 'profile') AS has_profile
+        FROM pipeline_metrics m
+        WHERE kind = 'run'
+        ORDER BY started_at DESC
+        LIMIT %s;
+    """
+    try:
+        return read_sql(query, conn, params=(limit, ))
+    except Exception as e:
+        conn.rollback()
+        report_error(f"Erro ao buscar as execuções da pipeline: {e}")
+        return pd.DataFrame()
+
+
+def get_pipeline_metrics(run_id: str) -> pd.DataFrame:
+    """Todos os registros de uma execução, na ordem em que terminaram."""
+    conn = get_db_connection()
+    if conn is None: return pd.DataFrame()
+    query = sql.SQL("SELECT {} FROM pipeline_metrics WHERE run_id = %s ORDER BY id;").format(
+        sql.SQL(", ").join(map(sql.Identifier, PIPELINE_METRICS_COLUMNS)))
+    try:
+        return read_sql(query.as_string(conn), conn, params=(run_id, ))
+    except Exception as e:
+        conn.rollback()
+        report_error(f"Erro ao buscar as métricas da execução {run_id}: {e}")
+        return pd.DataFrame()
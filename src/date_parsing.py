@@ -0,0 +1,124 @@
+# src/date_parsing.py
+"""
+Conversão vetorizada de colunas de data com vários formatos possíveis.
+
+Em vez de tentar formato por formato em cada linha (com exceções como controle
+de fluxo), a coluna é reduzida aos seus valores distintos e cada formato explícito
+é aplicado de uma vez com 'pd.to_datetime', só sobre os valores que ainda não foram
+convertidos. O que sobrar pode passar por uma última tentativa com inferência
+('format="mixed"'). O relatório diz quantas linhas cada etapa converteu.
+"""
+import datetime
+
+import numpy as np
+import pandas as pd
+
+# Textos que significam "sem data" nas bases (além de nulos)
+DATE_SENTINELS = frozenset({"-", "", "nan", "NaN", "NaT", "None"})
+
+# Datas da API (Data): padrão brasileiro, com ou sem horário
+DAYFIRST_FORMATS = (
+    "%d/%m/%Y",
+    "%d/%m/%Y %H:%M:%S",
+    "%d/%m/%Y %H:%M",
+    "%Y-%m-%d",
+    "%Y-%m-%d %H:%M:%S",
+)
+
+# Base histórica 2021-24 (coluna 'Fim'): DD/MM/YYYY e, quando não couber, MM/DD/YYYY
+HISTORICAL_FORMATS = (
+    "%d/%m/%Y",
+    "%m/%d/%Y",
+)
+
+ETAPA_DATETIME = "ja_era_data"
+ETAPA_INFERIDO = "inferido"
+ETAPA_VAZIO = "vazio"
+ETAPA_INVALIDO = "invalido"
+
+
+def parse_dates(values, formats=DAYFIRST_FORMATS, infer_remaining: bool = True,
+                dayfirst: bool = False) -> tuple[pd.Series, dict]:
+    """
+    Converte 'values' para datetime64 testando 'formats' em ordem; cada formato só
+    é aplicado aos valores ainda não convertidos. Objetos que já são datas passam direto.
+
+    Args:
+        values: Series (ou lista) com textos e/ou datas.
+        formats: formatos explícitos, em ordem de prioridade.
+        infer_remaining: tenta inferir ('format="mixed"') o que nenhum formato converteu.
+        dayfirst: repassado à inferência.
+
+    Returns:
+        (serie_convertida, relatorio): relatorio = {etapa: número de linhas}, com uma
+        entrada por formato, 'ja_era_data', 'inferido', 'vazio' e 'invalido'.
+    """
+    series = values if isinstance(values, pd.Series) else pd.Series(values)
+    relatorio = {ETAPA_DATETIME: 0, **{fmt: 0 for fmt in formats}}
+    if infer_remaining:
+        relatorio[ETAPA_INFERIDO] = 0
+
+    if pd.api.types.is_datetime64_any_dtype(series.dtype):
+        relatorio[ETAPA_DATETIME] = int(series.notna().sum())
+        relatorio[ETAPA_VAZIO] = int(series.isna().sum())
+        relatorio[ETAPA_INVALIDO] = 0
+        return series, relatorio
+
+    # Trabalha sobre os valores distintos; as contagens por linha vêm das frequências
+    codes, uniques = pd.factorize(series, use_na_sentinel=True)
+    if len(uniques) == 0:
+        # Coluna vazia ou só com nulos (ex.: exportação sem 'Data'): nada a converter
+        relatorio[ETAPA_VAZIO] = len(series)
+        relatorio[ETAPA_INVALIDO] = 0
+        return pd.Series(pd.NaT, index=series.index, name=series.name, dtype="datetime64[ns]"), relatorio
+    frequencias = np.bincount(codes[codes >= 0], minlength=len(uniques))
+    uniques = pd.Series(np.asarray(uniques, dtype=object))
+
+    convertidas = pd.Series(pd.NaT, index=uniques.index, dtype="datetime64[ns]")
+    etapa = np.full(len(uniques), None, dtype=object)
+
+    ja_data = uniques.map(
+        lambda v: isinstance(v, (datetime.date, np.datetime64))).to_numpy(dtype=bool)
+    if ja_data.any():
+        convertidas[ja_data] = pd.to_datetime(uniques[ja_data], errors="coerce")
+        etapa[ja_data] = ETAPA_DATETIME
+
+    textos = uniques.where(~ja_data).astype("string").str.strip()
+    vazio = textos.isna().to_numpy() | textos.isin(DATE_SENTINELS).fillna(False).to_numpy()
+    vazio &= ~ja_data
+    pendentes = ~ja_data & ~vazio
+
+    for fmt in formats:
+        if not pendentes.any():
+            break
+        tentativa = pd.to_datetime(textos[pendentes], format=fmt, errors="coerce")
+        ok = tentativa.notna()
+        indices = tentativa.index[ok]
+        convertidas[indices] = tentativa[ok]
+        etapa[indices] = fmt
+        pendentes[indices] = False
+
+    if infer_remaining and pendentes.any():
+        tentativa = pd.to_datetime(textos[pendentes], format="mixed", dayfirst=dayfirst,
+                                   errors="coerce")
+        ok = tentativa.notna()
+        indices = tentativa.index[ok]
+        convertidas[indices] = tentativa[ok]
+        etapa[indices] = ETAPA_INFERIDO
+        pendentes[indices] = False
+
+    for nome in relatorio:
+        relatorio[nome] = int(frequencias[etapa == nome].sum())
+    relatorio[ETAPA_VAZIO] = int(frequencias[vazio].sum() + (codes < 0).sum())
+    relatorio[ETAPA_INVALIDO] = int(frequencias[pendentes].sum())
+
+    resultado = pd.Series(
+        np.where(codes >= 0, convertidas.to_numpy()[np.maximum(codes, 0)], np.datetime64("NaT")),
+        index=series.index, name=series.name,
+    ).astype("datetime64[ns]")
+    return resultado, relatorio
+
+
+def format_date_report(relatorio: dict) -> str:
+    """Relatório de 'parse_dates' em linhas 'etapa: linhas', omitindo etapas sem linhas."""
+    return "\n".join(f"{etapa}: {total}" for etapa, total in relatorio.items() if total)
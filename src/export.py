@@ -0,0 +1,315 @@
+# src/export.py
+"""
+Exportação da base unificada (XLSX, CSV.gz e Parquet).
+
+O XLSX é escrito em streaming direto no XML da planilha: cada coluna é fatorada
+uma única vez (respostas têm poucos valores distintos), o XML de cada valor
+distinto é montado uma vez só e as linhas são emitidas em blocos dentro do zip,
+sem criar um objeto de célula por valor como o openpyxl faz.
+"""
+import csv
+import gzip
+import hashlib
+import io
+import json
+import re
+import zipfile
+from datetime import date, datetime
+from xml.sax.saxutils import escape
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PARQUET_AVAILABLE = True
+except Exception:
+    PARQUET_AVAILABLE = False
+
+
+EXPORT_FORMATS = {
+    "xlsx": {
+        "label": "Excel (.xlsx)",
+        "extension": "xlsx",
+        "mime": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    },
+    "csv.gz": {
+        "label": "CSV compactado (.csv.gz)",
+        "extension": "csv.gz",
+        "mime": "application/gzip",
+    },
+    "parquet": {
+        "label": "Parquet (.parquet)",
+        "extension": "parquet",
+        "mime": "application/vnd.apache.parquet",
+    },
+}
+
+MISSING_VALUE = "-"
+EXCEL_MAX_CELL_CHARS = 32767
+XLSX_ROWS_PER_BLOCK = 2000
+CSV_ROWS_PER_BLOCK = 5000
+
+_ILLEGAL_XML_CHARS = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f]")
+_EXCEL_EPOCH = np.datetime64("1899-12-30")
+
+_CONTENT_TYPES_XML = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '<Override PartName="/xl/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+    '</Types>'
+)
+_ROOT_RELS_XML = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+_WORKBOOK_RELS_XML = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+    '<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>'
+    '</Relationships>'
+)
+# Estilos: 0 = padrão, 1 = data/hora, 2 = cabeçalho em negrito
+_STYLES_XML = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<numFmts count="1"><numFmt numFmtId="164" formatCode="yyyy-mm-dd hh:mm:ss"/></numFmts>'
+    '<fonts count="2"><font><sz val="11"/><name val="Calibri"/></font>'
+    '<font><b/><sz val="11"/><name val="Calibri"/></font></fonts>'
+    '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+    '<fill><patternFill patternType="gray125"/></fill></fills>'
+    '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+    '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+    '<cellXfs count="3"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+    '<xf numFmtId="164" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+    '<xf numFmtId="0" fontId="1" fillId="0" borderId="0" xfId="0" applyFont="1"/></cellXfs>'
+    '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+    '</styleSheet>'
+)
+
+
+def filter_signature(applied_filters: dict, extra: tuple = ()) -> str:
+    """Assinatura estável dos filtros aplicados, usada como chave de cache da exportação."""
+    payload = json.dumps(
+        {"filtros": applied_filters, "extra": list(extra)},
+        sort_keys=True,
+        default=str,
+        ensure_ascii=False,
+    )
+    return hashlib.md5(payload.encode("utf-8")).hexdigest()
+
+
+def available_export_formats() -> list[str]:
+    return [fmt for fmt in EXPORT_FORMATS if fmt != "parquet" or PARQUET_AVAILABLE]
+
+
+def export_unified_base(df: pd.DataFrame, export_format: str,
+                        question_labels: list[str] | None = None) -> bytes:
+    """
+    Gera o arquivo da base unificada no formato pedido.
+    'question_labels' (texto de cada pergunta) vira a primeira linha de dados no
+    XLSX/CSV, como na planilha original, e metadado das colunas no Parquet.
+    """
+    if export_format == "xlsx":
+        return write_xlsx_stream(df, question_labels)
+    if export_format == "csv.gz":
+        return write_csv_gz(df, question_labels)
+    if export_format == "parquet":
+        return write_parquet(df, question_labels)
+    raise ValueError(f"Formato de exportação desconhecido: {export_format}")
+
+
+# --- XLSX em streaming ---
+
+
+def _clean_text(value) -> str:
+    if isinstance(value, (datetime, date)):
+        text = value.isoformat(sep=" ") if isinstance(value, datetime) else value.isoformat()
+    else:
+        text = str(value)
+    if not text.strip():
+        return MISSING_VALUE
+    return _ILLEGAL_XML_CHARS.sub("", text)[:EXCEL_MAX_CELL_CHARS]
+
+
+def _inline_cell(text: str, style: int | None = None) -> str:
+    style_attr = f' s="{style}"' if style is not None else ""
+    return f'<c t="inlineStr"{style_attr}><is><t xml:space="preserve">{escape(text)}</t></is></c>'
+
+
+_MISSING_CELL = _inline_cell(MISSING_VALUE)
+
+
+def _cells_for_uniques(uniques, kind: str) -> list[str]:
+    """XML de célula para cada valor distinto de uma coluna, conforme o tipo da coluna."""
+    if kind == "M":
+        serials = (
+            (np.asarray(uniques, dtype="datetime64[ns]") - _EXCEL_EPOCH)
+            / np.timedelta64(1, "D")
+        )
+        return [f'<c s="1"><v>{serial!r}</v></c>' for serial in serials.tolist()]
+    if kind == "b":
+        return [f'<c t="b"><v>{int(bool(v))}</v></c>' for v in uniques]
+    if kind in "iu":
+        return [f'<c><v>{int(v)}</v></c>' for v in uniques]
+    if kind == "f":
+        return [
+            f'<c><v>{float(v)!r}</v></c>' if np.isfinite(v) else _MISSING_CELL
+            for v in uniques
+        ]
+    cells = []
+    for value in uniques:
+        if isinstance(value, (bool, np.bool_)):
+            cells.append(f'<c t="b"><v>{int(value)}</v></c>')
+        elif isinstance(value, (int, np.integer)):
+            cells.append(f'<c><v>{int(value)}</v></c>')
+        elif isinstance(value, (float, np.floating)) and np.isfinite(value):
+            cells.append(f'<c><v>{float(value)!r}</v></c>')
+        else:
+            cells.append(_inline_cell(_clean_text(value)))
+    return cells
+
+
+def _csv_fields_for_uniques(uniques, kind: str) -> list[str]:
+    """Campo CSV (já com aspas quando preciso) para cada valor distinto de uma coluna."""
+    if kind == "M":
+        return [str(pd.Timestamp(v)) for v in uniques]
+    if kind == "b":
+        return [str(bool(v)) for v in uniques]
+    if kind in "iu":
+        return [str(int(v)) for v in uniques]
+    if kind == "f":
+        return [repr(float(v)) if np.isfinite(v) else MISSING_VALUE for v in uniques]
+    fields = []
+    for value in uniques:
+        text = str(value)
+        if not text.strip():
+            text = MISSING_VALUE
+        elif any(ch in text for ch in ',"\n\r'):
+            text = '"' + text.replace('"', '""') + '"'
+        fields.append(text)
+    return fields
+
+
+def _encode_column(series: pd.Series, builder=_cells_for_uniques,
+                   missing: str = _MISSING_CELL) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Fatora a coluna e devolve (códigos, texto por código), com o texto de cada
+    valor distinto montado por 'builder'; o último texto é o de valor ausente.
+    """
+    if isinstance(series.dtype, pd.DatetimeTZDtype):
+        series = series.dt.tz_localize(None)
+    kind = series.dtype.kind
+    if kind not in "Mbiuf":
+        kind = "O"
+    codes, uniques = pd.factorize(series, use_na_sentinel=True)
+    if kind == "M":
+        uniques = np.asarray(uniques, dtype="datetime64[ns]")
+    lookup = np.array(builder(uniques, kind) + [missing], dtype=object)
+    codes = codes.astype(np.int32, copy=False)
+    codes[codes < 0] = len(lookup) - 1
+    return codes, lookup
+
+
+def write_xlsx_stream(df: pd.DataFrame, question_labels: list[str] | None = None,
+                      sheet_name: str = "Base_Unificada") -> bytes:
+    output = io.BytesIO()
+    with zipfile.ZipFile(output, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=1) as zf:
+        zf.writestr("[Content_Types].xml", _CONTENT_TYPES_XML)
+        zf.writestr("_rels/.rels", _ROOT_RELS_XML)
+        zf.writestr(
+            "xl/workbook.xml",
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+            'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+            f'<sheets><sheet name="{escape(sheet_name[:31])}" sheetId="1" r:id="rId1"/></sheets>'
+            '</workbook>',
+        )
+        zf.writestr("xl/_rels/workbook.xml.rels", _WORKBOOK_RELS_XML)
+        zf.writestr("xl/styles.xml", _STYLES_XML)
+
+        with zf.open("xl/worksheets/sheet1.xml", "w", force_zip64=True) as raw:
+            sheet = io.TextIOWrapper(raw, encoding="utf-8", newline="")
+            sheet.write(
+                '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                '<sheetData>'
+            )
+            row_number = 1
+            header = "".join(_inline_cell(_clean_text(col), style=2) for col in df.columns)
+            sheet.write(f'<row r="{row_number}">{header}</row>')
+            if question_labels is not None:
+                row_number += 1
+                labels = "".join(_inline_cell(_clean_text(label)) for label in question_labels)
+                sheet.write(f'<row r="{row_number}">{labels}</row>')
+
+            encoded = [_encode_column(df.iloc[:, i]) for i in range(df.shape[1])]
+            for start in range(0, len(df), XLSX_ROWS_PER_BLOCK):
+                stop = min(start + XLSX_ROWS_PER_BLOCK, len(df))
+                block_cols = [lookup[codes[start:stop]] for codes, lookup in encoded]
+                rows = []
+                for parts in zip(*block_cols):
+                    row_number += 1
+                    rows.append(f'<row r="{row_number}">{"".join(parts)}</row>')
+                sheet.write("".join(rows))
+
+            sheet.write('</sheetData></worksheet>')
+            sheet.flush()
+            sheet.detach()
+    return output.getvalue()
+
+
+# --- CSV.gz e Parquet ---
+
+
+def _is_text_column(series: pd.Series) -> bool:
+    return series.dtype == object or pd.api.types.is_string_dtype(series.dtype)
+
+
+def write_csv_gz(df: pd.DataFrame, question_labels: list[str] | None = None) -> bytes:
+    output = io.BytesIO()
+    with gzip.GzipFile(fileobj=output, mode="wb", compresslevel=3, mtime=0) as gz:
+        text = io.TextIOWrapper(gz, encoding="utf-8", newline="")
+        writer = csv.writer(text, lineterminator="\n")
+        writer.writerow(df.columns)
+        if question_labels is not None:
+            writer.writerow(question_labels)
+
+        encoded = [
+            _encode_column(df.iloc[:, i], builder=_csv_fields_for_uniques, missing=MISSING_VALUE)
+            for i in range(df.shape[1])
+        ]
+        for start in range(0, len(df), CSV_ROWS_PER_BLOCK):
+            stop = min(start + CSV_ROWS_PER_BLOCK, len(df))
+            block_cols = [lookup[codes[start:stop]] for codes, lookup in encoded]
+            text.write("".join(",".join(parts) + "\n" for parts in zip(*block_cols)))
+        text.flush()
+        text.detach()
+    return output.getvalue()
+
+
+def write_parquet(df: pd.DataFrame, question_labels: list[str] | None = None) -> bytes:
+    if not PARQUET_AVAILABLE:
+        raise RuntimeError("pyarrow não está instalado; exportação Parquet indisponível.")
+    typed = df.copy()
+    for col in typed.columns:
+        if _is_text_column(typed[col]):
+            typed[col] = typed[col].astype("string")
+    table = pa.Table.from_pandas(typed, preserve_index=False)
+    if question_labels is not None:
+        metadata = dict(table.schema.metadata or {})
+        metadata[b"question_labels"] = json.dumps(
+            dict(zip(map(str, df.columns), question_labels)), ensure_ascii=False
+        ).encode("utf-8")
+        table = table.replace_schema_metadata(metadata)
+    output = io.BytesIO()
+    pq.write_table(table, output, compression="zstd")
+    return output.getvalue()
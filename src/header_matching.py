@@ -0,0 +1,182 @@
+# src/header_matching.py
+"""
+Correspondência aproximada de cabeçalhos da API com os textos alvo de 'perguntas_alvo_codigos'.
+
+Os textos alvo passam por normalização (sem acento, minúsculo, sem pontuação e
+sem as instruções de aplicação 'RU e Estimulada/Espontânea') e viram conjuntos de
+trigramas de caracteres num índice invertido trigrama -> textos. Para cada
+cabeçalho, as interseções com todos os textos saem de uma única contagem sobre as
+listas do índice; só os candidatos que ainda podem atingir o limiar (filtro por
+tamanho) e que têm os mesmos tokens numéricos (ex.: o '_M1' das menções) são
+pontuados com o coeficiente de Dice. A decisão de cada (survey_id, cabeçalho)
+fica persistida, então cada cabeçalho é pontuado uma vez só.
+"""
+import hashlib
+import json
+import re
+import unicodedata
+
+import numpy as np
+
+from src.data_processing import ALIAS_INDEX
+
+NGRAM_SIZE = 3
+MIN_SCORE = 0.85
+# Diferença mínima entre o melhor código e o melhor código alternativo
+MIN_MARGIN = 0.04
+# Textos normalizados mais curtos que isso (ex.: 'P1', 'IAT3.1') só casam por igualdade exata
+MIN_TEXT_LENGTH = 8
+
+# Instruções de aplicação ('RU e Estimulada', 'RM E ESPONTÂNEA', ...), inclusive com erro de digitação
+_INSTRUCTION_PATTERN = re.compile(r"\b(?:ru|rm)\s+e\s+[a-z]+\b|\bsomente (?:registrar|anotar)\b")
+
+
+def normalize_header_text(text: str) -> str:
+    if not isinstance(text, str):
+        return ""
+    text = ''.join(
+        c for c in unicodedata.normalize('NFD', text)
+        if unicodedata.category(c) != 'Mn'
+    ).lower()
+    text = re.sub(r'[^a-z0-9]+', ' ', text)
+    text = _INSTRUCTION_PATTERN.sub(" ", text)
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+def numeric_tokens(normalized_text: str) -> frozenset:
+    """Tokens com dígitos ('m1', '5', ...): indicam a menção/opção e precisam coincidir."""
+    return frozenset(token for token in normalized_text.split() if any(c.isdigit() for c in token))
+
+
+def text_ngrams(normalized_text: str) -> set[str]:
+    padded = f" {normalized_text} "
+    return {padded[i:i + NGRAM_SIZE] for i in range(len(padded) - NGRAM_SIZE + 1)}
+
+
+class HeaderMatcher:
+    """Índice invertido de trigramas sobre os textos alvo, montado uma única vez."""
+
+    def __init__(self, alias_index: dict[str, str], min_score: float = MIN_SCORE,
+                 min_margin: float = MIN_MARGIN):
+        self.min_score = min_score
+        self.min_margin = min_margin
+
+        aliases: dict[str, str] = {}
+        ambiguous = set()
+        for text, code in alias_index.items():
+            normalized = normalize_header_text(text)
+            if len(normalized) < MIN_TEXT_LENGTH:
+                continue
+            if aliases.setdefault(normalized, code) != code:
+                ambiguous.add(normalized)
+        # Textos que, normalizados, pertencem a mais de um código não decidem nada
+        for normalized in ambiguous:
+            del aliases[normalized]
+        self.alias_texts = list(aliases)
+        self.alias_codes = np.array(list(aliases.values()), dtype=object)
+        self.alias_numeric = [numeric_tokens(text) for text in self.alias_texts]
+
+        postings: dict[str, list[int]] = {}
+        sizes = []
+        for alias_id, text in enumerate(self.alias_texts):
+            grams = text_ngrams(text)
+            sizes.append(len(grams))
+            for gram in grams:
+                postings.setdefault(gram, []).append(alias_id)
+        self.postings = {gram: np.array(ids, dtype=np.int32) for gram, ids in postings.items()}
+        self.alias_sizes = np.array(sizes, dtype=np.int32)
+
+        payload = json.dumps(
+            {"aliases": aliases, "n": NGRAM_SIZE, "min_score": min_score,
+             "min_margin": min_margin, "min_len": MIN_TEXT_LENGTH,
+             "instrucoes": _INSTRUCTION_PATTERN.pattern},
+            sort_keys=True, ensure_ascii=False,
+        )
+        self.version = "v1-" + hashlib.md5(payload.encode("utf-8")).hexdigest()[:12]
+
+    def match_one(self, header: str) -> tuple[str | None, float, str | None]:
+        """Retorna (código, score, texto alvo casado); código None quando não há decisão segura."""
+        normalized = normalize_header_text(header)
+        if len(normalized) < MIN_TEXT_LENGTH or not self.alias_texts:
+            return None, 0.0, None
+        grams = text_ngrams(normalized)
+        hits = [self.postings[gram] for gram in grams if gram in self.postings]
+        if not hits:
+            return None, 0.0, None
+
+        overlap = np.bincount(np.concatenate(hits), minlength=len(self.alias_texts))
+        n_grams = len(grams)
+        # Poda: Dice >= t exige |A∩B| >= t(|A|+|B|)/2
+        needed = self.min_score * (n_grams + self.alias_sizes) / 2
+        header_numeric = numeric_tokens(normalized)
+        candidates = np.array(
+            [i for i in np.flatnonzero(overlap >= needed)
+             if self.alias_numeric[i] == header_numeric],
+            dtype=np.int64,
+        )
+        if candidates.size == 0:
+            return None, 0.0, None
+
+        scores = 2 * overlap[candidates] / (n_grams + self.alias_sizes[candidates])
+        order = np.argsort(-scores, kind="stable")
+        best = candidates[order[0]]
+        best_score = float(scores[order[0]])
+        best_code = self.alias_codes[best]
+
+        # Entre os candidatos, qualquer outro código próximo demais torna a decisão ambígua
+        other_codes = self.alias_codes[candidates] != best_code
+        if other_codes.any() and best_score - float(scores[other_codes].max()) < self.min_margin:
+            return None, best_score, None
+        return best_code, best_score, self.alias_texts[best]
+
+    def match(self, headers) -> dict[str, tuple[str | None, float, str | None]]:
+        return {header: self.match_one(header) for header in headers}
+
+
+_MATCHER: HeaderMatcher | None = None
+_DECISIONS_IN_MEMORY: dict[tuple, dict[str, str | None]] = {}
+
+
+def get_header_matcher() -> HeaderMatcher:
+    global _MATCHER
+    if _MATCHER is None:
+        _MATCHER = HeaderMatcher(ALIAS_INDEX)
+    return _MATCHER
+
+
+def resolve_fuzzy_headers(headers, survey_id: int | None = None) -> dict[str, str | None]:
+    """
+    Resolve cabeçalhos sem correspondência exata pelo índice aproximado.
+    Com 'survey_id', as decisões (inclusive as negativas) são lidas/gravadas no banco,
+    então cada (survey_id, cabeçalho) é pontuado uma única vez.
+
+    Returns:
+        dict: cabeçalho -> código alvo, ou None quando não houve correspondência.
+    """
+    headers = [h for h in dict.fromkeys(headers) if isinstance(h, str)]
+    if not headers:
+        return {}
+    matcher = get_header_matcher()
+
+    cache_key = (survey_id, matcher.version)
+    decisions = _DECISIONS_IN_MEMORY.get(cache_key)
+    if decisions is None:
+        decisions = {}
+        if survey_id is not None:
+            from src.database import get_header_mapping_decisions  # Importação local para evitar import circular
+            decisions = get_header_mapping_decisions(survey_id, matcher.version)
+        _DECISIONS_IN_MEMORY[cache_key] = decisions
+
+    missing = [h for h in headers if h not in decisions]
+    if missing:
+        novos = matcher.match(missing)
+        decisions.update({header: code for header, (code, _, _) in novos.items()})
+        if survey_id is not None:
+            from src.database import save_header_mapping_decisions  # Importação local para evitar import circular
+            save_header_mapping_decisions(
+                survey_id,
+                matcher.version,
+                [(header, code, score, alias) for header, (code, score, alias) in novos.items()],
+            )
+
+    return {header: decisions[header] for header in headers}
@@ -0,0 +1,253 @@
+# src/income_rules.py
+"""
+Registro das regras de classificação de renda (config/regras_classificacao_renda.json).
+
+O arquivo é lido, validado e compilado em vetores de busca uma única vez e só é
+recarregado quando muda: a cada consulta compara-se o mtime/tamanho do arquivo e,
+se mudaram, o hash do conteúdo. Editar o JSON passa a valer na próxima consulta,
+sem reiniciar o servidor nem limpar cache.
+
+Validação:
+    - versões com 'id_versao' único, em ordem de início de validade e sem sobreposição de datas;
+    - dentro de cada versão, faixas [min_renda, max_renda] sem sobreposição e sem buracos.
+
+Cada versão tem uma impressão digital ('id_versao@hash') gravada em
+'analytics_respondents.renda_regra_versao', para saber quais linhas precisam ser
+reclassificadas quando uma versão muda.
+"""
+import hashlib
+import json
+import os
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+RULES_PATH = Path(__file__).parent.parent / "config" / "regras_classificacao_renda.json"
+
+DATA_INICIO_PADRAO = "1900-01-01"
+DATA_FIM_PADRAO = "2999-12-31"
+
+CLASSE_VERSAO_INCOMPATIVEL = "Versão de Regra Incompatível"
+CLASSE_NAO_CLASSIFICADO = "Não Classificado"
+
+
+class IncomeRulesError(ValueError):
+    """Arquivo de regras de renda ausente ou inválido."""
+
+
+@dataclass(frozen=True)
+class IncomeRuleVersion:
+    id_versao: str
+    data_inicio: np.datetime64
+    data_fim: np.datetime64
+    fingerprint: str
+    min_renda: np.ndarray
+    max_renda: np.ndarray
+    classe_agregada: np.ndarray
+    classe_detalhada: np.ndarray
+
+
+def version_fingerprint(versao: dict) -> str:
+    """'id_versao@hash' do conteúdo da versão (datas e faixas), estável entre execuções."""
+    payload = json.dumps(
+        {
+            "inicio": versao.get("data_inicio_validade", DATA_INICIO_PADRAO),
+            "fim": versao.get("data_fim_validade", DATA_FIM_PADRAO),
+            "regras": sorted(
+                (r["min_renda"], r["max_renda"], r["classe_agregada"], r["classe_detalhada"])
+                for r in versao["regras"]
+            ),
+        },
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return f"{versao['id_versao']}@{hashlib.md5(payload.encode('utf-8')).hexdigest()[:8]}"
+
+
+def _parse_date(valor: str, campo: str, id_versao: str) -> np.datetime64:
+    try:
+        return np.datetime64(pd.Timestamp(valor).date(), "D")
+    except (ValueError, TypeError):
+        raise IncomeRulesError(f"Versão '{id_versao}': data inválida em '{campo}': {valor!r}")
+
+
+def _compile_version(versao: dict) -> IncomeRuleVersion:
+    id_versao = versao.get("id_versao")
+    if not id_versao:
+        raise IncomeRulesError("Toda versão de regras precisa de 'id_versao'.")
+    regras = versao.get("regras")
+    if not regras:
+        raise IncomeRulesError(f"Versão '{id_versao}' sem regras.")
+
+    inicio = _parse_date(versao.get("data_inicio_validade", DATA_INICIO_PADRAO),
+                         "data_inicio_validade", id_versao)
+    fim = _parse_date(versao.get("data_fim_validade", DATA_FIM_PADRAO),
+                      "data_fim_validade", id_versao)
+    if inicio > fim:
+        raise IncomeRulesError(f"Versão '{id_versao}': início de validade posterior ao fim.")
+
+    try:
+        ordenadas = sorted(regras, key=lambda r: r["min_renda"])
+        faixas = [(r["min_renda"], r["max_renda"]) for r in ordenadas]
+        agregadas = [r["classe_agregada"] for r in ordenadas]
+        detalhadas = [r["classe_detalhada"] for r in ordenadas]
+    except KeyError as e:
+        raise IncomeRulesError(f"Versão '{id_versao}': regra sem o campo {e}.")
+
+    for i, (min_renda, max_renda) in enumerate(faixas):
+        if min_renda > max_renda:
+            raise IncomeRulesError(
+                f"Versão '{id_versao}': faixa invertida [{min_renda}, {max_renda}].")
+        if i > 0:
+            max_anterior = faixas[i - 1][1]
+            if min_renda <= max_anterior:
+                raise IncomeRulesError(
+                    f"Versão '{id_versao}': faixas sobrepostas em {min_renda} (anterior termina em {max_anterior}).")
+            if min_renda != max_anterior + 1:
+                raise IncomeRulesError(
+                    f"Versão '{id_versao}': buraco entre {max_anterior} e {min_renda}.")
+
+    return IncomeRuleVersion(
+        id_versao=id_versao,
+        data_inicio=inicio,
+        data_fim=fim,
+        fingerprint=version_fingerprint(versao),
+        min_renda=np.array([f[0] for f in faixas], dtype=float),
+        max_renda=np.array([f[1] for f in faixas], dtype=float),
+        classe_agregada=np.array(agregadas, dtype=object),
+        classe_detalhada=np.array(detalhadas, dtype=object),
+    )
+
+
+class IncomeRuleSet:
+    """Regras validadas e compiladas; 'version' identifica o conteúdo do arquivo."""
+
+    def __init__(self, raw: dict, version: str):
+        if not isinstance(raw, dict) or not isinstance(raw.get("versoes"), list) or not raw["versoes"]:
+            raise IncomeRulesError("O arquivo de regras precisa de uma lista 'versoes' não vazia.")
+        self.raw = raw
+        self.version = version
+        self.versions = [_compile_version(v) for v in raw["versoes"]]
+
+        ids = [v.id_versao for v in self.versions]
+        if len(set(ids)) != len(ids):
+            raise IncomeRulesError("Há 'id_versao' repetido no arquivo de regras.")
+        for anterior, atual in zip(self.versions, self.versions[1:]):
+            if atual.data_inicio <= anterior.data_inicio:
+                raise IncomeRulesError(
+                    f"Versões fora de ordem: '{atual.id_versao}' deve vir antes de '{anterior.id_versao}'.")
+            if atual.data_inicio <= anterior.data_fim:
+                raise IncomeRulesError(
+                    f"Versões '{anterior.id_versao}' e '{atual.id_versao}' com validade sobreposta.")
+
+        self.version_starts = np.array([v.data_inicio for v in self.versions])
+        self.version_ends = np.array([v.data_fim for v in self.versions])
+
+    def classify(self, valores, datas) -> pd.DataFrame:
+        """
+        Classificação vetorizada, equivalente a 'classify_income_by_rules' linha a linha.
+
+        Returns:
+            DataFrame (mesmo índice de 'valores', se for Series) com
+            'renda_classe_agregada', 'renda_classe_detalhada' e 'renda_regra_versao'.
+        """
+        index = valores.index if isinstance(valores, pd.Series) else None
+        valores = pd.to_numeric(pd.Series(np.asarray(valores, dtype=object)), errors="coerce").to_numpy(dtype=float)
+        datas = pd.to_datetime(pd.Series(np.asarray(datas, dtype=object)), errors="coerce")
+        dias = datas.dt.normalize().to_numpy(dtype="datetime64[D]")
+
+        n = len(valores)
+        agregada = np.full(n, None, dtype=object)
+        detalhada = np.full(n, None, dtype=object)
+        regra_versao = np.full(n, None, dtype=object)
+
+        validos = ~np.isnan(valores) & ~np.isnat(dias)
+        # Versão vigente: a última que começou até a data, desde que a data caia antes do fim dela
+        pos = np.searchsorted(self.version_starts, dias, side="right") - 1
+        pos_segura = np.clip(pos, 0, len(self.versions) - 1)
+        com_versao = validos & (pos >= 0) & (dias <= self.version_ends[pos_segura])
+
+        sem_versao = validos & ~com_versao
+        agregada[sem_versao] = CLASSE_VERSAO_INCOMPATIVEL
+        detalhada[sem_versao] = CLASSE_VERSAO_INCOMPATIVEL
+
+        for i, versao in enumerate(self.versions):
+            linhas = np.flatnonzero(com_versao & (pos == i))
+            if linhas.size == 0:
+                continue
+            v = valores[linhas]
+            faixa = np.searchsorted(versao.min_renda, v, side="right") - 1
+            faixa_segura = np.clip(faixa, 0, len(versao.min_renda) - 1)
+            dentro = (faixa >= 0) & (v <= versao.max_renda[faixa_segura])
+
+            agregada[linhas] = np.where(dentro, versao.classe_agregada[faixa_segura], CLASSE_NAO_CLASSIFICADO)
+            detalhada[linhas] = np.where(dentro, versao.classe_detalhada[faixa_segura], CLASSE_NAO_CLASSIFICADO)
+            regra_versao[linhas] = versao.fingerprint
+
+        return pd.DataFrame({
+            "renda_classe_agregada": agregada,
+            "renda_classe_detalhada": detalhada,
+            "renda_regra_versao": regra_versao,
+        }, index=index, dtype=object)
+
+
+    def sql_rows(self, version_ids=None) -> tuple[list[tuple], list[tuple]]:
+        """
+        Versões e faixas como tuplas de tipos nativos, para montar 'VALUES' no SQL.
+
+        Returns:
+            (versoes, faixas): versoes = (fingerprint, data_inicio, data_fim);
+            faixas = (fingerprint, min_renda, max_renda, classe_agregada, classe_detalhada).
+        """
+        versoes, faixas = [], []
+        for versao in self.versions:
+            if version_ids is not None and versao.id_versao not in version_ids:
+                continue
+            versoes.append((versao.fingerprint, versao.data_inicio.astype(object),
+                            versao.data_fim.astype(object)))
+            for i in range(len(versao.min_renda)):
+                faixas.append((versao.fingerprint, float(versao.min_renda[i]), float(versao.max_renda[i]),
+                               versao.classe_agregada[i], versao.classe_detalhada[i]))
+        return versoes, faixas
+
+
+class IncomeRulesRegistry:
+    """Mantém o IncomeRuleSet do arquivo e o recarrega só quando o arquivo muda."""
+
+    def __init__(self, path: Path = RULES_PATH):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._stat_key = None
+        self._rules: IncomeRuleSet | None = None
+
+    def get(self) -> IncomeRuleSet:
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            raise IncomeRulesError(f"Arquivo de regras '{self.path}' não encontrado.")
+        stat_key = (stat.st_mtime_ns, stat.st_size)
+
+        with self._lock:
+            if self._rules is not None and stat_key == self._stat_key:
+                return self._rules
+            conteudo = self.path.read_bytes()
+            version = "regras-" + hashlib.md5(conteudo).hexdigest()[:12]
+            if self._rules is None or version != self._rules.version:
+                try:
+                    raw = json.loads(conteudo.decode("utf-8"))
+                except (UnicodeDecodeError, json.JSONDecodeError) as e:
+                    raise IncomeRulesError(f"Arquivo de regras com JSON inválido: {e}")
+                self._rules = IncomeRuleSet(raw, version)
+            self._stat_key = stat_key
+            return self._rules
+
+
+_REGISTRY = IncomeRulesRegistry()
+
+
+def get_income_rules() -> IncomeRuleSet:
+    """Regras vigentes do arquivo padrão; levanta IncomeRulesError se ausente ou inválido."""
+    return _REGISTRY.get()
@@ -0,0 +1,569 @@
+# src/instrumentation.py
+"""
+Medição de tempo por etapa da pipeline e por chamada SQL.
+
+- 'instrument_stage' (decorador) e 'stage' (context manager) registram tempo de
+  relógio, linhas de entrada/saída e bytes de cada etapa.
+- 'InstrumentedCursor' é o cursor das conexões de src/database.py: as chamadas
+  execute/COPY viram registros do tipo 'sql', ligados à etapa em andamento. Dentro de
+  uma etapa ou execução, as chamadas são somadas por rótulo (ex.: um INSERT por
+  respondente vira um registro só, com chamadas, tempo total e máximo e linhas) e o
+  total é registrado quando a etapa termina.
+- 'pipeline_run' agrupa os registros de uma execução (refresh, transform, job...) sob
+  um run_id, opcionalmente com cProfile, e ao final pode gravá-los em 'pipeline_metrics'.
+
+Os registros ficam num buffer circular em memória ('recent_records'); o custo por
+registro é um perf_counter e um append. Em 'pipeline_metrics', as execuções mais antigas
+que PIPELINE_METRICS_RETENTION_DAYS (padrão 30; 0 desliga) são apagadas a cada gravação.
+"""
+import contextlib
+import contextvars
+import cProfile
+import datetime
+import functools
+import io
+import logging
+import os
+import pstats
+import re
+import threading
+import time
+import uuid
+from collections import deque
+from dataclasses import asdict, dataclass, field, replace
+
+import pandas as pd
+import psycopg2.extensions
+from psycopg2 import sql as pg_sql
+
+from src import query_log
+
+logger = logging.getLogger(__name__)
+
+RING_BUFFER_SIZE = 5000
+SQL_TEXT_LIMIT = 500
+PROFILE_TOP_N = 40
+DEFAULT_RETENTION_DAYS = 30
+
+KIND_STAGE = "stage"
+KIND_SQL = "sql"
+KIND_RUN = "run"
+KIND_PROFILE = "profile"
+
+
+@dataclass
+class StageRecord:
+    run_id: str | None
+    run_name: str | None
+    kind: str
+    stage: str
+    parent: str | None
+    started_at: datetime.datetime
+    duration_s: float = 0.0
+    rows_in: int | None = None
+    rows_out: int | None = None
+    bytes: int | None = None
+    ok: bool = True
+    details: str | None = None
+    # Registros 'sql' somados: quantidade de chamadas e a mais demorada delas
+    calls: int = 1
+    max_duration_s: float | None = None
+
+
+@dataclass
+class _Run:
+    run_id: str
+    name: str
+    records: list = field(default_factory=list)
+
+
+_BUFFER = deque(maxlen=RING_BUFFER_SIZE)
+_BUFFER_LOCK = threading.Lock()
+_CURRENT_RUN: contextvars.ContextVar[_Run | None] = contextvars.ContextVar("pipeline_run", default=None)
+_CURRENT_STAGE: contextvars.ContextVar[str | None] = contextvars.ContextVar("pipeline_stage", default=None)
+_SUSPENDED: contextvars.ContextVar[bool] = contextvars.ContextVar("instrumentation_suspended", default=False)
+# Totais de SQL da etapa (ou execução) em andamento: (run_id, etapa, rótulo) -> registro somado
+_SQL_TOTALS: contextvars.ContextVar[dict | None] = contextvars.ContextVar("sql_totals", default=None)
+
+
+def _record(record: StageRecord):
+    with _BUFFER_LOCK:
+        _BUFFER.append(record)
+    run = _CURRENT_RUN.get()
+    if run is not None:
+        run.records.append(record)
+
+
+def _record_sql(record: StageRecord):
+    totais = _SQL_TOTALS.get()
+    if totais is None:
+        _record(record)
+        return
+    chave = (record.run_id, record.parent, record.stage)
+    soma = totais.get(chave)
+    if soma is None:
+        # Cópia: o registro original segue para o log de consultas lentas
+        totais[chave] = replace(record, max_duration_s=record.duration_s)
+        return
+    soma.calls += 1
+    soma.duration_s += record.duration_s
+    if record.duration_s > soma.max_duration_s:
+        soma.max_duration_s = record.duration_s
+        soma.details = record.details
+    if record.rows_out is not None:
+        soma.rows_out = (soma.rows_out or 0) + record.rows_out
+    if record.bytes is not None:
+        soma.bytes = (soma.bytes or 0) + record.bytes
+    soma.ok = soma.ok and record.ok
+
+
+@contextlib.contextmanager
+def _sql_totals():
+    """Soma as chamadas SQL do bloco e registra os totais ao final."""
+    totais = {}
+    token = _SQL_TOTALS.set(totais)
+    try:
+        yield
+    finally:
+        _SQL_TOTALS.reset(token)
+        for soma in totais.values():
+            _record(soma)
+
+
+def _new_record(kind: str, stage: str) -> StageRecord:
+    run = _CURRENT_RUN.get()
+    return StageRecord(
+        run_id=run.run_id if run else None,
+        run_name=run.name if run else None,
+        kind=kind,
+        stage=stage,
+        parent=_CURRENT_STAGE.get(),
+        started_at=datetime.datetime.now(datetime.timezone.utc),
+    )
+
+
+def count_rows(obj) -> int | None:
+    """Linhas de um DataFrame/lista/dict; None para o que não tem tamanho."""
+    if obj is None:
+        return 0
+    if isinstance(obj, (pd.DataFrame, pd.Series, list, tuple, dict, set)):
+        return len(obj)
+    return None
+
+
+def count_bytes(obj) -> int | None:
+    """Tamanho em memória de DataFrames/Series (sem 'deep', para ser barato) e de bytes/str."""
+    if isinstance(obj, pd.DataFrame):
+        return int(obj.memory_usage(index=False).sum())
+    if isinstance(obj, pd.Series):
+        return int(obj.memory_usage(index=False))
+    if isinstance(obj, (bytes, bytearray)):
+        return len(obj)
+    if isinstance(obj, str):
+        return len(obj.encode("utf-8", errors="ignore"))
+    return None
+
+
+class StageTimer:
+    """Etapa em andamento; 'rows_in', 'rows_out' e 'bytes' podem ser preenchidos no corpo."""
+
+    def __init__(self, record: StageRecord):
+        self.record = record
+
+    def set(self, rows_in: int | None = None, rows_out: int | None = None, nbytes: int | None = None):
+        if rows_in is not None:
+            self.record.rows_in = rows_in
+        if rows_out is not None:
+            self.record.rows_out = rows_out
+        if nbytes is not None:
+            self.record.bytes = nbytes
+
+
+@contextlib.contextmanager
+def stage(name: str, rows_in: int | None = None):
+    """Mede um bloco como etapa 'name'; as chamadas SQL de dentro ficam ligadas a ela."""
+    if _SUSPENDED.get():
+        yield StageTimer(StageRecord(None, None, KIND_STAGE, name, None, datetime.datetime.now()))
+        return
+    record = _new_record(KIND_STAGE, name)
+    record.rows_in = rows_in
+    token = _CURRENT_STAGE.set(name)
+    inicio = time.perf_counter()
+    try:
+        with _sql_totals():
+            yield StageTimer(record)
+    except BaseException as e:
+        record.ok = False
+        record.details = f"{type(e).__name__}: {e}"[:SQL_TEXT_LIMIT]
+        raise
+    finally:
+        record.duration_s = time.perf_counter() - inicio
+        _CURRENT_STAGE.reset(token)
+        _record(record)
+
+
+def _default_rows_in(args, kwargs):
+    for valor in list(args) + list(kwargs.values()):
+        linhas = count_rows(valor) if not isinstance(valor, (str, bytes)) else None
+        if linhas is not None and not isinstance(valor, dict):
+            return linhas
+    return None
+
+
+def _default_rows_out(result):
+    # Funções do repo devolvem o dado direto ou uma tupla (dado, ...)/(ok, n, msg)
+    if isinstance(result, tuple) and result:
+        result = result[0]
+    return count_rows(result) if not isinstance(result, bool) else None
+
+
+def instrument_stage(name: str | None = None, rows_in=None, rows_out=None, nbytes=None):
+    """
+    Decorador: mede cada chamada da função como uma etapa.
+
+    Args:
+        name: nome da etapa (padrão: nome da função).
+        rows_in: f(args, kwargs) -> int; padrão: tamanho do primeiro argumento com tamanho.
+        rows_out: f(resultado) -> int; padrão: tamanho do resultado (ou do 1º item da tupla).
+        nbytes: f(resultado) -> int; padrão: memória do DataFrame devolvido ou, se a
+            função não devolve um, a do primeiro argumento DataFrame.
+    """
+    def decorador(func):
+        nome = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            try:
+                entrada = (rows_in or _default_rows_in)(args, kwargs)
+            except Exception:
+                entrada = None
+            with stage(nome, rows_in=entrada) as timer:
+                result = func(*args, **kwargs)
+                try:
+                    timer.set(rows_out=(rows_out or _default_rows_out)(result))
+                    if nbytes is not None:
+                        timer.set(nbytes=nbytes(result))
+                    else:
+                        alvo = result[0] if isinstance(result, tuple) and result else result
+                        tamanho = count_bytes(alvo)
+                        if tamanho is None:
+                            tamanho = next((count_bytes(a) for a in args if isinstance(a, pd.DataFrame)), None)
+                        timer.set(nbytes=tamanho)
+                except Exception:
+                    pass
+                return result
+        return wrapper
+    return decorador
+
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def _sql_text(query, conn) -> str:
+    if isinstance(query, pg_sql.Composable):
+        try:
+            query = query.as_string(conn)
+        except Exception:
+            query = repr(query)
+    if isinstance(query, (bytes, bytearray)):
+        # execute_values manda o lote inteiro já interpolado; só o começo interessa
+        query = bytes(query[:SQL_TEXT_LIMIT * 2]).decode("utf-8", errors="replace")
+    return _WHITESPACE.sub(" ", str(query)).strip()[:SQL_TEXT_LIMIT]
+
+
+def sql_label(texto: str) -> str:
+    """Rótulo curto de um SQL para agrupar chamadas (comando + primeira tabela)."""
+    match = re.match(
+        r"(?is)\s*(?:with\b.*?\)\s*)?(select|insert into|update|delete from|copy|create table if not exists|"
+        r"create (?:unique )?index if not exists|alter table(?: if exists)?|truncate|analyze)\s+([\w.\"]+)?",
+        texto)
+    if not match:
+        return texto[:60]
+    comando, tabela = match.group(1).lower(), (match.group(2) or "").strip('"')
+    if comando == "select":
+        origem = re.search(r"(?i)\bfrom\s+([\w.\"]+)", texto)
+        tabela = origem.group(1).strip('"') if origem else ""
+    return f"{comando.split()[0].upper()} {tabela}".strip()
+
+
+class InstrumentedCursor(psycopg2.extensions.cursor):
+    """
+    Cursor que registra tempo e linhas de cada execute/executemany/COPY e alimenta o
+    log de consultas lentas (src/query_log.py): a execução e a leitura das linhas são
+    medidas separadamente, e a entrada é fechada quando o cursor executa outra
+    consulta ou é fechado.
+    """
+
+    _pending = None
+
+    def _timed(self, metodo, query, *args):
+        if _SUSPENDED.get():
+            return metodo(query, *args)
+        self._finalize()
+        record = _new_record(KIND_SQL, "")
+        inicio = time.perf_counter()
+        try:
+            resultado = metodo(query, *args)
+        except BaseException:
+            record.ok = False
+            raise
+        finally:
+            record.duration_s = time.perf_counter() - inicio
+            texto = _sql_text(query, self.connection)
+            record.stage = sql_label(texto)
+            record.details = texto
+            record.rows_out = self.rowcount if self.rowcount is not None and self.rowcount >= 0 else None
+            if isinstance(query, (bytes, bytearray, str)):
+                record.bytes = len(query)
+            _record_sql(record)
+
+        plano = None
+        if metodo.__name__ == "execute" and query_log.is_slow(record.duration_s):
+            plano = self._capture_plan(query, args[0] if args else None, record.stage)
+        self._pending = {"record": record, "fetch_s": 0.0, "build_s": None, "plan": plano}
+        return resultado
+
+    def _capture_plan(self, query, vars, label: str) -> str | None:
+        prefixo = query_log.explain_prefix(label)
+        if prefixo is None or not query_log.should_capture_plan(label):
+            return None
+        if isinstance(query, pg_sql.Composable):
+            explain = pg_sql.SQL(prefixo) + query
+        elif isinstance(query, (bytes, bytearray)):
+            explain = prefixo.encode() + bytes(query)
+        else:
+            explain = prefixo + query
+
+        conn = self.connection
+        # Numa transação aberta, o EXPLAIN fica num savepoint para uma falha dele não
+        # abortar a transação da função que fez a consulta
+        savepoint = not conn.autocommit
+        with suspended():
+            cursor = conn.cursor()
+            try:
+                if savepoint:
+                    cursor.execute("SAVEPOINT slow_query_explain;")
+                cursor.execute(explain, vars)
+                plano = "\n".join(linha[0] for linha in cursor.fetchall())
+                if savepoint:
+                    cursor.execute("RELEASE SAVEPOINT slow_query_explain;")
+                return plano
+            except Exception as e:
+                if savepoint:
+                    try:
+                        cursor.execute("ROLLBACK TO SAVEPOINT slow_query_explain;")
+                    except Exception:
+                        pass
+                return f"(plano indisponível: {e})"
+            finally:
+                cursor.close()
+
+    def _timed_fetch(self, metodo, *args):
+        inicio = time.perf_counter()
+        try:
+            return metodo(*args)
+        finally:
+            if self._pending is not None:
+                self._pending["fetch_s"] += time.perf_counter() - inicio
+
+    def _finalize(self):
+        pendente, self._pending = self._pending, None
+        if pendente is None:
+            return
+        leituras = _DEFERRED_READS.get()
+        if leituras is not None:
+            leituras.append(pendente)
+        else:
+            _write_slow_entry(pendente)
+
+    def execute(self, query, vars=None):
+        return self._timed(super().execute, query, vars)
+
+    def executemany(self, query, vars_list):
+        return self._timed(super().executemany, query, vars_list)
+
+    def copy_expert(self, sql, file, size=8192):
+        return self._timed(super().copy_expert, sql, file, size)
+
+    def fetchone(self):
+        return self._timed_fetch(super().fetchone)
+
+    def fetchmany(self, size=None):
+        return self._timed_fetch(super().fetchmany, size if size is not None else self.arraysize)
+
+    def fetchall(self):
+        return self._timed_fetch(super().fetchall)
+
+    def close(self):
+        self._finalize()
+        super().close()
+
+
+_DEFERRED_READS: contextvars.ContextVar[list | None] = contextvars.ContextVar("deferred_reads", default=None)
+
+
+def _write_slow_entry(pendente: dict):
+    record = pendente["record"]
+    total = record.duration_s + pendente["fetch_s"] + (pendente["build_s"] or 0)
+    if not query_log.is_slow(total):
+        return
+    try:
+        query_log.write_entry(
+            record.stage, record.details, record.duration_s, pendente["fetch_s"], pendente["build_s"],
+            record.rows_out, stage=record.parent, run_id=record.run_id, plan=pendente["plan"])
+    except Exception as e:
+        logger.warning("Falha ao gravar no log de consultas lentas: %s", e)
+
+
+@contextlib.contextmanager
+def timed_dataframe_read():
+    """
+    Envolve uma leitura 'pd.read_sql_query': o tempo que sobra além da execução e da
+    leitura das linhas (medidas pelo cursor) é a montagem do DataFrame.
+    """
+    leituras = []
+    token = _DEFERRED_READS.set(leituras)
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        total = time.perf_counter() - inicio
+        _DEFERRED_READS.reset(token)
+        if leituras:
+            medido = sum(p["record"].duration_s + p["fetch_s"] for p in leituras)
+            leituras[-1]["build_s"] = max(total - medido, 0.0)
+        for pendente in leituras:
+            _write_slow_entry(pendente)
+
+
+@contextlib.contextmanager
+def suspended():
+    """Desliga a medição no bloco (ex.: ao gravar as próprias métricas)."""
+    token = _SUSPENDED.set(True)
+    try:
+        yield
+    finally:
+        _SUSPENDED.reset(token)
+
+
+@contextlib.contextmanager
+def pipeline_run(name: str, profile: bool = False, persist: bool = False):
+    """
+    Agrupa os registros do bloco sob um run_id novo (ou reaproveita o run em andamento,
+    se houver). Com 'profile', roda o bloco sob cProfile e guarda as funções mais caras
+    num registro 'profile'. Com 'persist', grava os registros em 'pipeline_metrics' ao final.
+
+    Yields:
+        o run_id.
+    """
+    if _CURRENT_RUN.get() is not None:
+        yield _CURRENT_RUN.get().run_id
+        return
+
+    run = _Run(run_id=uuid.uuid4().hex[:12], name=name)
+    token = _CURRENT_RUN.set(run)
+    resumo = _new_record(KIND_RUN, name)
+    profiler = cProfile.Profile() if profile else None
+    inicio = time.perf_counter()
+    try:
+        if profiler is not None:
+            profiler.enable()
+        with _sql_totals():
+            yield run.run_id
+    except BaseException as e:
+        resumo.ok = False
+        resumo.details = f"{type(e).__name__}: {e}"[:SQL_TEXT_LIMIT]
+        raise
+    finally:
+        if profiler is not None:
+            profiler.disable()
+        resumo.duration_s = time.perf_counter() - inicio
+        _record(resumo)
+        if profiler is not None:
+            perfil = _new_record(KIND_PROFILE, name)
+            perfil.details = format_profile(profiler)
+            _record(perfil)
+        _CURRENT_RUN.reset(token)
+        if persist:
+            _persist(run.records)
+
+
+def format_profile(profiler: cProfile.Profile, top_n: int = PROFILE_TOP_N) -> str:
+    saida = io.StringIO()
+    pstats.Stats(profiler, stream=saida).strip_dirs().sort_stats("cumulative").print_stats(top_n)
+    return saida.getvalue()
+
+
+def retention_days() -> int:
+    try:
+        return int(os.environ.get("PIPELINE_METRICS_RETENTION_DAYS", DEFAULT_RETENTION_DAYS))
+    except ValueError:
+        return DEFAULT_RETENTION_DAYS
+
+
+def _persist(records: list):
+    from src.database import purge_pipeline_metrics, save_pipeline_metrics
+
+    with suspended():
+        try:
+            ok, msg = save_pipeline_metrics(records)
+            if not ok:
+                logger.warning("Métricas da execução não gravadas: %s", msg)
+            dias = retention_days()
+            if ok and dias > 0:
+                ok, msg = purge_pipeline_metrics(dias)
+                if not ok:
+                    logger.warning("Limpeza de 'pipeline_metrics' falhou: %s", msg)
+        except Exception as e:
+            logger.warning("Métricas da execução não gravadas: %s", e)
+
+
+def recent_records(run_id: str | None = None) -> list[StageRecord]:
+    """Registros do buffer em memória (todos, ou só os de 'run_id'), do mais antigo ao mais novo."""
+    with _BUFFER_LOCK:
+        registros = list(_BUFFER)
+    if run_id is not None:
+        registros = [r for r in registros if r.run_id == run_id]
+    return registros
+
+
+def records_to_frame(records: list) -> pd.DataFrame:
+    colunas = list(StageRecord.__dataclass_fields__)
+    return pd.DataFrame([asdict(r) for r in records], columns=colunas)
+
+
+def summarize_run(df: pd.DataFrame) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Quebra de uma execução a partir dos seus registros (buffer ou 'pipeline_metrics').
+
+    Returns:
+        (etapas, sql): por etapa, chamadas, tempo total/médio, % do run, linhas e bytes;
+        por rótulo de SQL (e etapa de origem), chamadas, tempo total e máximo e linhas.
+    """
+    total_run = df.loc[df["kind"] == KIND_RUN, "duration_s"].sum()
+    etapas = (
+        df[df["kind"] == KIND_STAGE]
+        .groupby("stage", sort=False)
+        .agg(chamadas=("duration_s", "size"), tempo_total_s=("duration_s", "sum"),
+             tempo_medio_s=("duration_s", "mean"), linhas_entrada=("rows_in", "sum"),
+             linhas_saida=("rows_out", "sum"), bytes=("bytes", "sum"), falhas=("ok", lambda s: int((~s.astype(bool)).sum())))
+        .sort_values("tempo_total_s", ascending=False)
+        .reset_index()
+    )
+    if total_run:
+        etapas["pct_run"] = (etapas["tempo_total_s"] / total_run * 100).round(1)
+
+    consultas = df[df["kind"] == KIND_SQL]
+    sql_resumo = (
+        # Registros gravados antes da soma por rótulo: uma chamada cada, sem máximo próprio
+        consultas.assign(etapa=consultas["parent"].fillna("(fora de etapa)"),
+                         calls=consultas["calls"].fillna(1),
+                         max_duration_s=consultas["max_duration_s"].fillna(consultas["duration_s"]))
+        .groupby(["stage", "etapa"], sort=False)
+        .agg(chamadas=("calls", "sum"), tempo_total_s=("duration_s", "sum"),
+             tempo_max_s=("max_duration_s", "max"), linhas=("rows_out", "sum"))
+        .sort_values("tempo_total_s", ascending=False)
+        .reset_index()
+        .rename(columns={"stage": "sql"})
+    )
+    return etapas, sql_resumo
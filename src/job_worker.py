@@ -0,0 +1,390 @@
+# src/job_worker.py
+"""
+Worker da fila 'pipeline_jobs': executa fora do Streamlit os jobs pesados que a
+página de administração só coloca na fila (re-sincronização, re-consolidação,
+transformação completa e atualização a partir da API).
+
+- Reserva: 'SELECT ... FOR UPDATE SKIP LOCKED', então vários workers (ou processos
+  do mesmo worker) nunca pegam o mesmo job.
+- Concorrência: '--concorrencia N' sobe N processos, cada um com a sua conexão.
+- Sobreposição: advisory locks por pesquisa. Jobs de uma pesquisa pegam o lock da
+  pesquisa (exclusivo) e o global (compartilhado); jobs de todas as pesquisas pegam o
+  global exclusivo. Job que não consegue os locks volta para a fila sem gastar tentativa.
+- Tentativas: falhas voltam para a fila com espera exponencial até 'max_attempts'.
+- Batimento: cada processo atualiza 'heartbeat_at' do job em execução; jobs de um
+  worker que parou de responder voltam para a fila.
+
+Uso:
+    python -m src.job_worker                      # um processo, fica escutando a fila
+    python -m src.job_worker --concorrencia 2
+    python -m src.job_worker --uma-vez            # esvazia a fila e sai (cron)
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+
+from src.instrumentation import pipeline_run
+
+logger = logging.getLogger("job_worker")
+
+# Namespace (primeira chave) dos advisory locks de dois inteiros usados pela fila
+LOCK_NAMESPACE = 7231
+GLOBAL_LOCK_KEY = 0
+
+POLL_INTERVAL_SECONDS = 5
+HEARTBEAT_INTERVAL_SECONDS = 30
+STALE_AFTER_SECONDS = 300
+LOCK_RETRY_SECONDS = 15
+RETRY_BASE_SECONDS = 30
+
+
+class JobFailed(Exception):
+    """O job terminou com falha (pode voltar para a fila, conforme as tentativas)."""
+
+
+def claim_job(conn, worker_id: str) -> dict | None:
+    """Reserva o próximo job pronto da fila; None se não houver."""
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            UPDATE pipeline_jobs j
+            SET status = 'running', attempts = j.attempts + 1, worker_id = %s,
+                started_at = CURRENT_TIMESTAMP, heartbeat_at = CURRENT_TIMESTAMP,
+                finished_at = NULL, progress = 0, progress_text = NULL
+            WHERE j.job_id = (
+                SELECT job_id FROM pipeline_jobs
+                WHERE status = 'pending' AND run_after <= CURRENT_TIMESTAMP
+                ORDER BY run_after, job_id
+                FOR UPDATE SKIP LOCKED
+                LIMIT 1
+            )
+            RETURNING j.job_id, j.job_type, j.survey_id, j.params, j.attempts, j.max_attempts;
+        """, (worker_id,))
+        row = cursor.fetchone()
+    finally:
+        cursor.close()
+    if row is None:
+        return None
+    return dict(zip(("job_id", "job_type", "survey_id", "params", "attempts", "max_attempts"), row))
+
+
+def _lock_plan(job: dict) -> list[tuple[str, int]]:
+    if job["survey_id"] is None:
+        return [("pg_try_advisory_lock", GLOBAL_LOCK_KEY)]
+    return [("pg_try_advisory_lock_shared", GLOBAL_LOCK_KEY),
+            ("pg_try_advisory_lock", int(job["survey_id"]))]
+
+
+def acquire_job_locks(conn, job: dict) -> bool:
+    """Tenta os advisory locks do job (na sessão de controle); solta tudo se algum falhar."""
+    cursor = conn.cursor()
+    try:
+        for funcao, chave in _lock_plan(job):
+            cursor.execute(f"SELECT {funcao}(%s, %s);", (LOCK_NAMESPACE, chave))
+            if not cursor.fetchone()[0]:
+                cursor.execute("SELECT pg_advisory_unlock_all();")
+                return False
+        return True
+    finally:
+        cursor.close()
+
+
+def release_job_locks(conn):
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT pg_advisory_unlock_all();")
+    finally:
+        cursor.close()
+
+
+def defer_job(conn, job: dict, seconds: int = LOCK_RETRY_SECONDS):
+    """Devolve à fila um job que não conseguiu os locks, sem contar a tentativa."""
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            UPDATE pipeline_jobs
+            SET status = 'pending', attempts = attempts - 1, worker_id = NULL,
+                started_at = NULL, heartbeat_at = NULL,
+                progress_text = 'Aguardando outro job da mesma pesquisa terminar...',
+                run_after = CURRENT_TIMESTAMP + make_interval(secs => %s)
+            WHERE job_id = %s;
+        """, (seconds, job["job_id"]))
+    finally:
+        cursor.close()
+
+
+def finish_job(conn, job: dict, worker_id: str, result) -> None:
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            UPDATE pipeline_jobs
+            SET status = 'succeeded', progress = 1, result = %s, last_error = NULL,
+                finished_at = CURRENT_TIMESTAMP, heartbeat_at = CURRENT_TIMESTAMP
+            WHERE job_id = %s AND worker_id = %s;
+        """, (json.dumps(result, ensure_ascii=False, default=str), job["job_id"], worker_id))
+    finally:
+        cursor.close()
+
+
+def fail_job(conn, job: dict, worker_id: str, error: str, result=None) -> str:
+    """Registra a falha; volta para a fila com espera exponencial ou falha de vez. Retorna o status."""
+    espera = RETRY_BASE_SECONDS * 2 ** (job["attempts"] - 1)
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            UPDATE pipeline_jobs
+            SET status = CASE WHEN attempts >= max_attempts THEN 'failed' ELSE 'pending' END,
+                finished_at = CASE WHEN attempts >= max_attempts THEN CURRENT_TIMESTAMP END,
+                run_after = CURRENT_TIMESTAMP + make_interval(secs => %s),
+                last_error = %s, result = %s, worker_id = NULL
+            WHERE job_id = %s AND worker_id = %s
+            RETURNING status;
+        """, (espera, error, json.dumps(result, ensure_ascii=False, default=str) if result is not None else None,
+              job["job_id"], worker_id))
+        row = cursor.fetchone()
+        return row[0] if row else "failed"
+    finally:
+        cursor.close()
+
+
+def requeue_stale_jobs(conn, stale_after: int = STALE_AFTER_SECONDS) -> int:
+    """Jobs 'running' sem batimento há 'stale_after' segundos voltam para a fila (ou falham)."""
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            UPDATE pipeline_jobs
+            SET status = CASE WHEN attempts >= max_attempts THEN 'failed' ELSE 'pending' END,
+                finished_at = CASE WHEN attempts >= max_attempts THEN CURRENT_TIMESTAMP END,
+                last_error = 'Worker ' || COALESCE(worker_id, '?') || ' parou de responder.',
+                worker_id = NULL, run_after = CURRENT_TIMESTAMP
+            WHERE status = 'running'
+              AND heartbeat_at < CURRENT_TIMESTAMP - make_interval(secs => %s);
+        """, (stale_after,))
+        return cursor.rowcount
+    finally:
+        cursor.close()
+
+
+class JobProgress:
+    """Grava progresso e batimento do job em execução; seguro para chamar de outra thread."""
+
+    def __init__(self, conn, job: dict, worker_id: str):
+        self.conn = conn
+        self.job = job
+        self.worker_id = worker_id
+
+    def __call__(self, texto: str, fracao: float | None = None):
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute("""
+                UPDATE pipeline_jobs
+                SET progress_text = %s, progress = COALESCE(%s, progress),
+                    heartbeat_at = CURRENT_TIMESTAMP
+                WHERE job_id = %s AND worker_id = %s;
+            """, (texto[:500], fracao, self.job["job_id"], self.worker_id))
+        finally:
+            cursor.close()
+
+    def heartbeat(self):
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute(
+                "UPDATE pipeline_jobs SET heartbeat_at = CURRENT_TIMESTAMP WHERE job_id = %s AND worker_id = %s;",
+                (self.job["job_id"], self.worker_id))
+        finally:
+            cursor.close()
+
+
+class _ProgressLogHandler(logging.Handler):
+    """Repassa as etapas logadas pela pipeline e pelo src.database para o progresso do job."""
+
+    def __init__(self, progress: JobProgress):
+        super().__init__(logging.INFO)
+        self.progress = progress
+
+    def emit(self, record: logging.LogRecord):
+        campos = getattr(record, "campos", {})
+        if record.name == "pipeline" and "etapa" not in campos:
+            return
+        try:
+            self.progress(campos.get("etapa") or record.getMessage())
+        except Exception:
+            self.handleError(record)
+
+
+def run_job(job: dict, progress: JobProgress):
+    """
+    Executa o job com as funções de src/pipeline.py.
+
+    Returns:
+        resultado serializável em JSON; levanta JobFailed se algum item falhou.
+    """
+    from src import pipeline
+
+    survey_ids = [job["survey_id"]] if job["survey_id"] is not None else None
+    tipo = job["job_type"]
+    params = job["params"] or {}
+    # Tempos por etapa/SQL em 'pipeline_metrics'; params {"perfil": true} liga o cProfile
+    with pipeline_run(f"job-{job['job_id']}:{tipo}", profile=bool(params.get("perfil")),
+                      persist=True) as run_id:
+        if tipo == "resync":
+            resultados = [pipeline.resync_survey(job["survey_id"])]
+        elif tipo == "reconsolidate":
+            resultados = pipeline.reconsolidate_surveys(survey_ids, on_progress=progress)
+        elif tipo == "transform":
+            resultados = [pipeline.transform_all()]
+        elif tipo == "refresh":
+            resultados = pipeline.refresh_surveys(survey_ids, on_progress=progress)
+        else:
+            raise JobFailed(f"Tipo de job desconhecido: '{tipo}'.")
+
+    resultado = {"run_id": run_id, "itens": resultados}
+    falhas = [r for r in resultados if r["status"] == pipeline.STATUS_FALHA]
+    if falhas:
+        raise JobFailed("; ".join(f"{r.get('pesquisa', r.get('survey_id', ''))}: {r['mensagem']}"
+                                  for r in falhas)[:2000], resultado)
+    return resultado
+
+
+def _process_job(conn, job: dict, worker_id: str):
+    progress = JobProgress(conn, job, worker_id)
+    parar_batimento = threading.Event()
+
+    def batimento():
+        while not parar_batimento.wait(HEARTBEAT_INTERVAL_SECONDS):
+            try:
+                progress.heartbeat()
+            except Exception:
+                logger.exception("falha_batimento", extra={"campos": {"job_id": job["job_id"]}})
+
+    handler = _ProgressLogHandler(progress)
+    loggers = [logging.getLogger("pipeline"), logging.getLogger("src.database")]
+    for alvo in loggers:
+        alvo.addHandler(handler)
+    thread = threading.Thread(target=batimento, daemon=True)
+    thread.start()
+    inicio = time.perf_counter()
+    campos = {"job_id": job["job_id"], "tipo": job["job_type"], "survey_id": job["survey_id"],
+              "tentativa": job["attempts"]}
+    logger.info("job_iniciado", extra={"campos": campos})
+    try:
+        resultado = run_job(job, progress)
+        finish_job(conn, job, worker_id, resultado)
+        logger.info("job_concluido", extra={"campos": {
+            **campos, "duracao_s": round(time.perf_counter() - inicio, 2)}})
+    except Exception as e:
+        resultado = e.args[1] if isinstance(e, JobFailed) and len(e.args) > 1 else None
+        status = fail_job(conn, job, worker_id, str(e.args[0] if e.args else e), resultado)
+        logger.error("job_falhou", exc_info=not isinstance(e, JobFailed), extra={"campos": {
+            **campos, "novo_status": status, "erro": str(e.args[0] if e.args else e),
+            "duracao_s": round(time.perf_counter() - inicio, 2)}})
+    finally:
+        parar_batimento.set()
+        thread.join()
+        for alvo in loggers:
+            alvo.removeHandler(handler)
+
+
+def run_worker(worker_id: str, stop: threading.Event | None = None, once: bool = False,
+               poll_interval: float = POLL_INTERVAL_SECONDS) -> int:
+    """
+    Laço do worker: reserva, trava, executa e registra jobs até 'stop' ser sinalizado
+    (ou até a fila esvaziar, com 'once'). Retorna quantos jobs foram executados.
+    """
+    from src.database import init_db_schema, open_db_connection
+
+    init_db_schema()
+    # Conexão de controle própria, em autocommit: cada UPDATE da fila vale na hora e
+    # os advisory locks (de sessão) ficam presos a ela enquanto o job roda
+    conn = open_db_connection(instrumented=False)
+    conn.autocommit = True
+    executados = 0
+    try:
+        while stop is None or not stop.is_set():
+            reencaminhados = requeue_stale_jobs(conn)
+            if reencaminhados:
+                logger.warning("jobs_sem_batimento_reencaminhados",
+                               extra={"campos": {"jobs": reencaminhados}})
+
+            job = claim_job(conn, worker_id)
+            if job is None:
+                if once:
+                    break
+                if stop is not None:
+                    stop.wait(poll_interval)
+                else:
+                    time.sleep(poll_interval)
+                continue
+
+            if not acquire_job_locks(conn, job):
+                defer_job(conn, job)
+                logger.info("job_adiado", extra={"campos": {"job_id": job["job_id"], "motivo": "lock"}})
+                continue
+            try:
+                _process_job(conn, job, worker_id)
+                executados += 1
+            finally:
+                release_job_locks(conn)
+    finally:
+        conn.close()
+    return executados
+
+
+def _worker_process(indice: int, stop, once: bool, log_json: bool):
+    from src.pipeline import configure_logging
+
+    # Ctrl+C chega ao grupo todo; só o processo principal decide parar, e os filhos
+    # terminam o job atual antes de sair
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    configure_logging(log_json)
+    run_worker(f"{socket.gethostname()}:{os.getpid()}:{indice}", stop, once)
+
+
+def main(argv: list | None = None) -> int:
+    from src.pipeline import configure_logging
+
+    parser = argparse.ArgumentParser(prog="python -m src.job_worker",
+                                     description="Worker da fila de jobs da pipeline.")
+    parser.add_argument("--concorrencia", type=int, default=1, help="processos em paralelo (padrão: 1)")
+    parser.add_argument("--uma-vez", action="store_true", help="esvazia a fila e sai")
+    parser.add_argument("--log-json", action="store_true", help="log em JSON (uma linha por evento)")
+    args = parser.parse_args(argv)
+    configure_logging(args.log_json)
+
+    if args.concorrencia <= 1:
+        stop = threading.Event()
+        signal.signal(signal.SIGTERM, lambda *_: stop.set())
+        try:
+            run_worker(f"{socket.gethostname()}:{os.getpid()}:0", stop, args.uma_vez)
+        except KeyboardInterrupt:
+            logger.warning("interrompido")
+            return 1
+        return 0
+
+    contexto = multiprocessing.get_context("spawn")
+    stop = contexto.Event()
+    processos = [contexto.Process(target=_worker_process, args=(i, stop, args.uma_vez, args.log_json))
+                 for i in range(args.concorrencia)]
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    for processo in processos:
+        processo.start()
+    try:
+        for processo in processos:
+            processo.join()
+    except KeyboardInterrupt:
+        logger.warning("parando", extra={"campos": {"motivo": "SIGINT, aguardando jobs em execução"}})
+        stop.set()
+        for processo in processos:
+            processo.join()
+    return 0 if all(p.exitcode == 0 for p in processos) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
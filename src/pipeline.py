@@ -0,0 +1,325 @@
+# src/pipeline.py
+"""
+Execução da pipeline de dados fora do Streamlit (cron, terminal, jobs).
+
+Reaproveita as mesmas funções das páginas (busca na API, mapeamento, armazenamento
+bruto, consolidação, padronização e carga na tabela de análise), com log estruturado
+e código de saída diferente de zero quando alguma etapa falha.
+
+Uso:
+    python -m src.pipeline refresh                  # todas as pesquisas em campo
+    python -m src.pipeline refresh --pesquisa 12
+    python -m src.pipeline reconsolidate [--pesquisa 12]
+    python -m src.pipeline transform
+    python -m src.pipeline resync --pesquisa 12
+    python -m src.pipeline migrate [--lote 50000]   # converte a 'consolidated_data' antiga
+    python -m src.pipeline --log-json refresh       # uma linha JSON por evento
+"""
+import argparse
+import json
+import logging
+import sys
+import time
+from typing import Callable
+
+from src.instrumentation import (KIND_PROFILE, KIND_RUN, pipeline_run, recent_records,
+                                 records_to_frame, summarize_run)
+
+logger = logging.getLogger("pipeline")
+
+STATUS_ATUALIZADA = "atualizada"
+STATUS_SEM_NOVOS = "sem_novos_dados"
+STATUS_FALHA = "falha"
+
+
+class PipelineError(Exception):
+    """Falha numa etapa da pipeline; a mensagem diz qual."""
+
+
+def _log(level: int, evento: str, **campos):
+    logger.log(level, evento, extra={"campos": campos})
+
+
+def refresh_survey(survey_id: int, research_name: str, api_link: str,
+                   expected_total: int, on_step: Callable[[str], None] | None = None) -> dict:
+    """
+    Atualiza uma pesquisa: busca a API e, havendo respondentes novos, mapeia, salva os
+    dados brutos, consolida, padroniza e carrega na tabela de análise. As estatísticas
+    de coleta são atualizadas mesmo em caso de falha.
+
+    Args:
+        on_step: chamado com a descrição de cada etapa (ex.: 'status.write' na página).
+
+    Returns:
+        dict: survey_id, pesquisa, status, novas_coletas, mensagem.
+    """
+    from src.data_ingestion import dataframe_to_records, fetch_dataframe_from_api
+    from src.data_processing import map_api_dataframe_columns, process_and_standardize_data
+    from src.database import (consolidate_survey_data, get_all_surveys,
+                              get_consolidated_data_for_surveys, get_respondent_count,
+                              save_analytics_data, store_respondent_data, update_survey_stats)
+
+    def etapa(texto: str):
+        _log(logging.INFO, "etapa", survey_id=survey_id, etapa=texto)
+        if on_step is not None:
+            on_step(texto)
+
+    resultado = {"survey_id": survey_id, "pesquisa": research_name,
+                 "status": STATUS_SEM_NOVOS, "novas_coletas": 0, "mensagem": ""}
+    inicio = time.perf_counter()
+    try:
+        pre_update_count = get_respondent_count(survey_id)
+        raw_df = fetch_dataframe_from_api(api_link)
+        if raw_df is None:
+            raise PipelineError("Falha ao buscar dados da API.")
+
+        if len(raw_df) > pre_update_count:
+            etapa("1. Mapeando e salvando novos dados brutos...")
+            mapped_df, _ = map_api_dataframe_columns(raw_df, survey_id)
+            store_success, num_added, warn_msg = store_respondent_data(
+                survey_id, dataframe_to_records(mapped_df))
+            if not store_success:
+                raise PipelineError(f"Falha ao salvar dados brutos: {warn_msg}")
+            resultado["novas_coletas"] = num_added
+
+            etapa("2. Consolidando dados para formato de análise...")
+            consol_success, consol_msg = consolidate_survey_data(survey_id)
+            if not consol_success:
+                raise PipelineError(f"Falha na consolidação: {consol_msg}")
+
+            etapa("3. Padronizando, validando e carregando para tabela final...")
+            analytics_df = process_and_standardize_data(
+                get_consolidated_data_for_surveys([survey_id]), get_all_surveys())
+            save_success, save_msg = save_analytics_data(analytics_df)
+            if not save_success:
+                raise PipelineError(f"Falha ao salvar na tabela de análise: {save_msg}")
+            resultado["status"] = STATUS_ATUALIZADA
+            resultado["mensagem"] = save_msg
+    except Exception as e:
+        resultado["status"] = STATUS_FALHA
+        resultado["mensagem"] = str(e)
+    finally:
+        update_survey_stats(survey_id, get_respondent_count(survey_id), int(expected_total or 0))
+
+    _log(logging.ERROR if resultado["status"] == STATUS_FALHA else logging.INFO,
+         "pesquisa_atualizada", duracao_s=round(time.perf_counter() - inicio, 2), **resultado)
+    return resultado
+
+
+def refresh_surveys(survey_ids: list | None = None,
+                    on_progress: Callable[[str, float], None] | None = None) -> list[dict]:
+    """
+    Atualiza as pesquisas em campo (ou só as de 'survey_ids').
+    'on_progress(texto, fracao)' é chamado antes de cada pesquisa.
+    """
+    from src.database import get_updatable_surveys
+
+    surveys = get_updatable_surveys()
+    if survey_ids:
+        surveys = surveys[surveys["survey_id"].isin(survey_ids)]
+    resultados = []
+    for i, row in enumerate(surveys.itertuples()):
+        if on_progress is not None:
+            on_progress(f"Atualizando: {row.research_name} ({i + 1}/{len(surveys)})", i / len(surveys))
+        resultados.append(refresh_survey(int(row.survey_id), row.research_name, row.api_link,
+                                         int(row.expected_total or 0)))
+    return resultados
+
+
+def reconsolidate_surveys(survey_ids: list | None = None,
+                          on_progress: Callable[[str, float], None] | None = None) -> list[dict]:
+    """
+    Reconsolida os dados brutos (JSONB) de todas as pesquisas ou das informadas.
+    'on_progress(texto, fracao)' é chamado antes de cada pesquisa.
+    """
+    from src.database import consolidate_survey_data, get_all_surveys
+
+    surveys = get_all_surveys()
+    if survey_ids:
+        surveys = surveys[surveys["survey_id"].isin(survey_ids)]
+    resultados = []
+    for i, row in enumerate(surveys.itertuples()):
+        if on_progress is not None:
+            on_progress(f"Processando: {row.research_name} ({i + 1}/{len(surveys)})", i / len(surveys))
+        inicio = time.perf_counter()
+        success, msg = consolidate_survey_data(int(row.survey_id))
+        resultado = {"survey_id": int(row.survey_id), "pesquisa": row.research_name,
+                     "status": STATUS_ATUALIZADA if success else STATUS_FALHA, "mensagem": msg}
+        _log(logging.INFO if success else logging.ERROR, "pesquisa_reconsolidada",
+             duracao_s=round(time.perf_counter() - inicio, 2), **resultado)
+        resultados.append(resultado)
+    return resultados
+
+
+def transform_all() -> dict:
+    """Reprocessa toda a 'consolidated_data' e recarrega 'analytics_respondents'."""
+    from src.data_processing import process_and_standardize_data
+    from src.database import get_all_consolidated_data, get_all_surveys, save_analytics_data
+
+    inicio = time.perf_counter()
+    long_df = get_all_consolidated_data()
+    if long_df.empty:
+        resultado = {"status": STATUS_SEM_NOVOS, "linhas": 0,
+                     "mensagem": "Tabela de dados consolidados está vazia. Nada a processar."}
+    else:
+        analytics_df = process_and_standardize_data(long_df, get_all_surveys())
+        if analytics_df.empty:
+            resultado = {"status": STATUS_FALHA, "linhas": 0,
+                         "mensagem": "O processamento não gerou dados para salvar."}
+        else:
+            success, msg = save_analytics_data(analytics_df)
+            resultado = {"status": STATUS_ATUALIZADA if success else STATUS_FALHA,
+                         "linhas": len(analytics_df), "mensagem": msg}
+    _log(logging.ERROR if resultado["status"] == STATUS_FALHA else logging.INFO,
+         "transformacao", duracao_s=round(time.perf_counter() - inicio, 2), **resultado)
+    return resultado
+
+
+def resync_survey(survey_id: int) -> dict:
+    """Re-sincronização completa (apaga e re-ingere) de uma pesquisa."""
+    from src.database import get_all_surveys, resync_full_survey
+
+    surveys = get_all_surveys()
+    linha = surveys[surveys["survey_id"] == survey_id]
+    if linha.empty:
+        resultado = {"survey_id": survey_id, "status": STATUS_FALHA,
+                     "mensagem": f"Pesquisa {survey_id} não encontrada."}
+    else:
+        inicio = time.perf_counter()
+        success, msg = resync_full_survey(survey_id, linha.iloc[0]["api_link"])
+        resultado = {"survey_id": survey_id, "pesquisa": linha.iloc[0]["research_name"],
+                     "status": STATUS_ATUALIZADA if success else STATUS_FALHA, "mensagem": msg,
+                     "duracao_s": round(time.perf_counter() - inicio, 2)}
+    _log(logging.ERROR if resultado["status"] == STATUS_FALHA else logging.INFO,
+         "pesquisa_ressincronizada", **resultado)
+    return resultado
+
+
+def migrate_consolidated(batch_size: int) -> dict:
+    """Migração única da 'consolidated_data' antiga para o armazenamento por dicionário."""
+    from src.database import migrate_consolidated_data
+
+    inicio = time.perf_counter()
+    success, msg = migrate_consolidated_data(batch_size)
+    resultado = {"status": STATUS_ATUALIZADA if success else STATUS_FALHA, "mensagem": msg,
+                 "duracao_s": round(time.perf_counter() - inicio, 2)}
+    _log(logging.INFO if success else logging.ERROR, "migracao", **resultado)
+    return resultado
+
+
+class _JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "nivel": record.levelname,
+            "logger": record.name,
+            "evento": record.getMessage(),
+            **getattr(record, "campos", {}),
+        }
+        if record.exc_info:
+            payload["exc"] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class _TextFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        campos = " ".join(f"{k}={v!r}" for k, v in getattr(record, "campos", {}).items())
+        linha = f"{self.formatTime(record, '%Y-%m-%d %H:%M:%S')} {record.levelname:<7} {record.name}: {record.getMessage()}"
+        linha = f"{linha} {campos}" if campos else linha
+        if record.exc_info:
+            linha = f"{linha}\n{self.formatException(record.exc_info)}"
+        return linha
+
+
+def configure_logging(json_output: bool = False, level: int = logging.INFO):
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(_JsonFormatter() if json_output else _TextFormatter())
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(level)
+    # Sem sessão do Streamlit, cada cache e cada 'st.*' avisa que está em modo 'bare'
+    from streamlit import logger as st_logger
+    st_logger.set_log_level(logging.ERROR)
+
+
+def _parse_ids(valor: str) -> list[int]:
+    return [int(v) for v in valor.split(",") if v.strip()]
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m src.pipeline",
+                                     description="Pipeline de dados sem Streamlit.")
+    parser.add_argument("--log-json", action="store_true", help="log em JSON (uma linha por evento)")
+    parser.add_argument("--verbose", action="store_true", help="inclui mensagens de depuração")
+    parser.add_argument("--perfil", action="store_true", help="roda sob cProfile e imprime as funções mais caras")
+    sub = parser.add_subparsers(dest="comando", required=True)
+
+    refresh = sub.add_parser("refresh", help="busca novos dados da API e roda a pipeline completa")
+    refresh.add_argument("--pesquisa", type=_parse_ids,
+                         help="survey_ids separados por vírgula (padrão: todas em campo)")
+
+    reconsolidate = sub.add_parser("reconsolidate", help="reconsolida os dados brutos (JSONB)")
+    reconsolidate.add_argument("--pesquisa", type=_parse_ids,
+                               help="survey_ids separados por vírgula (padrão: todas)")
+
+    sub.add_parser("transform", help="reprocessa toda a consolidated_data para analytics_respondents")
+
+    resync = sub.add_parser("resync", help="apaga e re-ingere uma pesquisa a partir da API")
+    resync.add_argument("--pesquisa", type=int, required=True)
+
+    migrate = sub.add_parser("migrate", help="converte a consolidated_data antiga (texto) para os dicionários")
+    migrate.add_argument("--lote", type=int, default=50_000, help="faixa de ids copiada por transação")
+    return parser
+
+
+def _log_run_breakdown(print_profile: bool):
+    """Loga o tempo por etapa da última execução e, se pedido, imprime o perfil (cProfile)."""
+    execucoes = [r for r in recent_records() if r.kind == KIND_RUN]
+    if not execucoes:
+        return
+    registros = recent_records(execucoes[-1].run_id)
+    etapas, _ = summarize_run(records_to_frame(registros))
+    for linha in etapas.itertuples():
+        _log(logging.INFO, "tempo_etapa", run_id=execucoes[-1].run_id, etapa=linha.stage,
+             chamadas=linha.chamadas, tempo_total_s=round(linha.tempo_total_s, 3),
+             linhas_entrada=linha.linhas_entrada, linhas_saida=linha.linhas_saida)
+    if print_profile:
+        for registro in registros:
+            if registro.kind == KIND_PROFILE:
+                print(registro.details, file=sys.stderr)
+
+
+def main(argv: list | None = None) -> int:
+    args = build_parser().parse_args(argv)
+    configure_logging(args.log_json, logging.DEBUG if args.verbose else logging.INFO)
+    _log(logging.INFO, "inicio", comando=args.comando)
+    inicio = time.perf_counter()
+
+    try:
+        with pipeline_run(args.comando, profile=args.perfil, persist=True) as run_id:
+            if args.comando == "refresh":
+                resultados = refresh_surveys(args.pesquisa)
+            elif args.comando == "reconsolidate":
+                resultados = reconsolidate_surveys(args.pesquisa)
+            elif args.comando == "transform":
+                resultados = [transform_all()]
+            elif args.comando == "resync":
+                resultados = [resync_survey(args.pesquisa)]
+            else:
+                resultados = [migrate_consolidated(args.lote)]
+    except Exception:
+        logger.exception("erro_inesperado", extra={"campos": {"comando": args.comando}})
+        return 1
+    finally:
+        _log_run_breakdown(args.perfil)
+
+    falhas = sum(r["status"] == STATUS_FALHA for r in resultados)
+    _log(logging.ERROR if falhas else logging.INFO, "fim", comando=args.comando,
+         run_id=run_id, itens=len(resultados), falhas=falhas,
+         novas_coletas=sum(r.get("novas_coletas", 0) for r in resultados),
+         duracao_s=round(time.perf_counter() - inicio, 2))
+    return 1 if falhas else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,185 @@
+# src/query_log.py
+"""
+Log local de consultas lentas.
+
+Toda consulta das conexões de src/database.py passa pelo 'InstrumentedCursor'
+(src/instrumentation.py), que mede separadamente a execução (servidor + rede) e a
+leitura das linhas; 'read_sql' mede ainda a montagem do DataFrame. Quando o total
+passa do limite, uma linha JSON vai para o log com os tempos, o número de linhas e,
+se a execução sozinha foi lenta, o plano ('EXPLAIN (ANALYZE, BUFFERS)' para SELECT,
+'EXPLAIN' simples para comandos que alteram dados).
+
+Configuração (variáveis de ambiente):
+    SLOW_QUERY_MS       limite em milissegundos (padrão 1000; 0 desliga o log)
+    SLOW_QUERY_EXPLAIN  'analyze' (padrão), 'plan' (sem executar) ou 'off'
+    SLOW_QUERY_LOG      caminho do arquivo (padrão logs/slow_queries.jsonl)
+
+Relatório:
+    python -m src.query_log --top 20
+"""
+import argparse
+import datetime
+import json
+import os
+import re
+import threading
+import time
+from pathlib import Path
+
+import pandas as pd
+
+DEFAULT_LOG_PATH = Path(__file__).parent.parent / "logs" / "slow_queries.jsonl"
+DEFAULT_THRESHOLD_MS = 1000
+# O mesmo comando não tem o plano capturado de novo antes disso (EXPLAIN ANALYZE re-executa)
+PLAN_COOLDOWN_SECONDS = 600
+
+EXPLAIN_ANALYZE = "analyze"
+EXPLAIN_PLAN = "plan"
+EXPLAIN_OFF = "off"
+
+_EXECUTION_TIME = re.compile(r"Execution Time: ([\d.]+) ms")
+_PLANNING_TIME = re.compile(r"Planning Time: ([\d.]+) ms")
+
+_lock = threading.Lock()
+_last_plan_at: dict = {}
+
+
+def threshold_seconds() -> float:
+    try:
+        return float(os.environ.get("SLOW_QUERY_MS", DEFAULT_THRESHOLD_MS)) / 1000
+    except ValueError:
+        return DEFAULT_THRESHOLD_MS / 1000
+
+
+def explain_mode() -> str:
+    modo = os.environ.get("SLOW_QUERY_EXPLAIN", EXPLAIN_ANALYZE).lower()
+    return modo if modo in (EXPLAIN_ANALYZE, EXPLAIN_PLAN, EXPLAIN_OFF) else EXPLAIN_ANALYZE
+
+
+def log_path() -> Path:
+    return Path(os.environ.get("SLOW_QUERY_LOG", DEFAULT_LOG_PATH))
+
+
+def is_slow(seconds: float) -> bool:
+    limite = threshold_seconds()
+    return limite > 0 and seconds >= limite
+
+
+def explain_prefix(label: str) -> str | None:
+    """Prefixo do EXPLAIN adequado ao comando, ou None se não deve haver plano."""
+    modo = explain_mode()
+    comando = label.split(" ", 1)[0]
+    if modo == EXPLAIN_OFF or comando not in ("SELECT", "INSERT", "UPDATE", "DELETE"):
+        return None
+    if modo == EXPLAIN_ANALYZE and comando == "SELECT":
+        return "EXPLAIN (ANALYZE, BUFFERS) "
+    return "EXPLAIN "
+
+
+def should_capture_plan(label: str) -> bool:
+    """Controla a frequência: no máximo um plano por comando a cada PLAN_COOLDOWN_SECONDS."""
+    agora = time.monotonic()
+    with _lock:
+        ultimo = _last_plan_at.get(label)
+        if ultimo is not None and agora - ultimo < PLAN_COOLDOWN_SECONDS:
+            return False
+        _last_plan_at[label] = agora
+        return True
+
+
+def write_entry(label: str, query: str, execute_s: float, fetch_s: float, build_s: float | None,
+                rows: int | None, stage: str | None = None, run_id: str | None = None,
+                plan: str | None = None):
+    """Acrescenta uma consulta lenta ao log (uma linha JSON)."""
+    entrada = {
+        "ts": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "sql": label,
+        "execucao_s": round(execute_s, 4),
+        "leitura_s": round(fetch_s, 4),
+        "dataframe_s": round(build_s, 4) if build_s is not None else None,
+        "total_s": round(execute_s + fetch_s + (build_s or 0), 4),
+        "linhas": rows,
+        "etapa": stage,
+        "run_id": run_id,
+        "consulta": query,
+    }
+    if plan:
+        entrada["plano"] = plan
+        servidor = _EXECUTION_TIME.search(plan)
+        planejamento = _PLANNING_TIME.search(plan)
+        if servidor:
+            # O que sobra da execução medida no cliente é rede/pooler e fila de conexão
+            entrada["servidor_s"] = round(float(servidor.group(1)) / 1000
+                                          + (float(planejamento.group(1)) / 1000 if planejamento else 0), 4)
+            entrada["rede_s"] = round(max(execute_s - entrada["servidor_s"], 0), 4)
+
+    caminho = log_path()
+    linha = json.dumps(entrada, ensure_ascii=False)
+    with _lock:
+        caminho.parent.mkdir(parents=True, exist_ok=True)
+        with open(caminho, "a", encoding="utf-8") as f:
+            f.write(linha + "\n")
+
+
+def read_log(path: Path | None = None) -> pd.DataFrame:
+    """Entradas do log como DataFrame (vazio se o arquivo não existir)."""
+    caminho = Path(path) if path else log_path()
+    if not caminho.exists():
+        return pd.DataFrame()
+    with open(caminho, encoding="utf-8") as f:
+        entradas = [json.loads(linha) for linha in f if linha.strip()]
+    return pd.DataFrame(entradas)
+
+
+def slowest_statements(log: pd.DataFrame, top_n: int = 20) -> pd.DataFrame:
+    """
+    Top-N comandos (agrupados por rótulo e etapa) pelo tempo total acumulado, com a
+    divisão média entre execução, leitura e DataFrame, e o último plano capturado.
+    """
+    if log.empty:
+        return pd.DataFrame()
+    log = log.copy()
+    log["etapa"] = log["etapa"].fillna("")
+    for coluna in ("servidor_s", "rede_s", "plano", "dataframe_s"):
+        if coluna not in log:
+            log[coluna] = None
+    resumo = (
+        log.groupby(["sql", "etapa"], sort=False)
+        .agg(ocorrencias=("total_s", "size"), total_s=("total_s", "sum"), max_s=("total_s", "max"),
+             media_execucao_s=("execucao_s", "mean"), media_leitura_s=("leitura_s", "mean"),
+             media_dataframe_s=("dataframe_s", "mean"), media_servidor_s=("servidor_s", "mean"),
+             media_rede_s=("rede_s", "mean"), media_linhas=("linhas", "mean"),
+             ultimo_plano=("plano", lambda s: s.dropna().iloc[-1] if s.notna().any() else None))
+        .sort_values("total_s", ascending=False)
+        .head(top_n)
+        .reset_index()
+    )
+    return resumo
+
+
+def format_report(resumo: pd.DataFrame, show_plans: bool = False) -> str:
+    if resumo.empty:
+        return "Nenhuma consulta lenta registrada."
+    linhas = []
+    for i, row in enumerate(resumo.itertuples(), start=1):
+        etapa = f" [{row.etapa}]" if row.etapa else ""
+        linhas.append(
+            f"{i:>2}. {row.sql}{etapa}: {row.ocorrencias}x, total {row.total_s:.2f}s, máx {row.max_s:.2f}s | "
+            f"média execução {row.media_execucao_s:.3f}s, leitura {row.media_leitura_s:.3f}s"
+            + (f", DataFrame {row.media_dataframe_s:.3f}s" if pd.notna(row.media_dataframe_s) else "")
+            + (f", servidor {row.media_servidor_s:.3f}s, rede {row.media_rede_s:.3f}s"
+               if pd.notna(row.media_servidor_s) else "")
+            + (f" | ~{row.media_linhas:.0f} linhas" if pd.notna(row.media_linhas) else "")
+        )
+        if show_plans and row.ultimo_plano:
+            linhas.append("    " + row.ultimo_plano.replace("\n", "\n    "))
+    return "\n".join(linhas)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Relatório do log de consultas lentas.")
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--log", type=Path, help=f"arquivo de log (padrão: {DEFAULT_LOG_PATH})")
+    parser.add_argument("--planos", action="store_true", help="mostra o último plano de cada comando")
+    args = parser.parse_args()
+    print(format_report(slowest_statements(read_log(args.log), args.top), args.planos))
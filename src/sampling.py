@@ -0,0 +1,401 @@
+# src/sampling.py
+"""
+Motor de amostragem estratificada vetorizada usado pelo Gerador de Amostra.
+
+Cada respondente recebe um código de estrato uma única vez (via factorize das
+dimensões), as cotas são calculadas com alocação inteira em numpy e o sorteio
+de todos os estratos é feito numa única passada, ordenando por
+(estrato, chave aleatória) com um 'np.random.Generator' semeado.
+"""
+import numpy as np
+import pandas as pd
+
+
+def make_rng(seed: int | None = None) -> np.random.Generator:
+    """Cria o gerador aleatório usado em todos os sorteios (seed=None => não determinístico)."""
+    return np.random.default_rng(seed)
+
+
+def allocate_integer(total: int, weights) -> np.ndarray:
+    """
+    Distribui 'total' unidades inteiras proporcionalmente a 'weights'
+    pelo método dos maiores restos. A soma do resultado é sempre 'total'
+    (ou 0, se todos os pesos forem zero).
+    """
+    weights = np.asarray(weights, dtype=float)
+    if total <= 0 or weights.size == 0 or weights.sum() <= 0:
+        return np.zeros(weights.size, dtype=np.int64)
+
+    exact = total * weights / weights.sum()
+    base = np.floor(exact).astype(np.int64)
+    remainder = int(total - base.sum())
+    if remainder > 0:
+        # Ordenação estável: em empate de resto, o primeiro estrato leva a unidade
+        order = np.argsort(-(exact - base), kind="stable")
+        base[order[:remainder]] += 1
+    return base
+
+
+def encode_dimension(values: pd.Series, categories: list) -> np.ndarray:
+    """
+    Converte uma coluna em códigos inteiros 0..k-1 segundo a ordem de 'categories'.
+    Valores fora da lista (ou nulos) recebem -1.
+    """
+    return pd.Categorical(values, categories=list(categories)).codes.astype(np.int64)
+
+
+def assign_strata(df: pd.DataFrame,
+                  dimensions: dict[str, list]) -> tuple[np.ndarray, np.ndarray, tuple[int, ...]]:
+    """
+    Atribui a cada linha o código de estrato da combinação das dimensões.
+
+    Args:
+        df: base de respondentes.
+        dimensions: {coluna: [categorias na ordem desejada]}.
+
+    Returns:
+        tuple: (codigos_por_dimensao [n x d], codigo_do_estrato [n], shape)
+               O código do estrato é -1 se alguma dimensão estiver fora das categorias.
+    """
+    shape = tuple(len(cats) for cats in dimensions.values())
+    if not dimensions:
+        return (np.zeros((len(df), 0), dtype=np.int64),
+                np.zeros(len(df), dtype=np.int64), ())
+
+    dim_codes = np.column_stack([
+        encode_dimension(df[col], cats) if col in df.columns else
+        np.full(len(df), -1, dtype=np.int64)
+        for col, cats in dimensions.items()
+    ])
+    valid = (dim_codes >= 0).all(axis=1)
+    cell_codes = np.full(len(df), -1, dtype=np.int64)
+    if valid.any():
+        cell_codes[valid] = np.ravel_multi_index(tuple(dim_codes[valid].T), shape)
+    return dim_codes, cell_codes, shape
+
+
+def cell_weights(dimensions: dict[str, dict]) -> np.ndarray:
+    """
+    Produto das proporções marginais (em %) de cada dimensão, achatado na mesma
+    ordem de 'assign_strata'. Retorna a fração esperada de cada estrato.
+    """
+    grid = np.ones(1)
+    for weights in dimensions.values():
+        pcts = np.asarray(list(weights.values()), dtype=float) / 100.0
+        grid = np.multiply.outer(grid, pcts)
+    return grid.reshape(-1)
+
+
+def marginal_targets(dimensions: dict[str, dict], total: float) -> list[np.ndarray]:
+    """Converte os pesos marginais (%) de cada dimensão em alvos absolutos para 'total'."""
+    return [
+        np.asarray(list(weights.values()), dtype=float) / 100.0 * total
+        for weights in dimensions.values()
+    ]
+
+
+def rake_allocation(available: np.ndarray,
+                    targets: list[np.ndarray],
+                    max_iter: int = 200,
+                    tol: float = 0.5) -> np.ndarray:
+    """
+    Ajuste proporcional iterativo (IPF / raking) com teto por célula.
+
+    Parte do produto das marginais (restrito às células com disponibilidade) e,
+    a cada iteração, reescala uma dimensão por vez para bater a sua marginal,
+    aplicando em seguida o teto 'available'. Células vazias ficam em zero e as
+    demais células da mesma marginal absorvem a diferença.
+
+    Args:
+        available: tensor (shape das dimensões) com o N disponível por célula.
+        targets: alvo absoluto de cada categoria, uma lista por dimensão.
+
+    Returns:
+        np.ndarray: alocação contínua (mesmo shape de 'available').
+    """
+    available = np.asarray(available, dtype=float)
+    if available.size == 0:
+        return available.copy()
+
+    ndim = available.ndim
+    other_axes = [tuple(i for i in range(ndim) if i != axis) for axis in range(ndim)]
+    shapes = [tuple(-1 if i == axis else 1 for i in range(ndim)) for axis in range(ndim)]
+    # Alvo alcançável de cada marginal: não dá para pedir mais do que existe na categoria
+    reachable = [np.minimum(target, available.sum(axis=other_axes[axis]))
+                 for axis, target in enumerate(targets)]
+
+    total = float(targets[0].sum()) if targets else float(available.sum())
+    seed = np.ones(available.shape)
+    for axis, target in enumerate(targets):
+        share = target / target.sum() if target.sum() > 0 else np.zeros_like(target)
+        seed = seed * share.reshape(shapes[axis])
+    allocation = np.minimum(seed * total, available)
+    allocation[available <= 0] = 0.0
+
+    for _ in range(max_iter):
+        for axis, target in enumerate(targets):
+            current = allocation.sum(axis=other_axes[axis])
+            with np.errstate(divide="ignore", invalid="ignore"):
+                factor = np.where(current > 0, target / current, 0.0)
+            allocation = np.minimum(allocation * factor.reshape(shapes[axis]),
+                                    available)
+
+        worst_gap = max(
+            float(np.abs(allocation.sum(axis=other_axes[axis]) - reachable[axis]).max())
+            for axis in range(ndim))
+        if worst_gap <= tol:
+            break
+    return allocation
+
+
+def round_allocation(allocation: np.ndarray, available: np.ndarray) -> np.ndarray:
+    """
+    Arredonda uma alocação contínua para inteiros preservando o total
+    (maiores restos) sem ultrapassar o teto de cada célula.
+    """
+    flat = np.asarray(allocation, dtype=float).reshape(-1)
+    caps = np.asarray(available, dtype=np.int64).reshape(-1)
+    base = np.minimum(np.floor(flat).astype(np.int64), caps)
+    remainder = int(round(flat.sum())) - int(base.sum())
+    if remainder > 0:
+        frac = np.where(base < caps, flat - base, -1.0)
+        order = np.argsort(-frac, kind="stable")
+        eligible = order[frac[order] > 0][:remainder]
+        base[eligible] += 1
+    return base.reshape(np.shape(allocation))
+
+
+def repair_marginals(quotas: np.ndarray, allocation: np.ndarray,
+                     available: np.ndarray) -> np.ndarray:
+    """
+    Corrige as marginais de cotas já arredondadas: o arredondamento célula a célula
+    (mesmo preservando o total) pode deixar cada marginal algumas unidades longe da
+    marginal contínua, e o erro cresce com o número de células.
+
+    O alvo inteiro de cada marginal é a marginal contínua de 'allocation' arredondada
+    pelos maiores restos. Para cada dimensão, unidades passam de uma categoria acima
+    do alvo para uma abaixo dentro da mesma combinação das demais dimensões, o que não
+    altera as marginais das outras dimensões. Entre as combinações possíveis (origem
+    com cota, destino abaixo do teto), vale a que mais aproxima as duas células da
+    alocação contínua.
+
+    Returns:
+        np.ndarray: cotas inteiras (mesmo shape), com o mesmo total.
+    """
+    quotas = np.array(quotas, dtype=np.int64)
+    if quotas.ndim == 0 or quotas.size == 0:
+        return quotas
+    caps = np.asarray(available, dtype=np.int64)
+    allocation = np.asarray(allocation, dtype=float)
+    total = int(quotas.sum())
+
+    for axis in range(quotas.ndim):
+        k = quotas.shape[axis]
+        q = np.moveaxis(quotas, axis, 0).reshape(k, -1).copy()
+        cap = np.moveaxis(caps, axis, 0).reshape(k, -1)
+        cont = np.moveaxis(allocation, axis, 0).reshape(k, -1)
+        gap = q.sum(axis=1) - allocate_integer(total, cont.sum(axis=1))
+
+        while (gap > 0).any():
+            origem = int(np.argmax(gap))
+            movido = False
+            # Destinos do mais abaixo do alvo para o menos
+            for destino in np.argsort(gap, kind="stable"):
+                if gap[destino] >= 0:
+                    break
+                possivel = (q[origem] > 0) & (q[destino] < cap[destino])
+                if not possivel.any():
+                    continue
+                ganho = (q[origem] - cont[origem]) + (cont[destino] - q[destino])
+                coluna = int(np.argmax(np.where(possivel, ganho, -np.inf)))
+                q[origem, coluna] -= 1
+                q[destino, coluna] += 1
+                gap[origem] -= 1
+                gap[destino] += 1
+                movido = True
+                break
+            if not movido:
+                break  # Sem troca possível sob os tetos: fica a melhor aproximação
+
+        shape_movido = np.moveaxis(quotas, axis, 0).shape
+        quotas = np.moveaxis(q.reshape(shape_movido), 0, axis)
+    return np.ascontiguousarray(quotas)
+
+
+def solve_quotas(available: np.ndarray,
+                 dimensions: dict[str, dict],
+                 total: int,
+                 max_iter: int = 200) -> np.ndarray:
+    """
+    Resolve as cotas inteiras por célula que mais se aproximam das marginais
+    pedidas (em % por dimensão) para uma amostra de 'total', respeitando o
+    disponível de cada célula. Depois do arredondamento, cada marginal é
+    corrigida para a marginal contínua arredondada ('repair_marginals').
+
+    Returns:
+        np.ndarray: cotas inteiras no mesmo shape de 'available'.
+    """
+    if total <= 0 or not dimensions:
+        return np.zeros(np.shape(available), dtype=np.int64)
+    allocation = rake_allocation(available, marginal_targets(dimensions, total),
+                                 max_iter=max_iter)
+    return repair_marginals(round_allocation(allocation, available), allocation, available)
+
+
+def feasible_total(available: np.ndarray, dimensions: dict[str, dict],
+                   total: int) -> int:
+    """
+    Maior tamanho de amostra (<= total) cujas marginais cabem no disponível
+    de cada categoria: total * min(disponível / alvo) sobre todas as marginais.
+    """
+    ratio = 1.0
+    for axis, target in enumerate(marginal_targets(dimensions, total)):
+        other_axes = tuple(i for i in range(np.ndim(available)) if i != axis)
+        margin = np.asarray(available).sum(axis=other_axes)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ratios = np.where(target > 0, margin / target, np.inf)
+        ratio = min(ratio, float(ratios.min()) if ratios.size else 1.0)
+    return int(np.floor(total * min(ratio, 1.0)))
+
+
+def select_by_group_quota(group_codes: np.ndarray,
+                          quotas: np.ndarray,
+                          rng: np.random.Generator,
+                          eligible: np.ndarray | None = None,
+                          random_keys: np.ndarray | None = None) -> np.ndarray:
+    """
+    Sorteia, sem reposição e numa única passada, até quotas[g] linhas de cada grupo g.
+
+    As linhas elegíveis são ordenadas por (grupo, chave aleatória); dentro de cada
+    grupo, ficam as que têm posição < cota. Linhas com grupo -1 nunca são escolhidas.
+
+    Returns:
+        np.ndarray: máscara booleana (len(group_codes)) das linhas selecionadas.
+    """
+    n = len(group_codes)
+    selected = np.zeros(n, dtype=bool)
+    mask = group_codes >= 0
+    if eligible is not None:
+        mask &= eligible
+    candidates = np.flatnonzero(mask)
+    if candidates.size == 0:
+        return selected
+
+    keys = random_keys[candidates] if random_keys is not None else rng.random(candidates.size)
+    groups = group_codes[candidates]
+    order = np.lexsort((keys, groups))
+    sorted_groups = groups[order]
+
+    # Posição de cada linha dentro do seu grupo (0, 1, 2, ...)
+    group_start = np.searchsorted(sorted_groups, sorted_groups, side="left")
+    rank = np.arange(sorted_groups.size) - group_start
+    take = rank < quotas[sorted_groups]
+    selected[candidates[order[take]]] = True
+    return selected
+
+
+def hierarchical_stratified_sample(pool_df: pd.DataFrame,
+                                   n_requested: int,
+                                   primary: tuple[str, dict],
+                                   secondary: dict[str, dict],
+                                   rng: np.random.Generator | None = None) -> np.ndarray:
+    """
+    Amostragem hierárquica sobre o pool (sem o grupo 'core'):
+
+    1. Cotas por célula (primária x secundárias) resolvidas por raking
+       ('solve_quotas') contra as marginais pedidas e o disponível de cada célula.
+    2. Completa o que faltou na cota da dimensão primária (renda) com qualquer
+       respondente da mesma faixa: round(n * pct), limitada ao disponível.
+    3. Completa o que faltou no total com qualquer respondente restante do pool.
+
+    Returns:
+        np.ndarray: rótulos de índice (de 'pool_df') selecionados.
+    """
+    rng = rng if rng is not None else make_rng()
+    n = len(pool_df)
+    if n_requested <= 0 or n == 0:
+        return pool_df.index[:0].to_numpy()
+
+    primary_col, primary_weights = primary
+    dimensions = {primary_col: primary_weights, **secondary}
+    dim_codes, cell_codes, shape = assign_strata(
+        pool_df, {col: list(w.keys()) for col, w in dimensions.items()})
+    primary_codes = dim_codes[:, 0]
+
+    # Uma única chave aleatória por respondente, reutilizada em todos os estágios
+    keys = rng.random(n)
+
+    # --- Estágio 1: cotas por célula via raking, sob o teto de disponibilidade ---
+    available = np.bincount(cell_codes[cell_codes >= 0],
+                            minlength=int(np.prod(shape))).reshape(shape)
+    quotas = solve_quotas(available, dimensions, n_requested)
+    selected = select_by_group_quota(cell_codes, quotas.reshape(-1), rng,
+                                     random_keys=keys)
+
+    # --- Estágio 2: completa cada cota primária dentro da própria faixa ---
+    primary_pcts = np.asarray(list(primary_weights.values()), dtype=float)
+    primary_targets = np.rint(n_requested * primary_pcts / 100.0).astype(np.int64)
+    primary_targets[primary_pcts <= 0] = 0
+    primary_available = np.bincount(primary_codes[primary_codes >= 0],
+                                    minlength=len(primary_pcts))
+    primary_quota = np.minimum(primary_targets, primary_available)
+    taken_primary = np.bincount(primary_codes[selected],
+                                minlength=len(primary_pcts))
+    primary_shortfall = np.maximum(primary_quota - taken_primary, 0)
+    # O arredondamento das cotas pode deixar menos espaço que o shortfall somado
+    remaining = max(n_requested - int(selected.sum()), 0)
+    if primary_shortfall.sum() > remaining:
+        primary_shortfall = allocate_integer(remaining, primary_shortfall)
+    if primary_shortfall.any():
+        selected |= select_by_group_quota(primary_codes, primary_shortfall, rng,
+                                          eligible=~selected, random_keys=keys)
+
+    # --- Estágio 3: completa o total com o restante do pool ---
+    overall_shortfall = n_requested - int(selected.sum())
+    if overall_shortfall > 0:
+        selected |= select_by_group_quota(np.zeros(n, dtype=np.int64),
+                                          np.array([overall_shortfall]), rng,
+                                          eligible=~selected, random_keys=keys)
+
+    return pool_df.index.to_numpy()[selected]
+
+
+def proportional_stratified_sample(df: pd.DataFrame,
+                                   sample_size: int,
+                                   dimensions: dict[str, dict],
+                                   rng: np.random.Generator | None = None) -> tuple[np.ndarray, pd.DataFrame]:
+    """
+    Amostra proporcional: mantém as marginais pedidas, reduzindo o tamanho
+    apenas o necessário para que cada categoria caiba no disponível
+    ('feasible_total'). As cotas por célula são resolvidas por raking, então
+    um estrato vazio é compensado pelos vizinhos em vez de zerar a amostra.
+
+    Returns:
+        tuple: (rótulos de índice selecionados,
+                plano por estrato com as colunas das dimensões,
+                'target_n' (produto das marginais x sample_size), 'available_n',
+                'ratio' e 'quota_n' (cota resolvida))
+    """
+    rng = rng if rng is not None else make_rng()
+    _, cell_codes, shape = assign_strata(
+        df, {col: list(w.keys()) for col, w in dimensions.items()})
+    n_cells = int(np.prod(shape)) if shape else 1
+
+    target_n = cell_weights(dimensions) * sample_size
+    available_n = np.bincount(cell_codes[cell_codes >= 0], minlength=n_cells)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratio = np.where(target_n > 0, available_n / target_n, 1.0)
+
+    available = available_n.reshape(shape)
+    n_feasible = feasible_total(available, dimensions, sample_size)
+    quotas = solve_quotas(available, dimensions, n_feasible).reshape(-1)
+    selected = select_by_group_quota(cell_codes, quotas, rng)
+
+    combos = pd.MultiIndex.from_product([list(w.keys()) for w in dimensions.values()],
+                                        names=list(dimensions.keys()))
+    plan = combos.to_frame(index=False)
+    plan["target_n"] = target_n
+    plan["available_n"] = available_n
+    plan["ratio"] = ratio
+    plan["quota_n"] = quotas
+    return df.index.to_numpy()[selected], plan
@@ -0,0 +1,291 @@
+# src/unified_base.py
+"""
+Montagem da base unificada (formato largo) usada na página Bases Unificadas.
+
+As chaves respondent_id+survey_id são normalizadas uma única vez (sobre os pares
+distintos, não sobre cada linha da base longa) e a base consolidada é pivotada
+uma única vez. A prévia da página é só um recorte do resultado completo.
+"""
+import re
+
+import pandas as pd
+
+from src.area_categorization import categorize_area_columns
+from src.data_processing import (
+    APAC_AREAS_COLS,
+    CODIGOS_PARA_TEXTO_ORIGINAL,
+    perguntas_alvo_codigos,
+)
+
+KEY_COLS = ["respondent_id", "survey_id"]
+NORM_KEY_COLS = ["respondent_id_norm", "survey_id_norm"]
+
+
+def normalize_key_series(series: pd.Series) -> pd.Series:
+    normalized = series.astype(str).str.strip()
+    normalized = normalized.str.replace(r"\.0$", "", regex=True)
+    normalized = normalized.replace(
+        {"nan": pd.NA, "None": pd.NA, "NaT": pd.NA, "": pd.NA}
+    )
+    return normalized
+
+
+def natural_code_sort_key(value: str) -> tuple:
+    parts = re.split(r"(\d+)", str(value))
+    key = []
+    for part in parts:
+        if part.isdigit():
+            key.append((0, int(part)))
+        else:
+            key.append((1, part.lower()))
+    return tuple(key)
+
+
+def question_code_bucket(code: str) -> int:
+    c = str(code).upper()
+    if c.startswith("FE"):
+        return 1
+    if c.startswith("PS"):
+        return 2
+    if c.startswith("IC"):
+        return 3
+    if c.startswith("LOC"):
+        return 4
+    if c.startswith("IIA"):
+        return 5
+    if c.startswith("IA"):
+        return 6
+    if c.startswith("APAC"):
+        return 7
+    if c.startswith("SPP"):
+        return 8
+    if c.startswith("CNM"):
+        return 9
+    return 99
+
+
+def build_canonical_question_order(available_codes: list[str]) -> list[str]:
+    if not available_codes:
+        return []
+
+    available_set = set(available_codes)
+    ordered: list[str] = []
+
+    for code in perguntas_alvo_codigos.keys():
+        if code in available_set and code not in ordered:
+            ordered.append(code)
+
+    for code in CODIGOS_PARA_TEXTO_ORIGINAL.keys():
+        if code in available_set and code not in ordered:
+            ordered.append(code)
+
+    leftovers = [c for c in available_codes if c not in ordered]
+    leftovers = sorted(
+        leftovers,
+        key=lambda x: (question_code_bucket(x), natural_code_sort_key(x)),
+    )
+    ordered.extend(leftovers)
+    return ordered
+
+
+def get_question_text_for_code(code: str) -> str:
+    if not isinstance(code, str):
+        return ""
+
+    if code.endswith("_categorizadas"):
+        base_code = code[: -len("_categorizadas")]
+        base_text = get_question_text_for_code(base_code)
+        if base_text:
+            return f"[CATEGORIA] {base_text}"
+        return f"[CATEGORIA] {base_code}"
+
+    mapped_text = CODIGOS_PARA_TEXTO_ORIGINAL.get(code)
+    if isinstance(mapped_text, str) and mapped_text.strip():
+        return mapped_text.strip()
+
+    aliases = perguntas_alvo_codigos.get(code, [])
+    for alias in aliases:
+        if isinstance(alias, str):
+            alias_clean = alias.strip()
+            if alias_clean and alias_clean != code:
+                return alias_clean
+
+    return code
+
+
+def build_question_row(columns) -> list[str]:
+    return [get_question_text_for_code(col) for col in columns]
+
+
+def build_exportable_df_with_question_row(df: pd.DataFrame) -> pd.DataFrame:
+    if df.empty:
+        return df
+
+    first_row_df = pd.DataFrame([build_question_row(df.columns)], columns=df.columns)
+    export_df = pd.concat([first_row_df, df], ignore_index=True)
+    export_df = export_df.astype("object").where(pd.notna(export_df), "-")
+    export_df = export_df.replace(r"^\s*$", "-", regex=True)
+    return export_df
+
+
+def build_normalized_keys(df: pd.DataFrame) -> pd.DataFrame:
+    # Normaliza só os pares distintos: na base longa cada par se repete por pergunta.
+    keys = df[KEY_COLS].drop_duplicates().copy()
+    keys["respondent_id_norm"] = normalize_key_series(keys["respondent_id"])
+    keys["survey_id_norm"] = normalize_key_series(keys["survey_id"])
+    keys = keys.dropna(subset=NORM_KEY_COLS).drop_duplicates()
+    return keys
+
+
+def build_unified_dataframe(
+    filtered_analytics: pd.DataFrame,
+    df_consolidated: pd.DataFrame,
+) -> tuple[pd.DataFrame, pd.DataFrame, str | None, str | None]:
+    req_cons_cols = {"respondent_id", "survey_id", "question_code", "answer_value"}
+    if not req_cons_cols.issubset(df_consolidated.columns):
+        return (
+            pd.DataFrame(),
+            pd.DataFrame(),
+            "A tabela consolidated_data nao possui as colunas necessarias para unificacao.",
+            None,
+        )
+
+    if filtered_analytics.empty:
+        return pd.DataFrame(), pd.DataFrame(), None, None
+
+    # Metadados filtrados com chave normalizada: usados no casamento e no merge final.
+    filtered_meta = filtered_analytics.copy()
+    filtered_meta["respondent_id_norm"] = normalize_key_series(filtered_meta["respondent_id"])
+    filtered_meta["survey_id_norm"] = normalize_key_series(filtered_meta["survey_id"])
+    filtered_meta = filtered_meta.dropna(subset=NORM_KEY_COLS).drop_duplicates(
+        subset=NORM_KEY_COLS
+    )
+
+    consolidated_keys = build_normalized_keys(df_consolidated)
+
+    # Pares brutos da base consolidada cuja chave normalizada está na seleção.
+    matched_raw_keys = consolidated_keys.merge(
+        filtered_meta[NORM_KEY_COLS],
+        on=NORM_KEY_COLS,
+        how="inner",
+    )
+
+    if matched_raw_keys.empty:
+        survey_ids_filtered = set(filtered_meta["survey_id_norm"].tolist())
+        survey_ids_consolidated = set(consolidated_keys["survey_id_norm"].tolist())
+        common_surveys = survey_ids_filtered.intersection(survey_ids_consolidated)
+
+        info_msg = (
+            "Nenhuma chave respondent_id+survey_id da selecao foi encontrada em consolidated_data. "
+            f"Respondentes filtrados: {len(filtered_meta):,}. "
+            f"Surveys filtradas: {len(survey_ids_filtered):,}. "
+            f"Surveys em comum com consolidated_data: {len(common_surveys):,}."
+        )
+        return pd.DataFrame(), pd.DataFrame(), None, info_msg
+
+    base_long = df_consolidated.merge(
+        matched_raw_keys[KEY_COLS],
+        on=KEY_COLS,
+        how="inner",
+    )
+
+    # Pivot único: primeira resposta não nula de cada (respondente, pergunta),
+    # equivalente ao pivot_table(aggfunc="first"), sem o custo do groupby genérico.
+    answers = base_long.dropna(subset=["question_code", "answer_value"]).drop_duplicates(
+        subset=KEY_COLS + ["question_code"]
+    )
+    if answers.empty:
+        return pd.DataFrame(), base_long, None, None
+
+    output_wide = (
+        answers.set_index(KEY_COLS + ["question_code"])["answer_value"]
+        .unstack("question_code")
+        .reset_index()
+    )
+    output_wide.columns.name = None
+    question_cols_from_pivot = [c for c in output_wide.columns if c not in set(KEY_COLS)]
+    if isinstance(answers["answer_value"].dtype, pd.CategoricalDtype):
+        # Respostas vindas do dicionário 'answers': cada pergunta fica só com as suas
+        # categorias (o dicionário inteiro em cada coluna incharia memória e Parquet).
+        output_wide[question_cols_from_pivot] = output_wide[question_cols_from_pivot].apply(
+            lambda col: col.cat.remove_unused_categories())
+
+    # Reaproveita a chave normalizada já calculada para os pares brutos.
+    output_wide = output_wide.merge(matched_raw_keys, on=KEY_COLS, how="left")
+
+    final_df = output_wide.merge(
+        filtered_meta,
+        on=NORM_KEY_COLS,
+        how="left",
+        suffixes=("", "_meta"),
+    )
+
+    # Garante a presença do texto original de renda na base unificada.
+    # Se a coluna tratada não existir/estiver nula, usa FE2P10 como fallback.
+    if "renda_texto_original" not in final_df.columns and "FE2P10" in final_df.columns:
+        final_df["renda_texto_original"] = final_df["FE2P10"]
+    elif "renda_texto_original" in final_df.columns and "FE2P10" in final_df.columns:
+        # Como objeto: a coluna pode chegar 'category' (src/analytics_schema.py) e o
+        # fillna com um texto fora das categorias levantaria TypeError.
+        final_df["renda_texto_original"] = final_df["renda_texto_original"].astype(object).fillna(
+            final_df["FE2P10"].astype(object)
+        )
+
+    # Mantem colunas APAC originais e adiciona colunas categorizadas com fallback semantico.
+    # Textos já vistos vêm do dicionário persistente; só os novos são categorizados.
+    area_categorizadas = categorize_area_columns(final_df, APAC_AREAS_COLS)
+    for area_col, categorizada in area_categorizadas.items():
+        final_df[f"{area_col}_categorizadas"] = categorizada
+
+    drop_cols = [
+        c
+        for c in ["respondent_id_norm", "survey_id_norm", "respondent_id_meta", "survey_id_meta"]
+        if c in final_df.columns
+    ]
+    if drop_cols:
+        final_df = final_df.drop(columns=drop_cols)
+
+    metadata_priority = [
+        "respondent_id",
+        "survey_id",
+        "research_name",
+        "data_pesquisa",
+        "renda_texto_original",
+        "regiao",
+        "localidade",
+        "renda_macro_faixa",
+        "genero",
+        "faixa_etaria",
+    ]
+    ordered_priority = [c for c in metadata_priority if c in final_df.columns]
+    ordered_cols = ordered_priority.copy()
+    consumed_cols = set(ordered_priority)
+    area_cols_set = set(APAC_AREAS_COLS)
+
+    canonical_question_cols = build_canonical_question_order(question_cols_from_pivot)
+    for qcol in canonical_question_cols:
+        if qcol in final_df.columns and qcol not in consumed_cols:
+            ordered_cols.append(qcol)
+            consumed_cols.add(qcol)
+
+            if qcol in area_cols_set:
+                cat_col = f"{qcol}_categorizadas"
+                if cat_col in final_df.columns and cat_col not in consumed_cols:
+                    ordered_cols.append(cat_col)
+                    consumed_cols.add(cat_col)
+
+    for col in final_df.columns:
+        if col in consumed_cols:
+            continue
+
+        if col.endswith("_categorizadas"):
+            base_col = col[: -len("_categorizadas")]
+            if base_col in area_cols_set and base_col in final_df.columns:
+                continue
+
+        ordered_cols.append(col)
+        consumed_cols.add(col)
+
+    final_df = final_df[ordered_cols]
+
+    return final_df, base_long, None, None